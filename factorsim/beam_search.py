@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from evaluation.evaluate_utils import list_tests, run_evals
+from factorized_pomdp import CandidateCancelled
+from sandbox import get_sandbox
+
+
+def expand(game, query):
+    # a single attempt at `query` on a fork, returns its messages
+    return list(game.process_user_query(query))
+
+
+def fast_test_subset(test_file_path, num_tests):
+    # `num_tests` tests spread over the suite, in the order list_tests returns them
+    tests = list_tests(test_file_path)
+    if num_tests is None or num_tests >= len(tests):
+        return None
+    return [tests[idx * len(tests) // num_tests] for idx in range(num_tests)]
+
+
+def measure_frame_times(games, num_frames):
+    # a short profiled run of every game that passes the sanity check and has not been
+    # measured by the frame budget gate; the gate itself stays off
+    games = [game for game in games if game.last_pass_check and game.frame_time_ms is None]
+    if not games:
+        return
+    with ThreadPoolExecutor(max_workers=len(games)) as executor:
+        list(executor.map(lambda game: game.measure_frame_time(num_frames), games))
+
+
+def score_games(games, test_file_path, test_names=None, timeout=2, perf_frames=60):
+    """
+    The cheap score of every game, higher is better: whether it passes the sanity check,
+    the share of the unit tests it passes and its negated mean frame time over a run of
+    `perf_frames` frames. Only games that pass the sanity check are tested, each test with
+    a short timeout; a game without a frame time (failed or timed out) ranks last.
+    """
+    measure_frame_times(games, perf_frames)
+    jobs = []
+    for game in games:
+        implementation_path = f"{game.log_dir}/final.py"
+        with open(implementation_path, "w") as f:
+            f.write(game.export_code())
+        if game.last_pass_check:
+            jobs.append((test_file_path, implementation_path))
+    results = run_evals(jobs, timeout=timeout, test_names=test_names) if jobs else {}
+
+    scores = []
+    for game in games:
+        _, acc = results.get(f"{game.log_dir}/final.py", (None, 0.0))
+        mean_frame_ms = game.frame_time_ms[0] if game.frame_time_ms is not None else float("inf")
+        scores.append((game.last_pass_check, acc, -mean_frame_ms))
+    return scores
+
+
+def beam_search(
+    root,
+    step_prompts,
+    test_file_path,
+    beam_width=3,
+    num_expansions=2,
+    test_names=None,
+    test_timeout=2,
+    perf_frames=60,
+    log=print,
+):
+    """
+    Generates the game step by step, keeping the `beam_width` best partial games after
+    every step instead of a single greedy chain. Every game in the beam is expanded
+    `num_expansions` times in parallel, one attempt each, and the children are ranked by
+    score_games on `test_names` (a fast subset, see fast_test_subset). Once `beam_width` children of a round pass the sanity check the rest
+    are cancelled at their next LLM request; a step is expanded for up to
+    root.MAX_RETRIES rounds until some child passes. A child that raises is a failed
+    expansion; when no child of a step finishes at all the search stops there.
+
+    After every step the root adopts the best game and commits it to its journal, so a
+    resumed search continues from that game. Calls and tokens of all children, including
+    the pruned ones, are counted on the root. Returns the per-step log of the search.
+    """
+    if root.sandbox is None:
+        root.sandbox = get_sandbox()
+    beam = [root]
+    log_path = f"{root.log_dir}/beam_search.json"
+    search_log = []
+    if root.query_idx > 0 and os.path.exists(log_path):
+        # resumed, keep the log of the committed steps
+        with open(log_path, "r") as f:
+            search_log = [step for step in json.load(f) if step["step"] < root.query_idx]
+    for step_idx in range(root.query_idx, len(step_prompts)):
+        query = step_prompts[step_idx]
+        children = []
+        scores = []
+        for round_idx in range(root.MAX_RETRIES):
+            cancel_event = threading.Event()
+            round_children = []
+            for parent_idx, parent in enumerate(beam):
+                for expansion_idx in range(num_expansions):
+                    child = parent.fork(
+                        f"{root.log_dir}/beam/{step_idx}/{round_idx}_{parent_idx}_{expansion_idx}"
+                    )
+                    child.MAX_RETRIES = 1
+                    child.num_candidates = 1
+                    child.cancel_event = cancel_event
+                    round_children.append((child, parent.num_tokens, parent.num_api_calls))
+            log(f"step {step_idx} round {round_idx}: expanding {len(round_children)} games ... {query}")
+
+            finished = []
+            num_passed = 0
+            with ThreadPoolExecutor(max_workers=len(round_children)) as executor:
+                futures = {
+                    executor.submit(expand, child, query): child
+                    for child, _, _ in round_children
+                }
+                for future in as_completed(futures):
+                    child = futures[future]
+                    try:
+                        future.result()
+                    except CandidateCancelled:
+                        continue
+                    except Exception as e:
+                        # e.g. a cache miss or an engine error, a failed expansion
+                        log(f"step {step_idx}: {child.log_dir} failed: {e}")
+                        continue
+                    finished.append(child)
+                    num_passed += child.last_pass_check
+                    if num_passed >= beam_width:
+                        # prune the children still generating
+                        cancel_event.set()
+
+            for child, num_tokens, num_api_calls in round_children:
+                root.num_tokens += child.num_tokens - num_tokens
+                root.num_api_calls += child.num_api_calls - num_api_calls
+            children.extend(finished)
+            scores.extend(score_games(finished, test_file_path, test_names, test_timeout, perf_frames))
+            if num_passed > 0:
+                break
+
+        if not children:
+            # nothing to build the next steps on; the journal ends at the last finished
+            # step, so a resumed search retries this one
+            log(f"step {step_idx}: no game finished, stopping the search")
+            search_log.append(
+                {"step": step_idx, "query": query, "games": [], "num_api_calls": root.num_api_calls}
+            )
+            with open(log_path, "w") as f:
+                json.dump(search_log, f, indent=4)
+            break
+        ranking = sorted(range(len(children)), key=lambda idx: scores[idx], reverse=True)
+        beam = [children[idx] for idx in ranking[:beam_width]]
+        search_log.append(
+            {
+                "step": step_idx,
+                "query": query,
+                "games": [
+                    {"log_dir": children[idx].log_dir, "score": scores[idx]}
+                    for idx in ranking
+                ],
+                "num_api_calls": root.num_api_calls,
+            }
+        )
+        log(f"step {step_idx}: best score {scores[ranking[0]]}, {root.num_api_calls} LLM calls so far")
+
+        best = beam[0]
+        root.adopt(best)
+        root.query_idx = best.query_idx
+        root.commit_query()
+        with open(log_path, "w") as f:
+            json.dump(search_log, f, indent=4)
+    return search_log
@@ -12,10 +12,27 @@ import math
 
 APPEND_CODE = """
 class Game():
-    def __init__(self):
+    def __init__(self, render=True, offscreen=False):
+        # with render=False, run only advances the state; call render_frame to draw a frame.
+        # with offscreen=True the game draws onto a surface of its own and never opens or
+        # resizes the display
+        self.render = render
+        self.offscreen = offscreen
+        self.screen = None
+        self.reset()
+
+    def reset(self):
+        # start over with fresh states, keeping the screen surface if its size still matches
         self.state_manager = StateManager()
-        self.state_manager.screen = pygame.display.set_mode((self.state_manager.SCREEN_WIDTH,
-                                                             self.state_manager.SCREEN_HEIGHT))
+        screen_size = (self.state_manager.SCREEN_WIDTH, self.state_manager.SCREEN_HEIGHT)
+        screen = self.screen if self.offscreen else pygame.display.get_surface()
+        if screen is None or screen.get_size() != screen_size:
+            if self.offscreen:
+                screen = pygame.Surface(screen_size)
+            else:
+                screen = pygame.display.set_mode(screen_size)
+        self.screen = screen
+        self.state_manager.screen = screen
 
     def run(self, event):
         state_manager = self.state_manager
@@ -24,11 +41,18 @@ class Game():
 {input_logic_code}
         # call all the logics
 {logic_code}
+        if self.render:
+            self.render_frame()
+        return not state_manager.game_over
+
+    def render_frame(self):
+        state_manager = self.state_manager
         # Fill the screen with white
         state_manager.screen.fill((255, 255, 255))
 {render_code}
-        return not state_manager.game_over
+"""
 
+MAIN_CODE = """
 if __name__ == "__main__":
     game = Game()
     pygame.init()
@@ -40,3 +64,84 @@ if __name__ == "__main__":
         pygame.display.flip()
     pygame.quit()
 """
+
+# opt-in instrumentation, see GameRep.export_code(instrument=True)
+PROFILE_CODE = """
+import time
+
+# accumulated time, number of calls and slowest call per (kind, function name)
+PROFILE_FRAMES = {profile_frames}
+PROFILE_OUTPUT = {profile_output!r}
+profile_times = {{}}
+profile_calls = {{}}
+profile_max_times = {{}}
+
+
+def profile_call(kind, name, start):
+    elapsed = time.perf_counter() - start
+    key = (kind, name)
+    profile_times[key] = profile_times.get(key, 0.0) + elapsed
+    profile_calls[key] = profile_calls.get(key, 0) + 1
+    if elapsed > profile_max_times.get(key, 0.0):
+        profile_max_times[key] = elapsed
+
+
+def profile_table():
+    lines = [f"{{'kind':12s}} {{'function':40s}} {{'calls':>8s}} {{'total ms':>10s}} {{'mean us':>10s}} {{'max us':>10s}}"]
+    for key in sorted(profile_times, key=profile_times.get, reverse=True):
+        kind, name = key
+        total, calls = profile_times[key], profile_calls[key]
+        lines.append(
+            f"{{kind:12s}} {{name:40s}} {{calls:8d}} {{total * 1e3:10.3f}} "
+            f"{{total / calls * 1e6:10.1f}} {{profile_max_times[key] * 1e6:10.1f}}"
+        )
+    return "\\n".join(lines)
+
+
+def profile_folded():
+    # collapsed stacks in microseconds, the input format of flamegraph.pl and speedscope
+    frame_time = profile_times.get(("frame", "Game.run"), 0.0)
+    lines = []
+    for (kind, name), total in profile_times.items():
+        if kind != "frame":
+            lines.append(f"Game.run;{{kind}};{{name}} {{round(total * 1e6)}}")
+            frame_time -= total
+    lines.append(f"Game.run {{max(round(frame_time * 1e6), 0)}}")
+    return "\\n".join(lines)
+
+
+def report_profile():
+    print(profile_table())
+    if PROFILE_OUTPUT is not None:
+        with open(PROFILE_OUTPUT, "w") as f:
+            f.write(profile_folded() + "\\n")
+
+
+"""
+
+PROFILE_GAME_CODE = """
+# time whole frames as well and report once PROFILE_FRAMES frames have run
+game_run = Game.run
+
+
+def profiled_run(self, event):
+    start = time.perf_counter()
+    running = game_run(self, event)
+    profile_call("frame", "Game.run", start)
+    if profile_calls[("frame", "Game.run")] == PROFILE_FRAMES:
+        report_profile()
+    return running
+
+
+Game.run = profiled_run
+
+"""
+
+# appended to an instrumented export by the performance gate, see GameRep.check_frame_time
+PROFILE_DUMP_CODE = """
+import json
+print("PROFILE " + json.dumps([
+    [kind, name, profile_times[(kind, name)], profile_calls[(kind, name)], profile_max_times[(kind, name)]]
+    for kind, name in profile_times
+]))
+"""
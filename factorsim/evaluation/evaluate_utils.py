@@ -1,9 +1,14 @@
+import ast
 import json
 import re
 import os
 import subprocess
-import signal
+import sys
+import tempfile
 import importlib.util
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from glob import glob
+from sandbox import get_sandbox
 
 
 def dynamical_import(game_path, context=False):
@@ -59,33 +64,138 @@ def execute_file(test_file_path, implementation_path):
     return passed_tests, failed_tests, error_tests
 
 
-def run_eval(test_file_path, implementation_path, game_name, timeout=20):
-    def timeout_handler(signum, frame):
-        raise TimeoutError
+def list_tests(test_file_path):
+    # "TestClass.test_method" names of a unit test file, found without importing it
+    with open(test_file_path, "r") as f:
+        tree = ast.parse(f.read())
+    tests = []
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            for item in node.body:
+                if isinstance(item, ast.FunctionDef) and item.name.startswith("test"):
+                    tests.append(f"{node.name}.{item.name}")
+    return sorted(tests)
+
+
+RUN_TEST_CODE = """
+import os
+import runpy
+import sys
+
+os.environ["FACTORSIM_TEST_RESULTS"] = {result_path!r}
+# unittest matches the pattern against the full test id, e.g. __main__.TestCatcher.test_x
+sys.argv = [{test_file_path!r}, "-k", {pattern!r}, {implementation_path!r}]
+runpy.run_path({test_file_path!r}, run_name="__main__")
+"""
+
+
+def run_test(test_file_path, implementation_path, test_name, result_path, timeout=20, sandbox=None):
+    """
+    Runs a single test of `test_file_path` against one implementation in a sandbox worker.
+    JsonTestRunner writes the structured result to `result_path`.
+    """
+    sandbox = get_sandbox() if sandbox is None else sandbox
+    function_name = test_name.split(".")[-1]
+    code = RUN_TEST_CODE.format(
+        result_path=os.path.abspath(result_path),
+        test_file_path=os.path.abspath(test_file_path),
+        pattern=f"*.{test_name}",
+        implementation_path=os.path.abspath(implementation_path),
+    )
+    stdout, stderr = sandbox.run(code, timeout=timeout)
+    if stdout is None:
+        return {
+            "function_name": function_name,
+            "test_number": None,
+            "message": f"timed out after {timeout} seconds",
+            "status": "TIMEOUT",
+        }
 
-    json_result = None
     try:
-        # Set the signal alarm
-        signal.signal(signal.SIGALRM, timeout_handler)
-        signal.alarm(timeout)
-        passed_tests, failed_tests, error_tests = execute_file(
-            test_file_path, implementation_path
-        )
-        with open(f"{game_name}_test_results.json", "r") as f:
-            json_result = json.load(f)
-        total_tests = len(passed_tests) + len(failed_tests) + len(error_tests)
-        # print(f"GPT4 (context) Passed Tests for {game_name}: {passed_tests}")
-        # print(f"GPT4 (context) Failed Tests for {game_name}: {failed_tests}")
-        # print(f"GPT4 (context) Error Tests for {game_name}: {error_tests}\n")
-        if total_tests == 0:
-            # couldn't eveen import the file
-            acc = 0
-        else:
-            acc = len(passed_tests) / total_tests
-        signal.alarm(0)
-
-    except TimeoutError:
-        print("function timed out")
-        acc = 0
-
-    return json_result, acc
\ No newline at end of file
+        with open(result_path, "r") as f:
+            test_results = json.load(f)
+        if len(test_results) == 1:
+            return test_results[0]
+    except (OSError, json.JSONDecodeError):
+        pass
+    # the implementation could not even be imported
+    return {
+        "function_name": function_name,
+        "test_number": None,
+        "message": stderr[-2000:],
+        "status": "ERROR",
+    }
+
+
+def run_evals(jobs, timeout=20, sandbox=None, test_names=None):
+    """
+    Scores many implementations at once. `jobs` is a list of (test_file_path,
+    implementation_path) pairs; every (implementation, test) pair is a separate job on the
+    sandbox pool, so a slow or hanging test only costs its own timeout. `test_names`
+    restricts the run to those "TestClass.test_method" names.
+
+    Returns {implementation_path: (json_result, acc)} like run_eval.
+    """
+    sandbox = get_sandbox() if sandbox is None else sandbox
+
+    tasks = []
+    for test_file_path, implementation_path in jobs:
+        for test_name in list_tests(test_file_path):
+            if test_names is not None and test_name not in test_names:
+                continue
+            tasks.append((test_file_path, implementation_path, test_name))
+
+    results = {implementation_path: {} for _, implementation_path in jobs}
+    with tempfile.TemporaryDirectory() as result_dir:
+        with ThreadPoolExecutor(max_workers=sandbox.num_workers) as executor:
+            futures = {
+                executor.submit(
+                    run_test,
+                    test_file_path,
+                    implementation_path,
+                    test_name,
+                    os.path.join(result_dir, f"{idx}.json"),
+                    timeout,
+                    sandbox,
+                ): (implementation_path, test_name)
+                for idx, (test_file_path, implementation_path, test_name) in enumerate(tasks)
+            }
+            for future in as_completed(futures):
+                implementation_path, test_name = futures[future]
+                results[implementation_path][test_name] = future.result()
+
+    scores = {}
+    for implementation_path, test_results in results.items():
+        # in the order unittest would have run them
+        json_result = [test_results[name] for name in sorted(test_results)]
+        num_passed = sum(result["status"] == "OK" for result in json_result)
+        acc = num_passed / len(json_result) if len(json_result) > 0 else 0
+        scores[implementation_path] = (json_result, acc)
+    return scores
+
+
+def run_eval(test_file_path, implementation_path, game_name, timeout=20):
+    # game_name is kept for compatibility, results no longer go through a shared file
+    return run_evals([(test_file_path, implementation_path)], timeout=timeout)[
+        implementation_path
+    ]
+
+
+if __name__ == "__main__":
+    # python -m evaluation.evaluate_utils factorsim_results/<model>  (from factorsim/)
+    # scores every factorsim_results/<model>/<game>_eval/pomdp_*/final.py in one pool
+    results_dir = sys.argv[1]
+    jobs = []
+    for implementation_path in sorted(
+        glob(os.path.join(results_dir, "*_eval", "pomdp_*", "final.py"))
+    ):
+        eval_dir = os.path.basename(os.path.dirname(os.path.dirname(implementation_path)))
+        game_name = eval_dir[: -len("_eval")]
+        test_file_path = f"./games/single_player_games/{game_name}/mdp_unit_test.py"
+        jobs.append((test_file_path, implementation_path))
+
+    scores = run_evals(jobs)
+    for implementation_path, (json_result, acc) in scores.items():
+        with open(os.path.join(os.path.dirname(implementation_path), "test_results.json"), "w") as f:
+            json.dump(json_result, f, indent=4)
+        print(f"{implementation_path}: {acc:.2f}")
@@ -1,21 +1,54 @@
+import copy
+import hashlib
 import re
 import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+# the builtin TimeoutError is only an alias of this one since Python 3.11
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from utils import (
-    extract_variables_with_regex,
-    code_compilable,
-    run_code,
-    extract_function_name_and_args,
+    analyze_code,
+    fragment_compilable,
     extract_variables,
-    check_function_for_state_change,
     num_tokens_from_string,
 )
-from code_templates import PREPEND_CODE, APPEND_CODE
+from code_templates import (
+    PREPEND_CODE,
+    APPEND_CODE,
+    MAIN_CODE,
+    PROFILE_CODE,
+    PROFILE_GAME_CODE,
+    PROFILE_DUMP_CODE,
+)
+from llm_engine import get_engine
+from llm_cache import get_cache, CacheMissError
+from sandbox import get_sandbox
 from prompts import *
-from openai import OpenAI
 import replicate
 
 
+class CandidateCancelled(Exception):
+    pass
+
+
+# held while a request is counted and while a round's candidates are cancelled, so the
+# losers' usage is final once cancel_event is set
+_cancel_lock = threading.Lock()
+
+
+def run_candidate(candidate, query):
+    # drain the attempt generator, keeping its messages for when the candidate wins
+    messages = []
+    attempt = candidate.attempt_query(query)
+    try:
+        while True:
+            messages.append(next(attempt))
+    except StopIteration as stop:
+        pass_check, all_code = stop.value
+    return pass_check, all_code, messages
+
+
 # the class for state transitional functions and rendering functions
 class Function:
     def __init__(
@@ -29,7 +62,11 @@ class Function:
         self.name = name
         self.description = description
         self._implementation = implementation
-        self.relevant_state_names = relevant_state_names
+        # None: the states the implementation reads or writes
+        self._relevant_state_names = relevant_state_names
+        self._export_key = None
+        self._call_key = None
+        self._tokens_key = None
 
         self.implementation = self._implementation
 
@@ -58,13 +95,71 @@ class Function:
             f" .   pass\n"
         )
 
+    def export(self):
+        # the rendered definition and call site are cached on the content, so that
+        # export_code only re-renders functions that changed; the value is stored before
+        # the key since forks share function objects across threads
+        if self._export_key is not self._implementation:
+            self._export = self._implementation + "\n\n"
+            self._export_key = self._implementation
+        return self._export
+
+    def call_code(self, input_logic=False):
+        key = (self.name, self.description, input_logic)
+        if self._call_key != key:
+            args = "state_manager, event" if input_logic else "state_manager"
+            self._call_code = (
+                f"        # {self.description}\n"
+                f"        {self.name}({args})\n"
+                "\n"
+            )
+            self._call_key = key
+        return self._call_code
+
+    def profiled_call_code(self, kind, input_logic=False):
+        # the call site of the instrumented export, timed with the PROFILE_CODE counters
+        args = "state_manager, event" if input_logic else "state_manager"
+        return (
+            f"        # {self.description}\n"
+            f"        call_start = time.perf_counter()\n"
+            f"        {self.name}({args})\n"
+            f"        profile_call({kind!r}, {self.name!r}, call_start)\n"
+            "\n"
+        )
+
+    @property
+    def analysis(self):
+        # name, args, state reads and writes of the implementation, see analyze_code
+        return analyze_code(self._implementation)
+
+    @property
+    def relevant_state_names(self):
+        if self._relevant_state_names is None:
+            return self.analysis.state_names
+        return self._relevant_state_names
+
+    @relevant_state_names.setter
+    def relevant_state_names(self, state_names):
+        self._relevant_state_names = state_names
+
+    def state_access(self):
+        # (read, written) state names
+        return self.analysis.reads, self.analysis.writes
+
+    def num_tokens(self):
+        # prompt size of the implementation, counted once per implementation
+        if self._tokens_key is not self._implementation:
+            self._num_tokens = num_tokens_from_string(self._implementation)
+            self._tokens_key = self._implementation
+        return self._num_tokens
+
     def is_relevant(self, states):
         # chec if any states in self._relevant_state_names is in state_names
         state_names = [state.name for state in states]
         return any(state_name in state_names for state_name in self.relevant_state_names)
         
     def sanity_check(self):
-        function_name, args = extract_function_name_and_args(self.implementation)
+        function_name, args = self.analysis.name, self.analysis.args
         if function_name != self.name:
             return False
         if len(args) == 1:
@@ -85,6 +180,7 @@ class StateVariable:
         self.variable_type = variable_type
         self.description = description
         self.dont_clean = dont_clean
+        self._manager_code_key = None
         self.value = self._value
 
     @property
@@ -107,6 +203,16 @@ class StateVariable:
 
         return new_value
 
+    def manager_code(self):
+        # the indented lines for StateManager.__init__, cached on the content
+        key = (self.name, self._value, self.variable_type, self.description)
+        if self._manager_code_key != key:
+            self._manager_code = "".join(
+                f"        {line}\n" for line in str(self).split("\n")
+            )
+            self._manager_code_key = key
+        return self._manager_code
+
     def __str__(self):
         if self.variable_type not in ["int", "float", "str", "bool", "tuple", "list"]:
             return f"# {self.description}\n" f"self.{self.name} = {self.value}\n"
@@ -116,6 +222,23 @@ class StateVariable:
         )
 
 
+class GameVersion:
+    """
+    The game representation at one point in time: states, input logics, logics and
+    renders as tuples. StateVariable and Function objects are never changed once they are
+    part of a version, a change replaces the object (see GameRep.add_new_function), so
+    versions share everything they have in common and taking or restoring one is O(1).
+    """
+
+    __slots__ = ("states", "input_logics", "logics", "renders")
+
+    def __init__(self, states=(), input_logics=(), logics=(), renders=()):
+        self.states = states
+        self.input_logics = input_logics
+        self.logics = logics
+        self.renders = renders
+
+
 class GameRep:
     def __init__(
         self,
@@ -126,50 +249,94 @@ class GameRep:
         log_dir=None,
         debug_mode=False,
         model="gpt-4-1106-preview",
+        engine=None,
+        cache=None,
+        sandbox=None,
+        num_candidates=1,
+        candidate_selection="first",
+        frame_budget_ms=None,
+        max_frame_budget_ms=None,
+        perf_check_frames=300,
+        context_hops=1,
+        context_token_budget=None,
     ):
         self.num_tokens = 0
         self.MAX_RETRIES = MAX_RETRIES
         self.queries = []
-        # a list of states
-        self.states = []
-        # a list of input logics (functions)
-        self.input_logics = []
-        # a list of state transitional logics (functions)
-        self.logics = []
-        # a list of rendering functions that are called in the main loop
-        self.renders = []
+        # the representation is held in tuples that are replaced, never changed in place,
+        # see GameVersion
+        # a tuple of states
+        self.states = ()
+        # a tuple of input logics (functions)
+        self.input_logics = ()
+        # a tuple of state transitional logics (functions)
+        self.logics = ()
+        # a tuple of rendering functions that are called in the main loop
+        self.renders = ()
 
         self.model = model
-        if "gpt" in model:
-            self.client = OpenAI()
+        # requests from all GameReps in the process share one pool and rate limit;
+        # the engine is created lazily so that replaying from the cache needs no API key
+        self.engine = engine
+        self.cache = cache if cache is not None else get_cache()
+        self.query_counts = {}
+        self.num_cache_hits = 0
+        # warm worker pool shared by all GameReps for running the sanity check
+        self.sandbox = sandbox
+        # number of attempts per query generated concurrently, see process_query_candidates
+        self.num_candidates = num_candidates
+        assert candidate_selection in ["first", "best"]
+        self.candidate_selection = candidate_selection
+        self.cancel_event = None
+        self.contextual_state_names = []
+        # performance gate, see check_frame_time; None disables a budget
+        self.frame_budget_ms = frame_budget_ms
+        self.max_frame_budget_ms = max_frame_budget_ms
+        self.perf_check_frames = perf_check_frames
+        # why the last attempt at the current query was rejected; it is added to the prompts
+        # of the next attempt only, as attempt_feedback
+        self.retry_feedback = None
+        self.attempt_feedback = None
+        # whether the last query ended with code that passes the sanity check, and the
+        # (mean, max) frame time in ms of its last performance check
+        self.last_pass_check = False
+        self.frame_time_ms = None
+        # prompt context: functions up to context_hops away from the touched states in the
+        # state/function graph, as many as fit into context_token_budget tokens per prompt
+        self.context_hops = context_hops
+        self.context_token_budget = context_token_budget
+        self._dependency_key = None
+        self._dependency_index = None
+        # every finished query is appended to the journal, see commit_query and resume
+        self.journal_path = None if log_dir is None else f"{log_dir}/journal.jsonl"
+        # fragments and code of the last export, see export_code
+        self._exported_parts = None
+        self._exported_fragments = None
+        self._exported_code = None
 
         # default variables
-        self.states.append(
+        self.states = (
             StateVariable(
                 name="SCREEN_HEIGHT",
                 value=f"np.random.randint(300, {HEIGHT})",
                 variable_type="int",
                 description="height of the gameplay screen",
                 dont_clean=True,
-            )
-        )
-        self.states.append(
+            ),
             StateVariable(
                 name="SCREEN_WIDTH",
                 value=f"np.random.randint(300, {WIDTH})",
                 variable_type="int",
                 description="width of the gameplay screen",
                 dont_clean=True,
-            )
-        )
-        self.states.append(
+            ),
             StateVariable(
                 name="FPS",
                 value=FPS,
                 variable_type="int",
                 description="fps of the gameplay screen",
                 dont_clean=True,
-            )
+            ),
         )
 
         self.debug_mode = debug_mode
@@ -181,11 +348,10 @@ class GameRep:
 
     def pass_sanity_check(self):
         for function in self.renders:
-            if check_function_for_state_change(function.implementation):
+            if not function.analysis.pure:
                 return False, "render function does not pass sanity check"
 
-        all_code = self.export_code()
-        if not code_compilable(all_code):
+        if not self.code_compilable():
             return False, None
 
         no_condition_code = self.export_code()
@@ -193,11 +359,102 @@ class GameRep:
             "while running:", "for _ in range(300):"
         )
         # TODO: simulate user actions
-        stdout, stderr = run_code(no_condition_code)
+        if self.sandbox is None:
+            self.sandbox = get_sandbox()
+        stdout, stderr = self.sandbox.run(no_condition_code)
         if stderr != "":
             return False, stderr
+
+        self.check_cancelled()
+
+        too_slow = self.check_frame_time()
+        if too_slow is not None:
+            self.retry_feedback = too_slow
+            return False, too_slow
         return True, stdout
 
+    def measure_frame_time(self, num_frames=None):
+        """
+        Runs the instrumented game headless for `num_frames` frames (perf_check_frames by
+        default) and sets frame_time_ms to its (mean, max) frame time in ms. Returns whether
+        the frames finished within the time limit and the per-function profile, which is
+        None when the game failed.
+        """
+        num_frames = self.perf_check_frames if num_frames is None else num_frames
+        self.frame_time_ms = None
+        if self.sandbox is None:
+            self.sandbox = get_sandbox()
+        code = self.export_code(instrument=True, profile_frames=0)
+        code = code.replace("while running:", f"for _ in range({num_frames}):")
+        stdout, stderr = self.sandbox.run(code + PROFILE_DUMP_CODE)
+        if stdout is None:
+            return False, None
+        profile_lines = [line for line in stdout.splitlines() if line.startswith("PROFILE ")]
+        if stderr != "" or len(profile_lines) == 0:
+            return True, None
+
+        profile = json.loads(profile_lines[-1][len("PROFILE "):])
+        frame_total, frame_calls, frame_max = next(
+            (total, calls, max_time)
+            for kind, name, total, calls, max_time in profile
+            if kind == "frame"
+        )
+        self.frame_time_ms = (frame_total / frame_calls * 1e3, frame_max * 1e3)
+        return True, profile
+
+    def check_frame_time(self):
+        """
+        Measures the frame time (see measure_frame_time) and returns a "too slow" message
+        naming the most expensive function when the mean or max frame time is over budget,
+        None otherwise.
+        """
+        self.frame_time_ms = None
+        if self.frame_budget_ms is None and self.max_frame_budget_ms is None:
+            return None
+        finished, profile = self.measure_frame_time()
+        if not finished:
+            return (
+                f"The game is too slow: {self.perf_check_frames} frames did not finish "
+                "within the time limit."
+            )
+        if profile is None:
+            # errors are the business of the sanity check
+            return None
+
+        mean_frame_ms, max_frame_ms = self.frame_time_ms
+        if (self.frame_budget_ms is None or mean_frame_ms <= self.frame_budget_ms) and (
+            self.max_frame_budget_ms is None or max_frame_ms <= self.max_frame_budget_ms
+        ):
+            return None
+
+        frame_total = next(total for kind, _, total, _, _ in profile if kind == "frame")
+        functions = [entry for entry in profile if entry[0] != "frame"]
+        if len(functions) == 0:
+            return None
+        kind, name, total, calls, max_time = max(functions, key=lambda entry: entry[2])
+        # only the limits that are set
+        budget = []
+        if self.frame_budget_ms is not None:
+            budget.append(f"{self.frame_budget_ms:g} ms on average")
+        if self.max_frame_budget_ms is not None:
+            budget.append(f"{self.max_frame_budget_ms:g} ms at most")
+        return too_slow_feedback_prompt.format(
+            mean_frame_ms=mean_frame_ms,
+            max_frame_ms=max_frame_ms,
+            budget=" and ".join(budget),
+            function_kind=kind.replace("_", " "),
+            function_name=name,
+            share=total / frame_total,
+            function_mean_ms=total / calls * 1e3,
+            function_max_ms=max_time * 1e3,
+        )
+
+    def add_feedback(self, query):
+        # tell the LLM why the previous attempt at this query was rejected
+        if self.attempt_feedback is None:
+            return query
+        return query + self.attempt_feedback
+
     def log_query(self, filename, query, json_content):
         basename = os.path.basename(filename)
         parent_dir = os.path.dirname(filename)
@@ -211,25 +468,42 @@ class GameRep:
 
     def ask_llm(self, query):
         print(f'ask_llm ... ')
-        self.num_tokens += num_tokens_from_string(query)
-        self.num_api_calls += 1
+        with _cancel_lock:
+            self.check_cancelled()
+            self.num_tokens += num_tokens_from_string(query)
+            self.num_api_calls += 1
+        # the n-th identical request of this game maps to the n-th cached sample, so
+        # retries still get fresh responses and a rerun replays them in order
+        # counted per prompt hash, which keeps the counters small enough for the journal
+        query_hash = hashlib.sha256(query.encode()).hexdigest()
+        self.query_counts[query_hash] = self.query_counts.get(query_hash, 0) + 1
+        sample = f"{self.log_dir}:{self.query_counts[query_hash]}"
         if "gpt" in self.model:
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a helpful assistant to a Pygame designer. Your response should be in JSON format.",
-                    },
-                    {
-                        "role": "user",
-                        "content": query,
-                    },
-                ],
-                response_format={"type": "json_object"},
-            )
-            assert len(completion.choices) == 1
-            responses = json.loads(completion.choices[0].message.content)
+            system = "You are a helpful assistant to a Pygame designer. Your response should be in JSON format."
+            params = {"response_format": {"type": "json_object"}}
+            content = self.cache.get(self.model, system, query, params, sample)
+            if content is None:
+                if self.engine is None:
+                    self.engine = get_engine()
+                future = self.engine.submit(
+                    self.model,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": system,
+                        },
+                        {
+                            "role": "user",
+                            "content": query,
+                        },
+                    ],
+                    **params,
+                )
+                content = self.wait_for(future)
+                self.cache.put(self.model, system, query, content, params, sample)
+            else:
+                self.num_cache_hits += 1
+            responses = json.loads(content)
             return responses
         elif "llama" in self.model:
             _input = {
@@ -239,8 +513,14 @@ class GameRep:
                "top_p": 0.9,
                "temperature": 0.7,
             }
-            output = replicate.run("meta/meta-llama-3-70b-instruct", input=_input)
-            output = "".join(output)
+            params = {k: v for k, v in _input.items() if k not in ["prompt", "prompt_template"]}
+            output = self.cache.get(self.model, _input["prompt_template"], query, params, sample)
+            if output is None:
+                output = replicate.run("meta/meta-llama-3-70b-instruct", input=_input)
+                output = "".join(output)
+                self.cache.put(self.model, _input["prompt_template"], query, output, params, sample)
+            else:
+                self.num_cache_hits += 1
             matched_strings = re.findall(r"```json(.*?)```", output, re.DOTALL)
             if matched_strings:
                output = matched_strings[-1]
@@ -251,17 +531,31 @@ class GameRep:
 
 
 
+    def check_cancelled(self):
+        # a candidate that lost gives up at the next LLM request or sanity check
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise CandidateCancelled()
+
+    def wait_for(self, future):
+        # a candidate polls so that it can give up (and cancel the request) once it lost
+        while self.cancel_event is not None:
+            try:
+                return future.result(timeout=0.1)
+            except FutureTimeoutError:
+                if self.cancel_event.is_set():
+                    future.cancel()
+                    raise CandidateCancelled()
+        return future.result()
+
     def get_state_manager_code(self, relevant_states=None):
         code = "class StateManager:\n"
         code += "    def __init__(self):\n"
         if relevant_states:
             for state in relevant_states:
-                for line in str(state).split("\n"):
-                    code += f"        {line}\n"
+                code += state.manager_code()
         else:
             for state in self.states:
-                for line in str(state).split("\n"):
-                    code += f"        {line}\n"
+                code += state.manager_code()
         return code
 
     def get_function_def(
@@ -281,31 +575,141 @@ class GameRep:
             code += "\n"
         return code
 
-    def decompose_query(self, query, contextual_states):
-        def not_disjoint(list1, list2):
-            return len(set(list1).intersection(list2)) > 0
-
-        # if logic.states is overlappign with relevant states
-        self.contextual_state_names = [state.name for state in contextual_states]
-        contextual_input_logics = [
-            input_logic
-            for input_logic in self.input_logics
-            if not_disjoint(
-                self.contextual_state_names, input_logic.relevant_state_names
-            )
-        ]
-        contextual_logics = [
-            logic
-            for logic in self.logics
-            if not_disjoint(self.contextual_state_names, logic.relevant_state_names)
+    def dependency_index(self):
+        """
+        Maps every state name to the functions that read or write it (see
+        StateManagerVariableExtractor). Rebuilt only when a function was added, removed
+        or changed.
+        """
+        functions = self.input_logics + self.logics + self.renders
+        key = [(id(function), function.implementation) for function in functions]
+        if key != self._dependency_key:
+            index = {}
+            for function in functions:
+                accessed, modified = function.state_access()
+                for state_name in accessed | modified:
+                    index.setdefault(state_name, []).append(function)
+            self._dependency_key = key
+            self._dependency_index = index
+        return self._dependency_index
+
+    def context_functions(self, functions, state_names):
+        """
+        The `functions` that read or write `state_names`, then those sharing states with
+        them, up to `context_hops` hops, nearest first. The default states (dont_clean) are
+        not followed since almost every function uses them.
+
+        Without a context_token_budget this is the baseline selection instead: the
+        `functions` whose relevant_state_names overlap `state_names`, in their order.
+        """
+        if self.context_token_budget is None:
+            return [
+                function
+                for function in functions
+                if not set(state_names).isdisjoint(function.relevant_state_names)
+            ]
+        index = self.dependency_index()
+        hubs = {state.name for state in self.states if state.dont_clean}
+        frontier = set(state_names) - hubs
+        if not frontier:
+            # a query about the default states only
+            frontier = set(state_names)
+        seen_states = set(frontier)
+        distance = {}
+        for hop in range(self.context_hops):
+            next_frontier = set()
+            for state_name in frontier:
+                for function in index.get(state_name, []):
+                    if id(function) in distance:
+                        continue
+                    distance[id(function)] = hop
+                    accessed, modified = function.state_access()
+                    next_frontier |= (accessed | modified) - hubs - seen_states
+            seen_states |= next_frontier
+            frontier = next_frontier
+        selected = [function for function in functions if id(function) in distance]
+        return sorted(selected, key=lambda function: distance[id(function)])
+
+    def fit_to_budget(self, functions, prompt):
+        """The leading `functions` whose code still fits into the budget next to `prompt`."""
+        if self.context_token_budget is None:
+            return functions
+        remaining = self.context_token_budget - num_tokens_from_string(prompt)
+        selected = []
+        for function in functions:
+            remaining -= function.num_tokens()
+            if remaining < 0:
+                break
+            selected.append(function)
+        return selected
+
+    def state_change_states(self, query):
+        """
+        The states shown to the state_change prompt: all of them when they fit into the
+        budget, otherwise the default states, the ones named in the query, their
+        neighbours and the context of the previous query, in that order of preference.
+        """
+        if self.context_token_budget is None or self.context_token_budget >= num_tokens_from_string(
+            state_change_prompt.format(state_manager_code=self.get_state_manager_code(), query=query)
+        ):
+            return self.states
+
+        query_words = set(re.findall(r"\w+", query.lower()))
+        named = [
+            state.name
+            for state in self.states
+            if set(state.name.lower().split("_")) & query_words
         ]
-        contextual_renders = [
-            render
-            for render in self.renders
-            if not_disjoint(self.contextual_state_names, render.relevant_state_names)
+        neighbours = [
+            state_name
+            for function in self.context_functions(self.input_logics + self.logics + self.renders, named)
+            for state_name in function.analysis.state_names
         ]
+        preferred = (
+            [state.name for state in self.states if state.dont_clean]
+            + named
+            + neighbours
+            + self.contextual_state_names
+            + [state.name for state in self.states]
+        )
+        remaining = self.context_token_budget - num_tokens_from_string(
+            state_change_prompt.format(
+                state_manager_code="class StateManager:\n    def __init__(self):\n", query=query
+            )
+        )
+        states_by_name = {state.name: state for state in self.states}
+        selected = set()
+        for state_name in preferred:
+            if state_name in selected or state_name not in states_by_name:
+                continue
+            remaining -= num_tokens_from_string(states_by_name[state_name].manager_code())
+            if remaining < 0:
+                break
+            selected.add(state_name)
+        return [state for state in self.states if state.name in selected]
+
+    def decompose_query(self, query, contextual_states):
+        # functions near the relevant states, grouped back by kind after the budget cut
+        self.contextual_state_names = [state.name for state in contextual_states]
+        state_manager_code = self.get_state_manager_code(contextual_states)
+        selected = self.fit_to_budget(
+            self.context_functions(
+                self.input_logics + self.logics + self.renders, self.contextual_state_names
+            ),
+            decompose_query_prompt.format(
+                state_manager_code=state_manager_code,
+                relevant_input_def="",
+                relevant_logic_def="",
+                relevant_render_def="",
+                query=query,
+            ),
+        )
+        selected_ids = {id(function) for function in selected}
+        contextual_input_logics = [f for f in self.input_logics if id(f) in selected_ids]
+        contextual_logics = [f for f in self.logics if id(f) in selected_ids]
+        contextual_renders = [f for f in self.renders if id(f) in selected_ids]
         query = decompose_query_prompt.format(
-            state_manager_code=self.get_state_manager_code(contextual_states),
+            state_manager_code=state_manager_code,
             relevant_input_def=self.get_function_def(
                 contextual_input_logics, include_implementation=True
             ),
@@ -329,128 +733,363 @@ class GameRep:
         return decomposition
 
     def add_new_function(self, existing_functions, new_functions):
+        # returns a new tuple, a function of the same name is replaced in its place
+        # instead of updated, since other versions may still hold it
+        functions = list(existing_functions)
         for new_function in new_functions:
-            existing_function = next(
+            index = next(
                 (
-                    function
-                    for function in existing_functions
+                    idx
+                    for idx, function in enumerate(functions)
                     if function.name == new_function.name
                 ),
                 None,
             )
-            if existing_function:
-                existing_function.description = new_function.description
-                existing_function.implementation = new_function.implementation
-                existing_function.relevant_state_names = (
-                    new_function.relevant_state_names
-                )
+            if index is not None:
+                functions[index] = new_function
             else:
-                existing_functions.append(new_function)
+                functions.append(new_function)
+        return tuple(functions)
+
+    def version(self):
+        """The current game representation, see checkout."""
+        return GameVersion(self.states, self.input_logics, self.logics, self.renders)
+
+    def checkout(self, version):
+        """Sets the game representation back to `version` exactly."""
+        self.states = version.states
+        self.input_logics = version.input_logics
+        self.logics = version.logics
+        self.renders = version.renders
 
     def process_user_query(self, query):
         self.queries.append({"query": query})
+        self.retry_feedback = None
+        self.attempt_feedback = None
+        self.last_pass_check = False
+        self.frame_time_ms = None
         yield "################################################################"
         yield f"processing new query... {query}"
-        original_states = self.states.copy()
-        original_input_logics = self.input_logics.copy()
-        original_logics = self.logics.copy()
-        original_renders = self.renders.copy()
-
-        #pass_check = False
-        #while not pass_check:
-        for _ in range(self.MAX_RETRIES):
-            self.states = original_states
-            self.input_logics = original_input_logics
-            self.logics = original_logics
-            self.renders = original_renders
-
-            # decompose query into actions
-            # get the values of the dict contextual_states
-            all_code = ""
-            try:
-                yield "context selection prompt ..."
-                contextual_states = self.state_change(query)
-                actions = self.decompose_query(query, contextual_states)
-                assert all(key in actions.keys() for key in ["input_logic", "state_transition", "ui_rendering"])
-
-                function_description = actions["input_logic"]["description"]
-                function_name = actions["input_logic"]["function_name"]
-                if not (function_name == "" or function_description == ""):
-                    yield "#####################################################"
-                    yield f"implementing {function_name} ..."
-                    yield f"{function_description}"
-                    self.input_logics = [
-                        function
-                        for function in self.input_logics
-                        if function.name != function_name
-                    ]
-                    input_logics = self.input_logic_add(
-                        function_name, function_description, contextual_states
-                    )
-                    self.queries[-1]["input_logic"] = [logic.name for logic in input_logics]
-                    self.add_new_function(self.input_logics, input_logics)
-
-                function_description = actions["state_transition"]["description"]
-                function_name = actions["state_transition"]["function_name"]
-                if not (function_name == "" or function_description == ""):
-                    yield "#####################################################"
-                    yield f"implementing {function_name} ..."
-                    yield f"{function_description}"
-                    self.logics = [
-                        function
-                        for function in self.logics
-                        if function.name != function_name
-                    ]
-                    logics = self.logic_add(
-                        function_name, function_description, contextual_states
-                    )
-                    self.queries[-1]["logic"] = [logic.name for logic in logics]
-                    self.add_new_function(self.logics, logics)
-
-                function_description = actions["ui_rendering"]["description"]
-                function_name = actions["ui_rendering"]["function_name"]
-                if not (function_name == "" or function_description == ""):
-                    yield "#####################################################"
-                    yield f"implementing {function_name} ..."
-                    yield f"{function_description}"
-                    self.renders = [
-                        function
-                        for function in self.renders
-                        if function.name != function_name
-                    ]
-                    renders = self.ui_add(
-                        function_name, function_description, contextual_states
-                    )
-                    self.queries[-1]["rendering"] = [logic.name for logic in renders]
-                    self.add_new_function(self.renders, renders)
-            except Exception as e:
-                print('================= exception ')
-                print(e)
-                continue
-
-            self.clean_states()
-            if self.debug_mode:
-                print("number of state variables", len(self.states))
+        if self.num_candidates > 1:
+            all_code = yield from self.process_query_candidates(query)
+        else:
+            original = self.version()
 
-            all_code = self.export_code()
-            save_path = f"{self.log_dir}/{self.query_idx}/{self.num_api_calls}_final.py"
-            os.makedirs(f"{self.log_dir}/{self.query_idx}", exist_ok=True)
-            with open(save_path, "w") as f:
-                f.write(all_code)
+            #pass_check = False
+            #while not pass_check:
+            for _ in range(self.MAX_RETRIES):
+                # every attempt starts from the same version, nothing of a failed one is left
+                self.checkout(original)
+                self.queries[-1] = {"query": query}
 
-            pass_check, error_trace = self.pass_sanity_check()
-            if pass_check:
-                yield "pass sanity check."
-                break
-            else:
-                yield "fail sanity check."
-                yield error_trace
+                pass_check, all_code = yield from self.attempt_query(query)
+                self.last_pass_check = pass_check
+                if pass_check:
+                    break
 
         save_path = f"{self.log_dir}/{self.query_idx}/final.py"
         os.makedirs(f"{self.log_dir}/{self.query_idx}/", exist_ok=True)
         with open(save_path, "w") as f:
             f.write(all_code)
         self.query_idx += 1
+        self.commit_query()
+
+    def attempt_query(self, query):
+        """One generation attempt for `query`, returns (pass_check, all_code)."""
+        # feedback on the previous attempt goes into this attempt's prompts, a later one
+        # only sees feedback on this attempt
+        self.attempt_feedback, self.retry_feedback = self.retry_feedback, None
+        # decompose query into actions
+        # get the values of the dict contextual_states
+        all_code = ""
+        try:
+            yield "context selection prompt ..."
+            contextual_states = self.state_change(query)
+            actions = self.decompose_query(query, contextual_states)
+            assert all(key in actions.keys() for key in ["input_logic", "state_transition", "ui_rendering"])
+
+            function_description = actions["input_logic"]["description"]
+            function_name = actions["input_logic"]["function_name"]
+            if not (function_name == "" or function_description == ""):
+                yield "#####################################################"
+                yield f"implementing {function_name} ..."
+                yield f"{function_description}"
+                self.input_logics = tuple(
+                    function
+                    for function in self.input_logics
+                    if function.name != function_name
+                )
+                input_logics = self.input_logic_add(
+                    function_name, function_description, contextual_states
+                )
+                self.queries[-1]["input_logic"] = [logic.name for logic in input_logics]
+                self.input_logics = self.add_new_function(self.input_logics, input_logics)
+
+            function_description = actions["state_transition"]["description"]
+            function_name = actions["state_transition"]["function_name"]
+            if not (function_name == "" or function_description == ""):
+                yield "#####################################################"
+                yield f"implementing {function_name} ..."
+                yield f"{function_description}"
+                self.logics = tuple(
+                    function
+                    for function in self.logics
+                    if function.name != function_name
+                )
+                logics = self.logic_add(
+                    function_name, function_description, contextual_states
+                )
+                self.queries[-1]["logic"] = [logic.name for logic in logics]
+                self.logics = self.add_new_function(self.logics, logics)
+
+            function_description = actions["ui_rendering"]["description"]
+            function_name = actions["ui_rendering"]["function_name"]
+            if not (function_name == "" or function_description == ""):
+                yield "#####################################################"
+                yield f"implementing {function_name} ..."
+                yield f"{function_description}"
+                self.renders = tuple(
+                    function
+                    for function in self.renders
+                    if function.name != function_name
+                )
+                renders = self.ui_add(
+                    function_name, function_description, contextual_states
+                )
+                self.queries[-1]["rendering"] = [logic.name for logic in renders]
+                self.renders = self.add_new_function(self.renders, renders)
+        except (CacheMissError, CandidateCancelled):
+            # replaying a logged run must not silently diverge from it, and a cancelled
+            # candidate must stop right away
+            raise
+        except Exception as e:
+            print('================= exception ')
+            print(e)
+            return False, all_code
+
+        self.clean_states()
+        if self.debug_mode:
+            print("number of state variables", len(self.states))
+
+        all_code = self.export_code()
+        save_path = f"{self.log_dir}/{self.query_idx}/{self.num_api_calls}_final.py"
+        os.makedirs(f"{self.log_dir}/{self.query_idx}", exist_ok=True)
+        with open(save_path, "w") as f:
+            f.write(all_code)
+
+        self.check_cancelled()
+        pass_check, error_trace = self.pass_sanity_check()
+        self.check_cancelled()
+        if pass_check:
+            yield "pass sanity check."
+        else:
+            yield "fail sanity check."
+            yield error_trace
+        return pass_check, all_code
+
+    def process_query_candidates(self, query):
+        """
+        Runs `num_candidates` attempts for `query` concurrently, each on its own fork of
+        the game, and adopts the winner. With candidate_selection="first" the first
+        candidate to pass the sanity check wins and the others are abandoned; with "best"
+        all candidates finish and the passing one with the fewest state variables wins.
+        A candidate that raises counts as a failed attempt. Returns the exported code of
+        the adopted candidate.
+        """
+        # spend at most the same number of attempts as the serial retry loop
+        num_rounds = -(-self.MAX_RETRIES // self.num_candidates)
+        all_code = ""
+        for round_idx in range(num_rounds):
+            num_tokens, num_api_calls = self.num_tokens, self.num_api_calls
+            cancel_event = threading.Event()
+            candidates = []
+            for candidate_idx in range(self.num_candidates):
+                candidate = self.fork(
+                    f"{self.log_dir}/{self.query_idx}/candidate_{round_idx}_{candidate_idx}"
+                )
+                candidate.cancel_event = cancel_event
+                candidates.append(candidate)
+            yield f"generating {len(candidates)} candidates in parallel ..."
+
+            executor = ThreadPoolExecutor(max_workers=len(candidates))
+            futures = {
+                executor.submit(run_candidate, candidate, query): idx
+                for idx, candidate in enumerate(candidates)
+            }
+            # results in order of completion
+            results = {}
+            for future in as_completed(futures):
+                idx = futures[future]
+                try:
+                    results[idx] = future.result()
+                except CandidateCancelled:
+                    continue
+                except Exception as e:
+                    # e.g. a cache miss or an engine error, one candidate's failed attempt
+                    print(f"================= candidate {idx} failed")
+                    print(e)
+                    continue
+                if results[idx][0] and self.candidate_selection == "first":
+                    # the losing candidates stop at their next LLM request or sanity
+                    # check; none of them can start counting a request after this
+                    with _cancel_lock:
+                        cancel_event.set()
+                    break
+            # a loser still in a sandbox run is left to finish it in the background
+            executor.shutdown(wait=False, cancel_futures=True)
+
+            # account for the requests of every candidate, including the losers
+            for candidate in candidates:
+                self.num_tokens += candidate.num_tokens - num_tokens
+                self.num_api_calls += candidate.num_api_calls - num_api_calls
+            passed = [idx for idx in results if results[idx][0]]
+            if passed and self.candidate_selection == "first":
+                winner = passed[0]
+            elif passed:
+                winner = min(passed, key=lambda idx: (len(candidates[idx].states), idx))
+            elif results:
+                # like the serial loop, keep the last attempt's changes when nothing passes
+                winner = min(results)
+            else:
+                continue
+
+            self.adopt(candidates[winner])
+            pass_check, all_code, messages = results[winner]
+            self.last_pass_check = pass_check
+            yield f"adopting candidate {winner} of round {round_idx}"
+            for message in messages:
+                yield message
+            if pass_check:
+                break
+        return all_code
+
+    def fork(self, log_dir):
+        """
+        Returns an independent copy of the game that logs to `log_dir`. The LLM engine,
+        response cache and sandbox are shared with the original, and so is the game
+        representation, which neither changes in place.
+        """
+        shared = [
+            "engine",
+            "cache",
+            "sandbox",
+            "cancel_event",
+            "states",
+            "input_logics",
+            "logics",
+            "renders",
+            "_dependency_key",
+            "_dependency_index",
+            "_exported_parts",
+            "_exported_fragments",
+            "_exported_code",
+        ]
+        forked = copy.copy(self)
+        for name, value in vars(self).items():
+            if name not in shared:
+                setattr(forked, name, copy.deepcopy(value))
+        forked.log_dir = log_dir
+        os.makedirs(log_dir, exist_ok=True)
+        # cached samples are namespaced by log_dir, so the fork starts counting afresh
+        forked.query_counts = {}
+        # only the original commits queries
+        forked.journal_path = None
+        return forked
+
+    def adopt(self, other):
+        """Takes over the game representation of a fork and the results of its last attempt."""
+        self.checkout(other.version())
+        self.queries = other.queries
+        self.contextual_state_names = other.contextual_state_names
+        self.last_pass_check = other.last_pass_check
+        self.frame_time_ms = other.frame_time_ms
+        self.retry_feedback = other.retry_feedback
+
+    def snapshot(self):
+        """The game representation and counters as JSON data, see restore."""
+        def function_data(function):
+            return {
+                "name": function.name,
+                "description": function.description,
+                "implementation": function.implementation,
+                "relevant_state_names": function._relevant_state_names,
+            }
+
+        return {
+            "query_idx": self.query_idx,
+            "queries": self.queries,
+            "states": [
+                {
+                    "name": state.name,
+                    "value": state.value,
+                    "variable_type": state.variable_type,
+                    "description": state.description,
+                    "dont_clean": state.dont_clean,
+                }
+                for state in self.states
+            ],
+            "input_logics": [function_data(function) for function in self.input_logics],
+            "logics": [function_data(function) for function in self.logics],
+            "renders": [function_data(function) for function in self.renders],
+            "contextual_state_names": self.contextual_state_names,
+            "num_tokens": self.num_tokens,
+            "num_api_calls": self.num_api_calls,
+            "num_cache_hits": self.num_cache_hits,
+            "query_counts": self.query_counts,
+        }
+
+    def restore(self, snapshot):
+        self.query_idx = snapshot["query_idx"]
+        self.queries = snapshot["queries"]
+        self.states = tuple(StateVariable(**state) for state in snapshot["states"])
+        self.input_logics = tuple(Function(**function) for function in snapshot["input_logics"])
+        self.logics = tuple(Function(**function) for function in snapshot["logics"])
+        self.renders = tuple(Function(**function) for function in snapshot["renders"])
+        self.contextual_state_names = snapshot["contextual_state_names"]
+        self.num_tokens = snapshot["num_tokens"]
+        self.num_api_calls = snapshot["num_api_calls"]
+        self.num_cache_hits = snapshot["num_cache_hits"]
+        self.query_counts = snapshot["query_counts"]
+
+    def commit_query(self):
+        """Appends a snapshot to the journal once a query is done (one JSON line per query)."""
+        if self.journal_path is None:
+            return
+        with open(self.journal_path, "a") as f:
+            f.write(json.dumps(self.snapshot()) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear_journal(self):
+        # start a new session in this log_dir
+        if self.journal_path is not None and os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def resume(self):
+        """
+        Restores the last query committed to the journal and returns the number of
+        finished queries, 0 if there is nothing to resume. A line cut short by a crash is
+        dropped from the journal.
+        """
+        if self.journal_path is None or not os.path.exists(self.journal_path):
+            return 0
+        last_snapshot = None
+        valid_bytes = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    last_snapshot = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                valid_bytes += len(line)
+        with open(self.journal_path, "r+b") as f:
+            f.truncate(valid_bytes)
+        if last_snapshot is None:
+            return 0
+        self.restore(last_snapshot)
+        return self.query_idx
 
     def clean_states(self):
         # the first 3 are the default states
@@ -462,7 +1101,7 @@ class GameRep:
         all_vars = []
         for state in self.states:
             if state.variable_type == "str":
-                all_vars.extend(extract_variables(state.value))
+                all_vars.extend(analyze_code(state.value).free_names)
         for var in all_vars:
             if var in used_states.keys():
                 used_states[var] = True
@@ -470,11 +1109,12 @@ class GameRep:
         for function in self.input_logics + self.logics + self.renders:
             for state_name in function.relevant_state_names:
                 used_states[state_name] = True
-        self.states = [state for state in self.states if used_states[state.name]]
+        self.states = tuple(state for state in self.states if used_states[state.name])
 
     def state_change(self, query):
         query = state_change_prompt.format(
-            state_manager_code=self.get_state_manager_code(), query=query
+            state_manager_code=self.get_state_manager_code(self.state_change_states(query)),
+            query=query,
         )
         _new_states = self.ask_llm(query)
         if self.debug_mode:
@@ -537,7 +1177,7 @@ class GameRep:
                 variable_type=state["variable_type"],
                 description=state["variable_description"],
             )
-            self.states.append(_new_state)
+            self.states = self.states + (_new_state,)
             ret_new_states[state["variable_name"]] = _new_state
 
         return list(ret_new_states.values())
@@ -545,18 +1185,31 @@ class GameRep:
     def input_logic_add(
         self, function_name, function_description, relevant_states=None
     ):
-        # if the function_name exists in self.input_logics, existing_implementation should be set
-        existing_implementation = ""
-        for function in self.input_logics:
-            if (relevant_states and function.is_relevant(relevant_states)):
-                existing_implementation += function.implementation + "\n"
-
-        query = input_logic_add_prompt.format(
-            state_manager_code=self.get_state_manager_code(relevant_states),
+        # the input logics near the relevant states, as many as fit into the budget
+        state_manager_code = self.get_state_manager_code(relevant_states)
+        existing_functions = []
+        if relevant_states:
+            existing_functions = self.fit_to_budget(
+                self.context_functions(
+                    self.input_logics, [state.name for state in relevant_states]
+                ),
+                input_logic_add_prompt.format(
+                    state_manager_code=state_manager_code,
+                    existing_implementation="",
+                    function_name=function_name,
+                    function_description=function_description,
+                ),
+            )
+        existing_implementation = "".join(
+            function.implementation + "\n" for function in existing_functions
+        )
+
+        query = self.add_feedback(input_logic_add_prompt.format(
+            state_manager_code=state_manager_code,
             existing_implementation=existing_implementation,
             function_name=function_name,
             function_description=function_description,
-        )
+        ))
         input_logic = self.ask_llm(query)
         if self.debug_mode:
             self.log_query(
@@ -571,9 +1224,6 @@ class GameRep:
                 description=input_logic["function_description"],
                 implementation=input_logic["function_implementation"],
                 type="input_logic",
-                relevant_state_names=extract_variables_with_regex(
-                    input_logic["function_implementation"], keyword="state_manager"
-                ),
             )
         ]
 
@@ -590,10 +1240,21 @@ class GameRep:
             return new_functions
 
     def logic_add(self, function_name, function_description, relevant_states=None):
-        existing_implementation = ""
-        for function in self.logics:
-            if (relevant_states and function.is_relevant(relevant_states)):
-                existing_implementation += function.implementation + "\n"
+        state_manager_code = self.get_state_manager_code(relevant_states)
+        existing_functions = []
+        if relevant_states:
+            existing_functions = self.fit_to_budget(
+                self.context_functions(self.logics, [state.name for state in relevant_states]),
+                logic_add_prompt.format(
+                    state_manager_code=state_manager_code,
+                    existing_implementation="",
+                    function_name=function_name,
+                    function_description=function_description,
+                ),
+            )
+        existing_implementation = "".join(
+            function.implementation + "\n" for function in existing_functions
+        )
         #existing_implementation = next(
         #    (
         #        function.implementation
@@ -604,12 +1265,12 @@ class GameRep:
         #    "",
         #)
 
-        query = logic_add_prompt.format(
-            state_manager_code=self.get_state_manager_code(relevant_states),
+        query = self.add_feedback(logic_add_prompt.format(
+            state_manager_code=state_manager_code,
             existing_implementation=existing_implementation,
             function_name=function_name,
             function_description=function_description,
-        )
+        ))
         logic = self.ask_llm(query)
         if self.debug_mode:
             self.log_query(
@@ -624,9 +1285,6 @@ class GameRep:
                 description=logic["function_description"],
                 implementation=logic["function_implementation"],
                 type="logic",
-                relevant_state_names=extract_variables_with_regex(
-                    logic["function_implementation"], keyword="state_manager"
-                ),
             )
         ]
         # if all functions pass basic sanity check
@@ -636,12 +1294,27 @@ class GameRep:
             raise Exception("logic_add failed")
 
     def ui_add(self, function_name, function_description, relevant_states=None):
-        query = ui_add_prompt.format(
+        # all renders as before, those near the relevant states first when the budget is tight
+        state_manager_code = self.get_state_manager_code(relevant_states)
+        renders = self.renders
+        if self.context_token_budget is not None and relevant_states:
+            nearby = self.context_functions(renders, [state.name for state in relevant_states])
+            nearby_ids = {id(render) for render in nearby}
+            renders = self.fit_to_budget(
+                nearby + [render for render in renders if id(render) not in nearby_ids],
+                ui_add_prompt.format(
+                    function_name=function_name,
+                    function_description=function_description,
+                    state_manager_code=state_manager_code,
+                    render_code="",
+                ),
+            )
+        query = self.add_feedback(ui_add_prompt.format(
             function_name=function_name,
             function_description=function_description,
-            state_manager_code=self.get_state_manager_code(relevant_states),
-            render_code="\n".join([render.implementation for render in self.renders]),
-        )
+            state_manager_code=state_manager_code,
+            render_code="\n".join([render.implementation for render in renders]),
+        ))
         render = self.ask_llm(query)
         if self.debug_mode:
             self.log_query(
@@ -657,9 +1330,6 @@ class GameRep:
                 description=render["function_description"],
                 implementation=render["function_implementation"],
                 type="render",
-                relevant_state_names=extract_variables_with_regex(
-                    render["function_implementation"], keyword="state_manager"
-                ),
             )
         ]
 
@@ -668,41 +1338,77 @@ class GameRep:
         else:
             raise Exception("ui_add failed")
 
-    def export_code(self):
-        all_code = PREPEND_CODE
-        # add StateManager
-        all_code += self.get_state_manager_code()
-
-        for input_logic in self.input_logics:
-            all_code += input_logic.implementation + "\n\n"
-
-        for logic in self.logics:
-            all_code += logic.implementation + "\n\n"
-
-        for render in self.renders:
-            all_code += render.implementation + "\n\n"
-
-        input_logic_code = ""
-        for function in self.input_logics:
-            input_logic_code += f"        # {function.description}\n"
-            input_logic_code += f"        {function.name}(state_manager, event)\n"
-            input_logic_code += "\n"
-
-        logic_code = ""
-        for function in self.logics:
-            logic_code += f"        # {function.description}\n"
-            logic_code += f"        {function.name}(state_manager)\n"
-            logic_code += "\n"
-
-        render_code = ""
-        for function in self.renders:
-            render_code += f"        # {function.description}\n"
-            render_code += f"        {function.name}(state_manager)\n"
-            render_code += "\n"
-        # add all logics code
-        all_code += APPEND_CODE.format(
-            input_logic_code=input_logic_code,
-            logic_code=logic_code,
-            render_code=render_code,
+    def export_fragments(self):
+        """
+        Returns the program as a list of top-level fragments that compile on their own:
+        the prelude, StateManager, every function and the Game class. Re-assembles only
+        when a state or function changed since the last call.
+        """
+        functions = self.input_logics + self.logics + self.renders
+        parts = (
+            tuple(state.manager_code() for state in self.states),
+            tuple(function.export() for function in functions),
+            tuple(function.call_code(input_logic=True) for function in self.input_logics),
+            tuple(function.call_code() for function in self.logics + self.renders),
         )
-        return all_code
\ No newline at end of file
+        # the parts are cached strings, so comparing them is mostly identity checks
+        if parts == self._exported_parts:
+            return self._exported_fragments
+
+        fragments = [PREPEND_CODE, self.get_state_manager_code()]
+        fragments.extend(function.export() for function in functions)
+        fragments.append(
+            APPEND_CODE.format(
+                input_logic_code="".join(
+                    function.call_code(input_logic=True) for function in self.input_logics
+                ),
+                logic_code="".join(function.call_code() for function in self.logics),
+                render_code="".join(function.call_code() for function in self.renders),
+            )
+        )
+        fragments.append(MAIN_CODE)
+        self._exported_parts = parts
+        self._exported_fragments = fragments
+        self._exported_code = "".join(fragments)
+        return fragments
+
+    def export_code(self, instrument=False, profile_frames=300, profile_output=None):
+        """
+        With instrument=True, every input_logic, logic and render call and every frame is
+        timed; after `profile_frames` frames the program prints a per-function table and
+        writes the collapsed stacks (flamegraph.pl / speedscope format) to `profile_output`.
+        """
+        if instrument:
+            return "".join(self.export_instrumented_fragments(profile_frames, profile_output))
+        self.export_fragments()
+        return self._exported_code
+
+    def export_instrumented_fragments(self, profile_frames=300, profile_output=None):
+        fragments = [
+            PREPEND_CODE,
+            PROFILE_CODE.format(profile_frames=profile_frames, profile_output=profile_output),
+            self.get_state_manager_code(),
+        ]
+        functions = self.input_logics + self.logics + self.renders
+        fragments.extend(function.export() for function in functions)
+        fragments.append(
+            APPEND_CODE.format(
+                input_logic_code="".join(
+                    function.profiled_call_code("input_logic", input_logic=True)
+                    for function in self.input_logics
+                ),
+                logic_code="".join(
+                    function.profiled_call_code("logic") for function in self.logics
+                ),
+                render_code="".join(
+                    function.profiled_call_code("render") for function in self.renders
+                ),
+            )
+        )
+        fragments.append(PROFILE_GAME_CODE)
+        fragments.append(MAIN_CODE)
+        return fragments
+
+    def code_compilable(self):
+        """Same as code_compilable(self.export_code()), re-compiling changed fragments only."""
+        return all(fragment_compilable(fragment) for fragment in self.export_fragments())
@@ -0,0 +1,116 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLLMServer:
+    """
+    A minimal OpenAI-compatible server answering /v1/chat/completions offline.
+
+    `responses` is either a list of JSON-serializable objects (returned in a cycle) or a
+    function taking the request body and returning one. The first `num_failures` requests
+    are answered with `failure_status` to exercise the retry path of the LLM engine.
+    """
+
+    def __init__(
+        self,
+        responses,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        num_failures=0,
+        failure_status=429,
+    ):
+        self.responses = responses
+        self.latency = latency
+        self.num_failures = num_failures
+        self.failure_status = failure_status
+        self.num_requests = 0
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length))
+                status, payload = server.handle(self.path, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def next_response(self, body):
+        if callable(self.responses):
+            return self.responses(body)
+        return self.responses[(self.num_requests - 1) % len(self.responses)]
+
+    def handle(self, path, body):
+        with self.lock:
+            self.num_requests += 1
+            request_idx = self.num_requests
+        if self.latency:
+            time.sleep(self.latency)
+        if not path.rstrip("/").endswith("chat/completions"):
+            return 404, {"error": {"message": f"unknown path {path}"}}
+        if request_idx <= self.num_failures:
+            return self.failure_status, {"error": {"message": "injected failure"}}
+
+        content = self.next_response(body)
+        if not isinstance(content, str):
+            content = json.dumps(content)
+        return 200, {
+            "id": f"chatcmpl-fake-{request_idx}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+if __name__ == "__main__":
+    # python fake_llm_server.py responses.json [PORT]
+    # then run main.py with OPENAI_BASE_URL=http://127.0.0.1:PORT/v1 OPENAI_API_KEY=fake
+    with open(sys.argv[1], "r") as f:
+        responses = json.load(f)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+    server = FakeLLMServer(responses, port=port)
+    print(f"serving fake chat completions at {server.base_url}")
+    server.httpd.serve_forever()
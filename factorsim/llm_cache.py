@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_CACHE_PATH = "./factorsim_results/llm_cache.sqlite"
+DEFAULT_MAX_BYTES = 1 << 30
+CACHE_MODES = ["readwrite", "replay", "off"]
+
+
+class CacheMissError(Exception):
+    pass
+
+
+class LLMCache:
+    """
+    Persistent, content-addressed cache of raw LLM responses backed by SQLite.
+
+    Entries are keyed by a hash of (model, system message, prompt, sampling params,
+    sample). `sample` distinguishes repeated identical requests (e.g. retries) so that a
+    rerun replays the same sequence of responses instead of the first one over and over.
+    The total size of stored responses is bounded by `max_bytes` with LRU eviction.
+
+    mode: "readwrite" looks up and stores responses, "replay" opens the database read-only
+    and raises CacheMissError on a miss, and "off" disables the cache.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, mode="readwrite"):
+        assert mode in CACHE_MODES, f"unknown cache mode {mode}"
+        self.path = path
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = None
+
+        if mode == "readwrite":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, "
+                "size INTEGER, last_access REAL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+            )
+            self.conn.commit()
+        elif mode == "replay":
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"no LLM cache to replay at {path}")
+            self.conn = sqlite3.connect(
+                f"file:{path}?mode=ro", uri=True, check_same_thread=False
+            )
+
+    @staticmethod
+    def key(model, system, prompt, params=None, sample=0):
+        content = json.dumps(
+            {
+                "model": model,
+                "system": system,
+                "prompt": prompt,
+                "params": params or {},
+                "sample": sample,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, model, system, prompt, params=None, sample=0):
+        """Returns the cached response, or None on a miss (CacheMissError in replay mode)."""
+        if self.mode == "off":
+            return None
+        key = self.key(model, system, prompt, params, sample)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.mode == "readwrite":
+                self.conn.execute(
+                    "UPDATE responses SET last_access = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+                self.conn.commit()
+        if row is None:
+            self.misses += 1
+            if self.mode == "replay":
+                raise CacheMissError(f"no cached response for {model} request {key}")
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, model, system, prompt, response, params=None, sample=0):
+        if self.mode != "readwrite":
+            return
+        key = self.key(model, system, prompt, params, sample)
+        size = len(response.encode())
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, size, time.time()),
+            )
+            self.evict()
+            self.conn.commit()
+
+    def evict(self):
+        # drop the least recently used entries until we are within budget
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access ASC"
+        ).fetchall()
+        stale_keys = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale_keys.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Returns the process-wide cache, configured by the FACTORSIM_LLM_CACHE (path),
+    FACTORSIM_LLM_CACHE_MODE and FACTORSIM_LLM_CACHE_MAX_BYTES environment variables.
+    Caching is opt-in: samples are keyed by log directory, so a cache left on would
+    replay the responses of an earlier run into a new run in the same results directory.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(
+                path=os.environ.get("FACTORSIM_LLM_CACHE", DEFAULT_CACHE_PATH),
+                max_bytes=int(
+                    os.environ.get("FACTORSIM_LLM_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+                ),
+                mode=os.environ.get("FACTORSIM_LLM_CACHE_MODE", "off"),
+            )
+            if _cache.mode != "off":
+                print(
+                    f"LLM cache ({_cache.mode}) at {_cache.path}: responses cached for the "
+                    "same log directories are replayed instead of requested"
+                )
+    return _cache
@@ -0,0 +1,179 @@
+import asyncio
+import random
+import threading
+import time
+from openai import (
+    AsyncOpenAI,
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    RateLimitError,
+)
+from utils import num_tokens_from_string
+
+
+# requests per minute / tokens per minute for the models we use
+DEFAULT_RATE_LIMITS = {
+    "gpt-4-1106-preview": {"rpm": 500, "tpm": 300000},
+    "gpt-3.5-turbo-1106": {"rpm": 3500, "tpm": 1000000},
+}
+FALLBACK_RATE_LIMIT = {"rpm": 500, "tpm": 150000}
+
+
+class RateLimiter:
+    """
+    Token bucket refilled continuously over a minute, one for requests and one for tokens.
+    """
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.available_requests = rpm
+        self.available_tokens = tpm
+        self.last_refill = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        self.available_requests = min(
+            self.rpm, self.available_requests + elapsed * self.rpm / 60
+        )
+        self.available_tokens = min(
+            self.tpm, self.available_tokens + elapsed * self.tpm / 60
+        )
+
+    async def acquire(self, num_tokens):
+        # a single prompt larger than the whole budget would otherwise wait forever
+        num_tokens = min(num_tokens, self.tpm)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.available_requests >= 1 and self.available_tokens >= num_tokens:
+                    self.available_requests -= 1
+                    self.available_tokens -= num_tokens
+                    return
+                wait = max(
+                    (1 - self.available_requests) * 60 / self.rpm,
+                    (num_tokens - self.available_tokens) * 60 / self.tpm,
+                )
+                await asyncio.sleep(max(wait, 0.01))
+
+    def report_usage(self, estimated_tokens, used_tokens):
+        # correct the estimate once the server tells us the real usage
+        self.available_tokens -= used_tokens - estimated_tokens
+
+
+class LLMEngine:
+    """
+    Shared asyncio request engine for chat completions.
+
+    The event loop runs in a background thread so that synchronous callers (e.g. the
+    generator in GameRep.process_user_query) can share one bounded pool of in-flight
+    requests and one set of per-model rate limits. Point `base_url` (or the
+    OPENAI_BASE_URL environment variable) at fake_llm_server.py to run offline.
+    """
+
+    def __init__(
+        self,
+        max_concurrency=8,
+        rate_limits=None,
+        max_retries=6,
+        base_url=None,
+        api_key=None,
+        timeout=600,
+    ):
+        self.max_concurrency = max_concurrency
+        self.rate_limits = dict(DEFAULT_RATE_LIMITS)
+        if rate_limits:
+            self.rate_limits.update(rate_limits)
+        self.max_retries = max_retries
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        # the client, semaphore and limiters have to be created inside the loop
+        asyncio.run_coroutine_threadsafe(self._setup(), self.loop).result()
+
+    async def _setup(self):
+        # retries are handled by us so that they respect the shared rate limits
+        self.client = AsyncOpenAI(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            timeout=self.timeout,
+            max_retries=0,
+        )
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.limiters = {}
+
+    def get_limiter(self, model):
+        if model not in self.limiters:
+            limit = self.rate_limits.get(model, FALLBACK_RATE_LIMIT)
+            self.limiters[model] = RateLimiter(limit["rpm"], limit["tpm"])
+        return self.limiters[model]
+
+    async def achat(self, model, messages, **params):
+        """Returns the content of the first choice of a chat completion."""
+        limiter = self.get_limiter(model)
+        estimated_tokens = sum(
+            num_tokens_from_string(message["content"]) for message in messages
+        )
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire(estimated_tokens)
+            try:
+                async with self.semaphore:
+                    completion = await self.client.chat.completions.create(
+                        model=model, messages=messages, **params
+                    )
+            except (RateLimitError, APIConnectionError, APITimeoutError) as e:
+                error = e
+            except APIStatusError as e:
+                if e.status_code < 500:
+                    raise
+                error = e
+            else:
+                if completion.usage is not None:
+                    limiter.report_usage(
+                        estimated_tokens, completion.usage.total_tokens
+                    )
+                assert len(completion.choices) == 1
+                return completion.choices[0].message.content
+
+            if attempt == self.max_retries:
+                raise error
+            # exponential backoff with jitter, capped at a minute
+            delay = min(60, 2**attempt) * (0.5 + random.random() / 2)
+            print(f"LLM request failed ({error.__class__.__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    def submit(self, model, messages, **params):
+        """Schedules a request and returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(
+            self.achat(model, messages, **params), self.loop
+        )
+
+    def chat(self, model, messages, **params):
+        """Blocking version of achat, safe to call from any thread."""
+        return self.submit(model, messages, **params).result()
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.client.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine(**kwargs):
+    """Returns the process-wide engine, creating it on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = LLMEngine(**kwargs)
+    return _engine
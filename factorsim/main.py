@@ -1,19 +1,237 @@
+import argparse
+import json
 import os
-import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from evaluation.evaluate_utils import execute_file, dynamical_import, run_eval
 from utils import save_json_to_file, add_initial_states
 from factorized_pomdp import GameRep
+from beam_search import beam_search, fast_test_subset
+from llm_cache import CacheMissError
 from prompts import high_level_decompose_prompt
 
+# generation settings, shared with orchestrate.py
+USE_DECOMPOSE_PROMPT = True
+NUM_TRIALS = 10
+# > 1 generates that many attempts per query in parallel (first passing one wins)
+NUM_CANDIDATES = 1
+# reject code whose frames take longer than this (mean / worst case), None disables;
+# measured on the instrumented export, which is slower than the plain game
+FRAME_BUDGET_MS = None
+MAX_FRAME_BUDGET_MS = None
+# upper bound on the tokens of every generation prompt, existing code near the
+# touched states is left out beyond it; None shows all of it
+CONTEXT_TOKEN_BUDGET = None
+
+
+def make_game(
+    log_dir,
+    model,
+    NUM_CANDIDATES=1,
+    FRAME_BUDGET_MS=None,
+    MAX_FRAME_BUDGET_MS=None,
+    CONTEXT_TOKEN_BUDGET=None,
+):
+    WIDTH, HEIGHT, FPS = 1000, 1000, 30
+    os.makedirs(log_dir, exist_ok=True)
+    game = GameRep(
+        HEIGHT,
+        WIDTH,
+        FPS,
+        MAX_RETRIES=3,
+        log_dir=log_dir,
+        debug_mode=1,
+        model=model,
+        num_candidates=NUM_CANDIDATES,
+        frame_budget_ms=FRAME_BUDGET_MS,
+        max_frame_budget_ms=MAX_FRAME_BUDGET_MS,
+        context_token_budget=CONTEXT_TOKEN_BUDGET,
+    )
+    ## add default States to the game
+    add_initial_states(game)
+    ## To train RL agents, we need to initialize the states needed for the (downstream) RL agent
+    return game
+
+
+def get_step_prompts(game, idx, all_prompts, USE_DECOMPOSE_PROMPT=True, RESUME=False):
+    # continue after the last query committed to the journal, or start a new one
+    if RESUME:
+        num_committed = game.resume()
+        print(f"[trial {idx}] resuming after {num_committed} queries")
+    else:
+        game.clear_journal()
+
+    ### PROMPT 1: get step by step plan
+    decompose_path = f"{game.log_dir}/decompose_{idx}.json"
+    if USE_DECOMPOSE_PROMPT and RESUME and os.path.exists(decompose_path):
+        with open(decompose_path, "r") as f:
+            step_by_step_prompts = json.load(f)["steps"]
+    elif USE_DECOMPOSE_PROMPT:
+        for _ in range(game.MAX_RETRIES):
+            try:
+                steps = game.ask_llm(
+                    high_level_decompose_prompt.format(
+                        game_specification=all_prompts
+                    )
+                )
+                assert "steps" in steps
+                save_json_to_file(steps, decompose_path)
+                break
+            except CacheMissError:
+                raise
+            except:
+                print("Failed to get steps from LLM")
+                continue
+        else:
+            raise Exception(
+                f"decompose failed - no steps from the LLM after {game.MAX_RETRIES} attempts"
+            )
+        step_by_step_prompts = steps["steps"]
+    else:
+        step_by_step_prompts = all_prompts.split("\n")
+
+    ### PROMPT 2, 3, 4, 5
+    step_by_step_prompts = [prompt.strip() for prompt in step_by_step_prompts]
+    step_by_step_prompts = [prompt for prompt in step_by_step_prompts if prompt != ""]
+    return step_by_step_prompts
+
+
+def run_trial(
+    idx,
+    model,
+    all_prompts,
+    save_dir,
+    USE_DECOMPOSE_PROMPT=True,
+    NUM_CANDIDATES=1,
+    FRAME_BUDGET_MS=None,
+    MAX_FRAME_BUDGET_MS=None,
+    CONTEXT_TOKEN_BUDGET=None,
+    RESUME=False,
+):
+    log_dir = f"{save_dir}/pomdp_{idx}"
+    implementation_path = log_dir + "/final.py"
+    game = make_game(
+        log_dir,
+        model,
+        NUM_CANDIDATES,
+        FRAME_BUDGET_MS,
+        MAX_FRAME_BUDGET_MS,
+        CONTEXT_TOKEN_BUDGET,
+    )
+    step_by_step_prompts = get_step_prompts(
+        game, idx, all_prompts, USE_DECOMPOSE_PROMPT, RESUME
+    )
+    # every finished query is one journal entry
+    for prompt in step_by_step_prompts[game.query_idx:]:
+        for response in game.process_user_query(prompt):
+            print(f"[trial {idx}] {response}")
+        code = game.export_code()
+        with open(implementation_path, "w") as f:
+            f.write(code)
+    return implementation_path
+
+
+def run_beam_trial(
+    idx,
+    model,
+    all_prompts,
+    save_dir,
+    test_file_path,
+    USE_DECOMPOSE_PROMPT=True,
+    BEAM_WIDTH=3,
+    BEAM_EXPANSIONS=2,
+    BEAM_NUM_TESTS=2,
+    FRAME_BUDGET_MS=None,
+    MAX_FRAME_BUDGET_MS=None,
+    CONTEXT_TOKEN_BUDGET=None,
+    RESUME=False,
+):
+    # a beam search over the step prompts instead of a single greedy chain, see beam_search
+    log_dir = f"{save_dir}/pomdp_{idx}"
+    implementation_path = log_dir + "/final.py"
+    game = make_game(
+        log_dir,
+        model,
+        FRAME_BUDGET_MS=FRAME_BUDGET_MS,
+        MAX_FRAME_BUDGET_MS=MAX_FRAME_BUDGET_MS,
+        CONTEXT_TOKEN_BUDGET=CONTEXT_TOKEN_BUDGET,
+    )
+    step_by_step_prompts = get_step_prompts(
+        game, idx, all_prompts, USE_DECOMPOSE_PROMPT, RESUME
+    )
+    beam_search(
+        game,
+        step_by_step_prompts,
+        test_file_path,
+        beam_width=BEAM_WIDTH,
+        num_expansions=BEAM_EXPANSIONS,
+        # partial games are ranked on a few tests, the full suite runs on the final game
+        test_names=fast_test_subset(test_file_path, BEAM_NUM_TESTS),
+        log=lambda message: print(f"[trial {idx}] {message}"),
+    )
+    if game.query_idx < len(step_by_step_prompts):
+        print(
+            f"[trial {idx}] beam search stopped after {game.query_idx} of "
+            f"{len(step_by_step_prompts)} steps, --resume retries the next one"
+        )
+    with open(implementation_path, "w") as f:
+        f.write(game.export_code())
+    print(f"[trial {idx}] {game.num_api_calls} LLM calls")
+    return implementation_path
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("game_name")
+    parser.add_argument("model")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue every trial after its last finished query instead of starting over",
+    )
+    parser.add_argument(
+        "--beam_width",
+        type=int,
+        default=0,
+        help="> 0 runs a beam search keeping that many partial games per step (one trial)",
+    )
+    parser.add_argument(
+        "--beam_expansions",
+        type=int,
+        default=2,
+        help="attempts per game in the beam at every step",
+    )
+    parser.add_argument(
+        "--beam_tests",
+        type=int,
+        default=2,
+        help="unit tests the partial games of the beam are ranked on, spread over the suite",
+    )
+    parser.add_argument(
+        "--frame_budget_ms",
+        type=float,
+        default=FRAME_BUDGET_MS,
+        help="reject generated code whose mean frame time is over this (off by default)",
+    )
+    parser.add_argument(
+        "--max_frame_budget_ms",
+        type=float,
+        default=MAX_FRAME_BUDGET_MS,
+        help="reject generated code whose worst frame time is over this (off by default)",
+    )
+    parser.add_argument(
+        "--context_token_budget",
+        type=int,
+        default=CONTEXT_TOKEN_BUDGET,
+        help="cut the existing code shown to every prompt to this many tokens (off by default)",
+    )
+    args = parser.parse_args()
     # Set these game constants
-    game_name = sys.argv[1]
-    model = sys.argv[2]
+    game_name = args.game_name
+    model = args.model
 
-    USE_DECOMPOSE_PROMPT = True
-    NUM_TRIALS = 10
-    WIDTH, HEIGHT, FPS = 1000, 1000, 30
+    # trials are independent, so they all run at once; the LLM engine bounds the
+    # number of in-flight requests and enforces the per-model rate limits
+    NUM_WORKERS = NUM_TRIALS
     # make the directory if it does not exist
     game_path = f"./games/single_player_games/{game_name}"
     implementation_path = os.path.join(game_path, "mdp.py")
@@ -23,54 +241,45 @@ if __name__ == "__main__":
 
     save_dir = f"./factorsim_results/{model}/{game_name}_eval"
     os.makedirs(save_dir, exist_ok=True)
-    for idx in range(NUM_TRIALS):
-        log_dir = f"{save_dir}/pomdp_{idx}"
-        os.makedirs(log_dir, exist_ok=True)
-        implementation_path = log_dir + "/final.py"
-        game = GameRep(
-            HEIGHT,
-            WIDTH,
-            FPS,
-            MAX_RETRIES=3,
-            log_dir=log_dir,
-            debug_mode=1,
-            model=model,
+    if args.beam_width > 0:
+        # the beam replaces the independent trials, its best game is pomdp_0/final.py
+        implementation_path = run_beam_trial(
+            0,
+            model,
+            all_prompts,
+            save_dir,
+            test_file_path,
+            USE_DECOMPOSE_PROMPT,
+            args.beam_width,
+            args.beam_expansions,
+            args.beam_tests,
+            args.frame_budget_ms,
+            args.max_frame_budget_ms,
+            args.context_token_budget,
+            args.resume,
         )
-        ## add default States to the game
-        add_initial_states(game)
-        ## To train RL agents, we need to initialize the states needed for the (downstream) RL agent
-
-        ### PROMPT 1: get step by step plan
-        if USE_DECOMPOSE_PROMPT:
-            for _ in range(game.MAX_RETRIES):
-                steps = game.ask_llm(
-                    high_level_decompose_prompt.format(
-                        game_specification=all_prompts
-                    )
-                )
+        print(f"beam search finished: {implementation_path}")
+    else:
+        with ThreadPoolExecutor(max_workers=NUM_WORKERS) as executor:
+            futures = {
+                executor.submit(
+                    run_trial,
+                    idx,
+                    model,
+                    all_prompts,
+                    save_dir,
+                    USE_DECOMPOSE_PROMPT,
+                    NUM_CANDIDATES,
+                    args.frame_budget_ms,
+                    args.max_frame_budget_ms,
+                    args.context_token_budget,
+                    args.resume,
+                ): idx
+                for idx in range(NUM_TRIALS)
+            }
+            for future in as_completed(futures):
+                idx = futures[future]
                 try:
-                    steps = game.ask_llm(
-                        high_level_decompose_prompt.format(
-                            game_specification=all_prompts
-                        )
-                    )
-                    assert "steps" in steps
-                    save_json_to_file(steps, f"{log_dir}/decompose_{idx}.json")
-                    break
-                except:
-                    print("Failed to get steps from LLM")
-                    continue
-            step_by_step_prompts = steps["steps"]
-        else:
-            step_by_step_prompts = all_prompts.split("\n")
-
-        ### PROMPT 2, 3, 4, 5
-        for prompt in step_by_step_prompts:
-            prompt = prompt.strip()
-            if prompt == "":
-                continue
-            for response in game.process_user_query(prompt):
-                print(response)
-            code = game.export_code()
-            with open(implementation_path, "w") as f:
-                f.write(code)
\ No newline at end of file
+                    print(f"trial {idx} finished: {future.result()}")
+                except Exception as e:
+                    print(f"trial {idx} failed: {e}")
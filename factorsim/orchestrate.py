@@ -0,0 +1,274 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from evaluation.evaluate_utils import dynamical_import, run_eval
+from llm_engine import get_engine, DEFAULT_RATE_LIMITS, FALLBACK_RATE_LIMIT
+from main import (
+    run_trial,
+    USE_DECOMPOSE_PROMPT,
+    NUM_TRIALS,
+    NUM_CANDIDATES,
+    FRAME_BUDGET_MS,
+    MAX_FRAME_BUDGET_MS,
+    CONTEXT_TOKEN_BUDGET,
+)
+
+GAMES_DIR = "./games/single_player_games"
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Generate (and evaluate) every game with every model, resumable"
+    )
+    parser.add_argument("models", nargs="+", help="e.g. gpt-4-1106-preview")
+    parser.add_argument("--games", nargs="+", default=None, help="all games under games/single_player_games by default")
+    parser.add_argument("--num_trials", type=int, default=NUM_TRIALS)
+    parser.add_argument("--num_workers", type=int, default=16, help="trials generated at once")
+    parser.add_argument("--manifest", default="./factorsim_results/manifest.json")
+    parser.add_argument("--max_in_flight", type=int, default=None, help="LLM requests in flight across all jobs")
+    parser.add_argument("--rpm", type=int, default=None, help="requests per minute per model across all jobs")
+    parser.add_argument("--tpm", type=int, default=None, help="tokens per minute per model across all jobs")
+    parser.add_argument("--retry_failed", action="store_true", help="run failed jobs again, only the evaluation if that is what failed")
+    parser.add_argument("--no_eval", action="store_true", help="only generate")
+    parser.add_argument("--frame_budget_ms", type=float, default=FRAME_BUDGET_MS, help="see main.py")
+    parser.add_argument("--max_frame_budget_ms", type=float, default=MAX_FRAME_BUDGET_MS, help="see main.py")
+    parser.add_argument("--context_token_budget", type=int, default=CONTEXT_TOKEN_BUDGET, help="see main.py")
+    return parser.parse_args()
+
+
+def list_games(games_dir=GAMES_DIR):
+    # every directory with a game specification
+    return sorted(
+        name
+        for name in os.listdir(games_dir)
+        if os.path.exists(os.path.join(games_dir, name, "prompts.py"))
+    )
+
+
+class Manifest:
+    """
+    The (game, model, trial) jobs of a batch with their status, LLM usage and wall time,
+    written to `path` after every change so that a restarted batch skips finished work.
+
+    A job goes pending -> running -> generated (final.py written, evaluation queued) ->
+    done, or to failed when generating it fails and eval_failed when only its evaluation
+    does. Jobs that have been running before continue from their journal.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.jobs = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.jobs = json.load(f)["jobs"]
+
+    def add(self, game, model, trial):
+        job_id = f"{model}/{game}/{trial}"
+        if job_id not in self.jobs:
+            self.jobs[job_id] = {
+                "game": game,
+                "model": model,
+                "trial": trial,
+                "status": "pending",
+                "num_tokens": 0,
+                "num_api_calls": 0,
+                "wall_time": 0.0,
+                "implementation_path": None,
+                "acc": None,
+                "error": None,
+            }
+        return job_id
+
+    def update(self, job_id, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields)
+            self.save()
+
+    def save(self):
+        # replaced atomically, a crash leaves the previous version
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"jobs": self.jobs}, f, indent=4)
+        os.replace(self.path + ".tmp", self.path)
+
+
+def read_usage(log_dir):
+    # tokens and calls of a trial so far, from the last entry of its journal
+    journal_path = f"{log_dir}/journal.jsonl"
+    if not os.path.exists(journal_path):
+        return 0, 0
+    last_line = None
+    with open(journal_path, "r") as f:
+        for line in f:
+            if line.endswith("\n"):
+                last_line = line
+    if last_line is None:
+        return 0, 0
+    snapshot = json.loads(last_line)
+    return snapshot["num_tokens"], snapshot["num_api_calls"]
+
+
+def evaluate_job(manifest, job_id):
+    job = manifest.jobs[job_id]
+    test_file_path = os.path.join(GAMES_DIR, job["game"], "mdp_unit_test.py")
+    if not os.path.exists(test_file_path):
+        manifest.update(job_id, status="done")
+        return None
+    try:
+        json_result, acc = run_eval(test_file_path, job["implementation_path"], job["game"])
+    except Exception as e:
+        # final.py is kept, --retry_failed only evaluates it again
+        manifest.update(job_id, status="eval_failed", error=f"evaluation: {e}")
+        return None
+    results_path = os.path.join(os.path.dirname(job["implementation_path"]), "test_results.json")
+    with open(results_path, "w") as f:
+        json.dump(json_result, f, indent=4)
+    manifest.update(job_id, status="done", acc=acc, error=None)
+    return acc
+
+
+def generate_job(manifest, job_id, eval_executor=None, trial_args=None):
+    """
+    Runs one trial and queues its evaluation as soon as final.py is written. `trial_args`
+    are keyword arguments of run_trial, e.g. {"FRAME_BUDGET_MS": 10}.
+    """
+    trial_args = {} if trial_args is None else trial_args
+    job = manifest.jobs[job_id]
+    # a job that was started before continues after its last finished query
+    resume = job["status"] != "pending"
+    manifest.update(job_id, status="running", error=None)
+    save_dir = f"./factorsim_results/{job['model']}/{job['game']}_eval"
+    log_dir = f"{save_dir}/pomdp_{job['trial']}"
+    start = time.perf_counter()
+    try:
+        all_prompts, _ = dynamical_import(os.path.join(GAMES_DIR, job["game"]))
+        implementation_path = run_trial(
+            job["trial"],
+            job["model"],
+            all_prompts,
+            save_dir,
+            USE_DECOMPOSE_PROMPT=USE_DECOMPOSE_PROMPT,
+            NUM_CANDIDATES=NUM_CANDIDATES,
+            RESUME=resume,
+            **trial_args,
+        )
+    except Exception as e:
+        num_tokens, num_api_calls = read_usage(log_dir)
+        manifest.update(
+            job_id,
+            status="failed",
+            error=str(e),
+            num_tokens=num_tokens,
+            num_api_calls=num_api_calls,
+            wall_time=job["wall_time"] + time.perf_counter() - start,
+        )
+        return None
+
+    num_tokens, num_api_calls = read_usage(log_dir)
+    manifest.update(
+        job_id,
+        status="generated",
+        implementation_path=implementation_path,
+        num_tokens=num_tokens,
+        num_api_calls=num_api_calls,
+        wall_time=job["wall_time"] + time.perf_counter() - start,
+    )
+    if eval_executor is not None:
+        return eval_executor.submit(evaluate_job, manifest, job_id)
+    return None
+
+
+def run_batch(manifest, job_ids, num_workers, evaluate=True, retry_failed=False, trial_args=None):
+    """Generates the unfinished jobs of `job_ids` and evaluates them, skipping done ones."""
+    to_generate = []
+    to_evaluate = []
+    for job_id in job_ids:
+        status = manifest.jobs[job_id]["status"]
+        if status == "generated" or (status == "eval_failed" and retry_failed):
+            to_evaluate.append(job_id)
+        elif status in ["failed", "eval_failed"] and not retry_failed:
+            continue
+        elif status != "done":
+            to_generate.append(job_id)
+    print(
+        f"{len(job_ids)} jobs: {len(to_generate)} to generate, "
+        f"{len(to_evaluate)} to evaluate, the rest are done or failed"
+    )
+
+    # the evaluation runs on the sandbox pool, one job at a time is enough to keep it busy
+    eval_executor = ThreadPoolExecutor(max_workers=1) if evaluate else None
+    eval_futures = []
+    if evaluate:
+        eval_futures = [
+            eval_executor.submit(evaluate_job, manifest, job_id) for job_id in to_evaluate
+        ]
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = {
+            executor.submit(generate_job, manifest, job_id, eval_executor, trial_args): job_id
+            for job_id in to_generate
+        }
+        for future in as_completed(futures):
+            job_id = futures[future]
+            job = manifest.jobs[job_id]
+            print(
+                f"{job_id} {job['status']}: {job['num_api_calls']} LLM calls, "
+                f"{job['num_tokens']} tokens, {job['wall_time']:.0f}s"
+                + (f" ({job['error']})" if job["error"] else "")
+            )
+            if future.result() is not None:
+                eval_futures.append(future.result())
+    for future in eval_futures:
+        future.result()
+    if eval_executor is not None:
+        eval_executor.shutdown()
+
+
+if __name__ == "__main__":
+    # python orchestrate.py gpt-4-1106-preview gpt-3.5-turbo-1106 --games catcher pong
+    args = get_args()
+    if args.max_in_flight is not None or args.rpm is not None or args.tpm is not None:
+        # every job shares the process-wide engine, so these limits hold for the batch
+        rate_limits = {}
+        for model in args.models:
+            limit = dict(DEFAULT_RATE_LIMITS.get(model, FALLBACK_RATE_LIMIT))
+            if args.rpm is not None:
+                limit["rpm"] = args.rpm
+            if args.tpm is not None:
+                limit["tpm"] = args.tpm
+            rate_limits[model] = limit
+        engine_kwargs = {"rate_limits": rate_limits}
+        if args.max_in_flight is not None:
+            engine_kwargs["max_concurrency"] = args.max_in_flight
+        get_engine(**engine_kwargs)
+
+    games = args.games if args.games is not None else list_games()
+    manifest = Manifest(args.manifest)
+    job_ids = [
+        manifest.add(game, model, trial)
+        for model in args.models
+        for game in games
+        for trial in range(args.num_trials)
+    ]
+    manifest.save()
+    trial_args = {
+        "FRAME_BUDGET_MS": args.frame_budget_ms,
+        "MAX_FRAME_BUDGET_MS": args.max_frame_budget_ms,
+        "CONTEXT_TOKEN_BUDGET": args.context_token_budget,
+    }
+    run_batch(
+        manifest, job_ids, args.num_workers, not args.no_eval, args.retry_failed, trial_args
+    )
+
+    for model in args.models:
+        for game in games:
+            accs = [
+                manifest.jobs[f"{model}/{game}/{trial}"]["acc"]
+                for trial in range(args.num_trials)
+            ]
+            accs = [acc for acc in accs if acc is not None]
+            if accs:
+                print(f"{model} {game}: mean acc {sum(accs) / len(accs):.2f} over {len(accs)} trials")
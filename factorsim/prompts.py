@@ -377,3 +377,10 @@ Here are the dos and don'ts for this request:
 - Do not call pygame.display.set_mode in UI functions. Only call it once outside of any UI function that is called multiple times.
 - Do not leave any code incomplete. Do not leave placeholder values. Do not provide demonstration code implementation. Be sure all code is fully implemented.
 """
+
+too_slow_feedback_prompt = """
+
+A previous implementation of this feature was rejected because it made the game too slow: a frame took {mean_frame_ms:.2f} ms on average and up to {max_frame_ms:.2f} ms, while the budget is {budget}.
+Most of the time was spent in the {function_kind} function `{function_name}` ({share:.0%} of the frame time, {function_mean_ms:.3f} ms per call on average and up to {function_max_ms:.3f} ms).
+Please keep the work done every frame small, e.g. avoid nested loops over all objects, repeated expensive computations and creating large objects in every frame.
+"""
@@ -0,0 +1,149 @@
+import contextlib
+import importlib
+import io
+import linecache
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import threading
+import traceback
+
+
+PRELOAD_MODULES = ["pygame", "numpy", "math", "random"]
+
+
+def _worker_main(conn, memory_limit):
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    for module in PRELOAD_MODULES:
+        importlib.import_module(module)
+
+    while True:
+        code = conn.recv()
+        if code is None:
+            break
+        # keep the source around so that tracebacks show the offending lines
+        filename = f"<generated-{os.getpid()}>"
+        linecache.cache[filename] = (len(code), None, code.splitlines(True), filename)
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                exec(compile(code, filename, "exec"), {"__name__": "__main__"})
+            except SystemExit:
+                pass
+            except BaseException:
+                # drop the frame of this loop from the reported traceback
+                exc_type, exc, tb = sys.exc_info()
+                traceback.print_exception(exc_type, exc, tb.tb_next)
+            finally:
+                # do not leak a display or mixer into the next job
+                if "pygame" in sys.modules:
+                    sys.modules["pygame"].quit()
+        conn.send((stdout.getvalue(), stderr.getvalue()))
+
+
+class _Worker:
+    def __init__(self, ctx, memory_limit):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child_conn, memory_limit), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.num_jobs = 0
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+            self.process.join(timeout=1)
+        except (BrokenPipeError, OSError):
+            pass
+        self.kill()
+
+
+class SandboxPool:
+    """
+    A pool of warm worker processes that run generated game code.
+
+    Workers are forked from a server process that has already imported pygame and numpy,
+    so a job only pays for executing the code itself. Each worker runs under an address
+    space limit, a job that exceeds its timeout gets its worker killed, and workers are
+    recycled after `max_jobs_per_worker` jobs or when they crash.
+    """
+
+    def __init__(
+        self,
+        num_workers=None,
+        max_jobs_per_worker=50,
+        timeout=10,
+        memory_limit=4 << 30,
+    ):
+        if num_workers is None:
+            num_workers = min(8, os.cpu_count() or 1)
+        self.num_workers = num_workers
+        self.timeout = timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.memory_limit = memory_limit
+
+        # the fork server imports pygame (and the calling script) once, so workers do not
+        # re-import them; keep the pygame banner out of our output
+        os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+        self.ctx = multiprocessing.get_context("forkserver")
+        self.ctx.set_forkserver_preload(["__main__", "sandbox"] + PRELOAD_MODULES)
+        self.idle_workers = queue.Queue()
+        for _ in range(num_workers):
+            self.idle_workers.put(_Worker(self.ctx, self.memory_limit))
+
+    def run(self, code, timeout=None):
+        """Runs `code` as __main__ in a worker and returns (stdout, stderr) like run_code."""
+        timeout = self.timeout if timeout is None else timeout
+        worker = self.idle_workers.get()
+        retire = False
+        try:
+            worker.conn.send(code)
+            if worker.conn.poll(timeout):
+                stdout, stderr = worker.conn.recv()
+                worker.num_jobs += 1
+                retire = worker.num_jobs >= self.max_jobs_per_worker
+            else:
+                stdout, stderr = None, "The code took too long to execute."
+                retire = True
+        except (EOFError, OSError):
+            worker.process.join(timeout=1)
+            stdout = ""
+            stderr = f"The code crashed the interpreter (exit code {worker.process.exitcode})."
+            retire = True
+        finally:
+            if retire:
+                worker.kill()
+                worker = _Worker(self.ctx, self.memory_limit)
+            self.idle_workers.put(worker)
+        return stdout, stderr
+
+    def close(self):
+        while not self.idle_workers.empty():
+            self.idle_workers.get().stop()
+
+
+_sandbox = None
+_sandbox_lock = threading.Lock()
+
+
+def get_sandbox(**kwargs):
+    """Returns the process-wide sandbox pool, creating it on first use."""
+    global _sandbox
+    with _sandbox_lock:
+        if _sandbox is None:
+            _sandbox = SandboxPool(**kwargs)
+    return _sandbox
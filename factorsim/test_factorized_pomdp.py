@@ -0,0 +1,84 @@
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from factorized_pomdp import GameRep, CandidateCancelled
+from llm_cache import LLMCache
+
+
+def slow_request(seconds, content):
+    # stands in for an LLM request on the engine
+    time.sleep(seconds)
+    return content
+
+
+class TestWaitFor(unittest.TestCase):
+    def setUp(self):
+        self.log_dir = tempfile.TemporaryDirectory()
+        self.game = GameRep(log_dir=self.log_dir.name, cache=LLMCache(mode="off"))
+        self.game.cancel_event = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        self.log_dir.cleanup()
+
+    def test_slow_request(self):
+        # several polling intervals pass before the response arrives
+        future = self.executor.submit(slow_request, 0.5, "response")
+        self.assertEqual(self.game.wait_for(future), "response")
+
+    def test_cancelled_while_waiting(self):
+        future = self.executor.submit(slow_request, 0.5, "response")
+        threading.Timer(0.2, self.game.cancel_event.set).start()
+        with self.assertRaises(CandidateCancelled):
+            self.game.wait_for(future)
+
+
+class TestRetryFeedback(unittest.TestCase):
+    def setUp(self):
+        self.log_dir = tempfile.TemporaryDirectory()
+        self.game = GameRep(log_dir=self.log_dir.name, cache=LLMCache(mode="off"))
+
+    def tearDown(self):
+        self.log_dir.cleanup()
+
+    def test_budget_names_only_the_set_limits(self):
+        def measure_frame_time():
+            # 12 ms mean and 30 ms worst frame, mostly spent in one state transition
+            self.game.frame_time_ms = (12.0, 30.0)
+            return True, [
+                ("frame", "frame", 1.2, 100, 0.03),
+                ("state_transition", "move_paddle", 0.9, 100, 0.02),
+            ]
+
+        self.game.measure_frame_time = measure_frame_time
+        for frame_budget_ms, max_frame_budget_ms, budget in [
+            (10, None, "10 ms on average."),
+            (None, 20.5, "20.5 ms at most."),
+            (10, 20.5, "10 ms on average and 20.5 ms at most."),
+        ]:
+            self.game.frame_budget_ms = frame_budget_ms
+            self.game.max_frame_budget_ms = max_frame_budget_ms
+            feedback = self.game.check_frame_time()
+            self.assertIn(f"the budget is {budget}", feedback)
+            self.assertNotIn("None", feedback)
+
+    def test_feedback_only_reaches_the_next_attempt(self):
+        def fail(*args):
+            raise ValueError("not the frame time")
+
+        self.game.state_change = fail
+        self.game.queries.append({"query": "add a paddle"})
+        self.game.retry_feedback = "too slow"
+        list(self.game.attempt_query("add a paddle"))
+        self.assertEqual(self.game.add_feedback("query"), "querytoo slow")
+        # this attempt failed for another reason, so the next one gets no feedback
+        list(self.game.attempt_query("add a paddle"))
+        self.assertEqual(self.game.add_feedback("query"), "query")
+
+
+if __name__ == "__main__":
+    # python test_factorized_pomdp.py  (from factorsim/)
+    unittest.main()
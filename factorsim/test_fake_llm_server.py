@@ -0,0 +1,106 @@
+import tempfile
+import unittest
+from fake_llm_server import FakeLLMServer
+from factorized_pomdp import GameRep
+from llm_cache import LLMCache
+from llm_engine import LLMEngine
+from utils import add_initial_states, num_tokens_from_string
+
+# a canned answer for every prompt of one query, picked by a phrase of the prompt
+RESPONSES = {
+    "compile a list of relevant state variables": {
+        "relevant_state_variables": [{"variable_name": "score"}],
+        "new_state_variables": [
+            {
+                "variable_description": "vertical position of the paddle",
+                "variable_name": "paddle_y",
+                "variable_type": "int",
+                "variable_value": "100",
+            }
+        ],
+    },
+    "decomposing it into the three types": {
+        "input_logic": {"description": "move the paddle", "function_name": "handle_keys"},
+        "state_transition": {"description": "keep it on screen", "function_name": "clamp_paddle"},
+        "ui_rendering": {"description": "draw the paddle", "function_name": "draw_paddle"},
+    },
+    "detect key/mouse input": {
+        "function_name": "handle_keys",
+        "function_description": "move the paddle",
+        "function_implementation": (
+            "def handle_keys(state_manager, event):\n"
+            "    if event.type == pygame.KEYDOWN:\n"
+            "        state_manager.paddle_y += 10\n"
+        ),
+    },
+    "define and code new state transition functions": {
+        "function_name": "clamp_paddle",
+        "function_description": "keep the paddle on screen",
+        "function_implementation": (
+            "def clamp_paddle(state_manager):\n"
+            "    state_manager.paddle_y = state_manager.paddle_y % 900\n"
+        ),
+    },
+    "add rendering functions": {
+        "function_name": "draw_paddle",
+        "function_description": "draw the paddle",
+        "function_implementation": (
+            "def draw_paddle(state_manager):\n"
+            "    pygame.draw.rect(state_manager.screen, (0, 0, 255), (10, state_manager.paddle_y, 10, 40))\n"
+        ),
+    },
+}
+
+
+def respond(body):
+    prompt = body["messages"][-1]["content"]
+    for phrase, response in RESPONSES.items():
+        if phrase in prompt:
+            return response
+    raise Exception(f"fake server failed - no canned response for: {prompt[:80]}")
+
+
+def has_token_counts():
+    # the engine counts tokens with tiktoken, which downloads its encoding on first use
+    try:
+        num_tokens_from_string("paddle")
+        return True
+    except Exception:
+        return False
+
+
+@unittest.skipUnless(has_token_counts(), "needs the tiktoken encoding")
+class TestFakeLLMServer(unittest.TestCase):
+    def setUp(self):
+        self.log_dir = tempfile.TemporaryDirectory()
+        # the first request is rate limited, so the engine has to back off once
+        self.server = FakeLLMServer(respond, num_failures=1, failure_status=429).start()
+        self.engine = LLMEngine(base_url=self.server.base_url, api_key="fake", max_retries=2)
+        self.game = GameRep(
+            MAX_RETRIES=1,
+            log_dir=self.log_dir.name,
+            model="gpt-4-1106-preview",
+            engine=self.engine,
+            cache=LLMCache(mode="off"),
+        )
+        add_initial_states(self.game)
+
+    def tearDown(self):
+        self.engine.close()
+        self.server.stop()
+        self.log_dir.cleanup()
+
+    def test_process_user_query(self):
+        list(self.game.process_user_query("a paddle that moves up and down"))
+        self.assertTrue(self.game.last_pass_check)
+        self.assertEqual(self.game.query_idx, 1)
+        code = self.game.export_code()
+        for name in ["handle_keys", "clamp_paddle", "draw_paddle", "paddle_y"]:
+            self.assertIn(name, code)
+        # every call of the game was answered, plus the rejected one
+        self.assertEqual(self.server.num_requests, self.game.num_api_calls + 1)
+
+
+if __name__ == "__main__":
+    # python test_fake_llm_server.py  (from factorsim/)
+    unittest.main()
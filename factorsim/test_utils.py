@@ -0,0 +1,87 @@
+import ast
+import glob
+import re
+import unittest
+from utils import analyze_code, extract_variables_with_regex
+
+GAMES_DIR = "./games/single_player_games"
+
+
+def game_functions():
+    # the top-level functions of the shipped games, written like generated ones
+    functions = []
+    for path in sorted(glob.glob(f"{GAMES_DIR}/*/mdp.py")):
+        with open(path, "r") as f:
+            source = f.read()
+        for node in ast.parse(source).body:
+            if isinstance(node, ast.FunctionDef):
+                functions.append((f"{path}:{node.name}", ast.get_source_segment(source, node)))
+    return functions
+
+
+def old_function_name_and_args(code):
+    # the regular expression extract_function_name_and_args used before analyze_code
+    match = re.search(r"def\s+(\w+)\s*\((.*?)\):", code)
+    return match.group(1), tuple(arg.strip() for arg in match.group(2).split(","))
+
+
+def old_loaded_names(code):
+    # the names the old extract_variables visitor collected
+    return {
+        node.id
+        for node in ast.walk(ast.parse(code))
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id != "self"
+    }
+
+
+def bound_names(code):
+    names = set()
+    for node in ast.walk(ast.parse(code)):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+    return names
+
+
+class TestAnalyzeCode(unittest.TestCase):
+    def test_shipped_games(self):
+        functions = game_functions()
+        self.assertGreater(len(functions), 0)
+        for name, code in functions:
+            with self.subTest(name):
+                analysis = analyze_code(code)
+                self.assertIsNone(analysis.syntax_error)
+                self.assertEqual((analysis.name, analysis.args), old_function_name_and_args(code))
+                self.assertEqual(
+                    analysis.state_names, tuple(sorted(set(extract_variables_with_regex(code))))
+                )
+                # the old helper also returned the names bound in the function
+                self.assertEqual(
+                    set(analysis.free_names), old_loaded_names(code) - bound_names(code)
+                )
+
+    def test_lambda_and_comprehension_parameters(self):
+        code = (
+            "def spawn(state_manager, *rows, **options):\n"
+            "    key = lambda alien, *rest: alien['x'] + offset\n"
+            "    state_manager.aliens = sorted([{'x': i} for i in range(rows[0])], key=key)\n"
+            "    state_manager.speeds = {name: value for name, value in options.items()}\n"
+        )
+        analysis = analyze_code(code)
+        self.assertEqual(analysis.free_names, frozenset({"offset", "sorted", "range"}))
+        self.assertEqual(analysis.writes, frozenset({"aliens", "speeds"}))
+
+    def test_results_are_immutable(self):
+        # analyses are shared through the cache, callers must not be able to change them
+        code = "def advance(state_manager):\n    state_manager.x = state_manager.y\n"
+        analysis = analyze_code(code)
+        self.assertIs(analyze_code(code), analysis)
+        self.assertEqual(analysis.state_names, ("x", "y"))
+        for value in [analysis.reads, analysis.writes, analysis.state_names, analysis.free_names]:
+            self.assertIsInstance(value, (tuple, frozenset))
+
+
+if __name__ == "__main__":
+    # python test_utils.py  (from factorsim/)
+    unittest.main()
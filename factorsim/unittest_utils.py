@@ -1,5 +1,6 @@
 import unittest
 import json
+import os
 
 
 class JsonTestResult(unittest.TextTestResult):
@@ -50,6 +51,10 @@ class JsonTestRunner(unittest.TextTestRunner):
 
     def run(self, test):
         result = super().run(test)
-        with open(f"{self.game_name}_test_results.json", "w") as f:
+        # the evaluation harness gives every job its own result file
+        output_path = os.environ.get(
+            "FACTORSIM_TEST_RESULTS", f"{self.game_name}_test_results.json"
+        )
+        with open(output_path, "w") as f:
             json.dump(result.test_results, f, indent=4)
         return result
@@ -1,7 +1,7 @@
 import json
 import sys
-import signal
 import ast
+import functools
 import importlib.util
 import os
 import random
@@ -90,31 +90,26 @@ def extract_error_location(code, traceback_str):
 
 
 def run_code(code, timeout=10):
-    # Timeout handler function
-    def timeout_handler(signum, frame):
-        raise TimeoutError
-    try:
-        signal.signal(signal.SIGALRM, timeout_handler)
-        signal.alarm(timeout)
-
-        code = "import os\n" + 'os.environ["SDL_VIDEODRIVER"] = "dummy"\n' + code
-        # Create a temporary Python file to store the code
-        with tempfile.NamedTemporaryFile(suffix=".py", delete=False, mode="w") as tmp_file:
-            tmp_file_name = tmp_file.name
-            tmp_file.write(code)
-
-        # Run the Python script using subprocess
-        result = subprocess.run(["python", tmp_file_name], capture_output=True, text=True)
-
-        # Capture stdout and stderr
-        stdout = result.stdout
-        stderr = result.stderr
+    code = "import os\n" + 'os.environ["SDL_VIDEODRIVER"] = "dummy"\n' + code
+    # Create a temporary Python file to store the code
+    with tempfile.NamedTemporaryFile(suffix=".py", delete=False, mode="w") as tmp_file:
+        tmp_file_name = tmp_file.name
+        tmp_file.write(code)
 
-        signal.alarm(0)
-        return stdout, stderr
-
-    except TimeoutError:
+    # subprocess' own timeout (unlike signal.alarm) also works outside the main thread
+    try:
+        result = subprocess.run(
+            ["python", tmp_file_name], capture_output=True, text=True, timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
         return None, "The code took too long to execute."
+    finally:
+        os.remove(tmp_file_name)
+
+    # Capture stdout and stderr
+    stdout = result.stdout
+    stderr = result.stderr
+    return stdout, stderr
 
 
 def code_compilable(code):
@@ -126,34 +121,26 @@ def code_compilable(code):
         return False
 
 
+@functools.lru_cache(maxsize=4096)
+def fragment_compilable(fragment):
+    """code_compilable for one top-level fragment of a program, memoized by content."""
+    return code_compilable(fragment)
+
+
 def extract_function_name_and_args(func_str):
-    pattern = r"def\s+(\w+)\s*\((.*?)\):"
-    match = re.search(pattern, func_str)
-    if match:
-        function_name = match.group(1)
-        args = match.group(2).split(",")
-        return function_name, args
-    else:
+    analysis = analyze_code(func_str)
+    if analysis.name is None:
         return None, None
+    return analysis.name, list(analysis.args)
 
 
 def extract_variables(code):
-    class VariableVisitor(ast.NodeVisitor):
-        def __init__(self):
-            self.variables = []
-
-        def visit_Name(self, node):
-            # Include only variables (excluding 'self' and not built-in functions)
-            if isinstance(node.ctx, ast.Load) and node.id != "self":
-                self.variables.append(node.id)
-
-    # Parse the code to an AST
-    tree = ast.parse(code)
-    visitor = VariableVisitor()
-    visitor.visit(tree)
-
-    # Filter out duplicates and sort variables by length in descending order to avoid partial replacement issues
-    unique_variables = sorted(set(visitor.variables), key=len, reverse=True)
+    # Variables read by the code, sorted by length in descending order to avoid partial
+    # replacement issues; raises SyntaxError like ast.parse
+    analysis = analyze_code(code)
+    if analysis.syntax_error is not None:
+        raise SyntaxError(analysis.syntax_error)
+    unique_variables = sorted(analysis.free_names, key=len, reverse=True)
     list_to_not_include = [
         "int",
         "float",
@@ -173,40 +160,10 @@ def check_function_for_state_change(function_string):
     Parses a given Python function in string format to determine if any
     attributes of a 'state_manager' object are being modified.
     """
-    # Parse the function string into an AST (Abstract Syntax Tree)
-    try:
-        tree = ast.parse(function_string)
-    except SyntaxError:
+    analysis = analyze_code(function_string)
+    if analysis.syntax_error is not None:
         return "The function string contains syntax errors."
-
-    # Define a visitor class to inspect assignments
-    class StateManagerAssignVisitor(ast.NodeVisitor):
-        def __init__(self):
-            self.modifies_state_manager = False
-
-        def visit_Assign(self, node):
-            # Check if the left side of the assignment is an attribute of state_manager
-            for target in node.targets:
-                if isinstance(target, ast.Attribute) and isinstance(
-                    target.value, ast.Name
-                ):
-                    if target.value.id == "state_manager":
-                        self.modifies_state_manager = True
-
-        def visit_AugAssign(self, node):
-            # Check if the target of the augmented assignment is an attribute of state_manager
-            if isinstance(node.target, ast.Attribute) and isinstance(
-                node.target.value, ast.Name
-            ):
-                if node.target.value.id == "state_manager":
-                    self.modifies_state_manager = True
-
-    # Create an instance of the visitor and walk the AST
-    visitor = StateManagerAssignVisitor()
-    visitor.visit(tree)
-
-    # Return the result
-    return visitor.modifies_state_manager
+    return not analysis.pure
 
 
 def find_node_and_parents_at_line(node, line, name, parents=None):
@@ -362,10 +319,135 @@ class StateManagerVariableExtractor(ast.NodeVisitor):
 
 
 def extract_modified_state_manager_variables(func_str):
-    tree = ast.parse(func_str)
-    extractor = StateManagerVariableExtractor()
-    extractor.visit(tree)
-    return extractor.accessed_variables, extractor.modified_variables
+    analysis = analyze_code(func_str)
+    if analysis.syntax_error is not None:
+        raise SyntaxError(analysis.syntax_error)
+    return set(analysis.state_names), set(analysis.writes)
+
+
+class CodeAnalysis:
+    """
+    What the generation loop needs to know about one code fragment, see analyze_code.
+
+    name, args: the first function defined in the fragment (None, () if there is none).
+    reads, writes: `state_manager` attributes that are read / assigned to (the targets
+    of =, +=, for and annotated assignments, as in StateManagerVariableExtractor).
+    state_names: sorted reads and writes.
+    free_names: names that are read but not bound in the fragment (except `self`);
+    assignment, loop and comprehension targets and the parameters of functions and
+    lambdas are bound.
+    All of them are immutable, analyses are shared through the analyze_code cache.
+    pure: the fragment does not assign to `state_manager` attributes.
+    syntax_error: the parser message if the fragment does not parse, in which case name,
+    args and reads come from the old regular expressions.
+    """
+
+    def __init__(self, name, args, reads, writes, free_names, syntax_error=None):
+        self.name = name
+        self.args = args
+        self.reads = frozenset(reads)
+        self.writes = frozenset(writes)
+        self.state_names = tuple(sorted(self.reads | self.writes))
+        self.free_names = frozenset(free_names)
+        self.pure = syntax_error is None and len(writes) == 0
+        self.syntax_error = syntax_error
+
+
+class CodeAnalyzer(ast.NodeVisitor):
+    # collects everything CodeAnalysis holds in one walk over the tree
+    def __init__(self):
+        self.name = None
+        self.args = ()
+        self.reads = set()
+        self.writes = set()
+        self.loaded_names = set()
+        self.bound_names = {"self"}
+
+    def visit_FunctionDef(self, node):
+        if self.name is None:
+            self.name = node.name
+            self.args = tuple(arg.arg for arg in node.args.args)
+        self.bound_names.add(node.name)
+        self.bind_arguments(node.args)
+        self.generic_visit(node)
+
+    def visit_Lambda(self, node):
+        self.bind_arguments(node.args)
+        self.generic_visit(node)
+
+    def bind_arguments(self, arguments):
+        for arg in arguments.posonlyargs + arguments.args + arguments.kwonlyargs:
+            self.bound_names.add(arg.arg)
+        for arg in [arguments.vararg, arguments.kwarg]:
+            if arg is not None:
+                self.bound_names.add(arg.arg)
+
+    def visit_Attribute(self, node):
+        if isinstance(node.value, ast.Name) and node.value.id == "state_manager":
+            if isinstance(node.ctx, ast.Load):
+                self.reads.add(node.attr)
+        self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.loaded_names.add(node.id)
+        else:
+            self.bound_names.add(node.id)
+
+    def visit_Assign(self, node):
+        self.add_writes(node.targets)
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node):
+        # x += 1 reads x as well
+        self.add_writes([node.target])
+        if self.is_state(node.target):
+            self.reads.add(node.target.attr)
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node):
+        self.add_writes([node.target])
+        self.generic_visit(node)
+
+    def visit_For(self, node):
+        self.add_writes([node.target])
+        self.generic_visit(node)
+
+    def is_state(self, node):
+        return (
+            isinstance(node, ast.Attribute)
+            and isinstance(node.value, ast.Name)
+            and node.value.id == "state_manager"
+        )
+
+    def add_writes(self, targets):
+        for target in targets:
+            if self.is_state(target):
+                self.writes.add(target.attr)
+
+
+@functools.lru_cache(maxsize=4096)
+def analyze_code(code):
+    """
+    Parses `code` once and returns its CodeAnalysis. Memoized by content, so the
+    implementation of a function is analyzed a single time however often it is checked.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        match = re.search(r"def\s+(\w+)\s*\((.*?)\):", code)
+        name, args = (match.group(1), tuple(match.group(2).split(","))) if match else (None, ())
+        reads = set(extract_variables_with_regex(code))
+        return CodeAnalysis(name, args, reads, set(), set(), syntax_error=str(e))
+    analyzer = CodeAnalyzer()
+    analyzer.visit(tree)
+    return CodeAnalysis(
+        analyzer.name,
+        analyzer.args,
+        analyzer.reads,
+        analyzer.writes,
+        analyzer.loaded_names - analyzer.bound_names,
+    )
 
 
 def modify_python_code_for_pygbag(input_code):
@@ -396,23 +478,21 @@ def write_file_for_pygbag(game):
 
 def add_initial_states(game):
     from factorized_pomdp import StateVariable
-    game.states.extend(
-        [
-            StateVariable(
-                name="score",
-                value=0,
-                variable_type="int",
-                description="the score of the (human) player",
-                dont_clean=True,
-            ),
-            StateVariable(
-                name="game_over",
-                value=False,
-                variable_type="bool",
-                description="a boolean variable indicating whether the game has ended or not",
-                dont_clean=True,
-            ),
-        ]
+    game.states = game.states + (
+        StateVariable(
+            name="score",
+            value=0,
+            variable_type="int",
+            description="the score of the (human) player",
+            dont_clean=True,
+        ),
+        StateVariable(
+            name="game_over",
+            value=False,
+            variable_type="bool",
+            description="a boolean variable indicating whether the game has ended or not",
+            dont_clean=True,
+        ),
     )
 
 
@@ -424,25 +504,33 @@ def ask_llm(
     mistral_model=None,
     MAX_RETRIES=10,
     client=None,
+    cache=None,
 ):
-    for _ in range(MAX_RETRIES):
+    for sample in range(MAX_RETRIES):
         if "gpt" in model:
             try:
-                completion = client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "You are a Pygame coder. Your response should be in JSON format.",
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt,
-                        },
-                    ],
-                    response_format={"type": "json_object"},
-                )
-                responses = json.loads(completion.choices[0].message.content)
+                system = "You are a Pygame coder. Your response should be in JSON format."
+                params = {"response_format": {"type": "json_object"}}
+                content = cache.get(model, system, prompt, params, sample) if cache else None
+                if content is None:
+                    completion = client.chat.completions.create(
+                        model=model,
+                        messages=[
+                            {
+                                "role": "system",
+                                "content": system,
+                            },
+                            {
+                                "role": "user",
+                                "content": prompt,
+                            },
+                        ],
+                        **params,
+                    )
+                    content = completion.choices[0].message.content
+                    if cache:
+                        cache.put(model, system, prompt, content, params, sample)
+                responses = json.loads(content)
                 if key == "code":
                     code = responses["code"]
                     if code.startswith("```python"):
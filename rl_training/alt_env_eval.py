@@ -0,0 +1,144 @@
+import os
+import numpy as np
+import ray
+from ray.rllib.algorithms.callbacks import DefaultCallbacks
+from ray.rllib.policy import Policy
+from ray.util.scheduling_strategies import PlacementGroupSchedulingStrategy
+from prepare_ple_env import ple_env_creator
+
+# env_config entries that apply to the PLE game as well
+PLE_CONFIG_KEYS = ["name", "frame_skip", "obs_dtype", "obs_type", "frame_stack"]
+# the evaluator plays its envs and runs the policy on one CPU
+EVALUATOR_NUM_CPUS = 1
+
+
+class AltEnvEvaluator:
+    """
+    Evaluates a copy of the training policy on the original PLE game.
+
+    A pool of `num_envs` PLE envs is stepped in lockstep so that every step needs a
+    single batched `compute_actions` call; recurrent policies get the state and previous
+    action of every env, reset with its episode. Runs as a Ray actor next to the trainer, so
+    the rollout workers never wait for an evaluation.
+    """
+
+    def __init__(self, env_config, policy_state, num_envs=5):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        self.envs = [ple_env_creator(dict(env_config)) for _ in range(num_envs)]
+        self.policy = Policy.from_state(policy_state)
+
+    def initial_state(self, num_rows):
+        state = self.policy.get_initial_state()
+        if isinstance(state, dict):
+            state = list(state.values())
+        return [np.stack([s] * num_rows) for s in state]
+
+    def evaluate(self, weights, num_episodes=5):
+        self.policy.set_weights(weights)
+        num_envs = len(self.envs)
+        observations = [None] * num_envs
+        episode_rewards = np.zeros(num_envs)
+        prev_actions = np.zeros(num_envs, dtype=np.int64)
+        states = self.initial_state(num_envs)
+        use_lstm = len(states) > 0
+
+        # every env plays episodes until num_episodes have been started
+        active = []
+        num_started = 0
+        for index, env in enumerate(self.envs):
+            if num_started == num_episodes:
+                break
+            observations[index], _ = env.reset()
+            active.append(index)
+            num_started += 1
+
+        total_reward = 0.0
+        while active:
+            obs_batch = np.stack([observations[index] for index in active])
+            if use_lstm:
+                actions, state_outs, _ = self.policy.compute_actions(
+                    obs_batch,
+                    state_batches=[state[active] for state in states],
+                    prev_action_batch=prev_actions[active],
+                )
+                for state, state_out in zip(states, state_outs):
+                    state[active] = state_out
+            else:
+                actions, _, _ = self.policy.compute_actions(obs_batch)
+            prev_actions[active] = actions
+
+            still_active = []
+            for index, action in zip(active, actions):
+                observations[index], reward, done, _, _ = self.envs[index].step(action)
+                episode_rewards[index] += reward
+                if not done:
+                    still_active.append(index)
+                    continue
+                total_reward += episode_rewards[index]
+                episode_rewards[index] = 0.0
+                if num_started < num_episodes:
+                    observations[index], _ = self.envs[index].reset()
+                    prev_actions[index] = 0
+                    for state, initial in zip(states, self.initial_state(1)):
+                        state[index] = initial[0]
+                    still_active.append(index)
+                    num_started += 1
+            active = still_active
+
+        return total_reward / num_episodes
+
+
+def start_evaluator(env_config, policy_state, num_envs):
+    """
+    Starts an AltEnvEvaluator actor. Tune captures the actors a trial creates into the
+    trial's placement group, whose bundles are all taken by the trainer and the rollout
+    workers, so the evaluator would never be scheduled there; it is placed outside it.
+    """
+    return (
+        ray.remote(AltEnvEvaluator)
+        .options(
+            num_cpus=EVALUATOR_NUM_CPUS,
+            scheduling_strategy=PlacementGroupSchedulingStrategy(placement_group=None),
+        )
+        .remote(env_config, policy_state, num_envs)
+    )
+
+
+class AltEnvEvalCallback(DefaultCallbacks):
+    """
+    Reports the average reward of the policy on the original PLE game as
+    custom_metrics/alt_env_avg_reward_mean.
+
+    Every `alt_env_eval_interval` training iterations (env_config) the current weights are
+    sent to an AltEnvEvaluator actor. The result is attached to the first training result
+    after it finishes, and no new evaluation starts while one is still running.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.evaluator = None
+        self.pending = None
+        self.avg_reward = None
+
+    def on_train_result(self, *, algorithm, result, **kwargs):
+        env_config = algorithm.config.env_config
+        interval = env_config.get("alt_env_eval_interval", 1)
+        num_episodes = env_config.get("alt_env_eval_episodes", 5)
+
+        if self.pending is not None:
+            ready, _ = ray.wait([self.pending], timeout=0)
+            if ready:
+                self.avg_reward = ray.get(self.pending)
+                self.pending = None
+
+        if self.pending is None and result["training_iteration"] % interval == 0:
+            policy = algorithm.get_policy()
+            if self.evaluator is None:
+                # the PLE game is observed and controlled like the training envs
+                ple_config = {key: env_config[key] for key in PLE_CONFIG_KEYS if key in env_config}
+                self.evaluator = start_evaluator(ple_config, policy.get_state(), num_episodes)
+            self.pending = self.evaluator.evaluate.remote(policy.get_weights(), num_episodes)
+
+        if self.avg_reward is not None:
+            # same key the per-episode metric used to be aggregated into
+            result.setdefault("custom_metrics", {})["alt_env_avg_reward_mean"] = self.avg_reward
@@ -24,6 +24,58 @@ def get_cli_args():
         default=0,
         help="Number of workers to use for sample collection. Setting it zero will use same worker for collection and model training.",
     )
+    parser.add_argument(
+        "--num_envs",
+        type=int,
+        default=1,
+        help="Number of generated games stepped together in one process as a vectorized env.",
+    )
+    parser.add_argument(
+        "--no_render",
+        action="store_true",
+        help="If enabled, generated games only advance their state during training and draw frames only on request.",
+    )
+    parser.add_argument(
+        "--frame_skip",
+        type=int,
+        default=1,
+        help="Number of frames every action is repeated for, in the generated games and the PLE game.",
+    )
+    parser.add_argument(
+        "--obs_dtype",
+        choices=["float64", "float32"],
+        default="float64",
+        help="dtype of the observation vectors.",
+    )
+    parser.add_argument(
+        "--shared_obs",
+        action="store_true",
+        help="If enabled, envs write observations into a preallocated shared-memory ring instead of allocating one array per step.",
+    )
+    parser.add_argument(
+        "--obs_type",
+        choices=["state", "pixels"],
+        default="state",
+        help="Observe the state vector or stacked downsampled frames of the game screen.",
+    )
+    parser.add_argument(
+        "--frame_stack",
+        type=int,
+        default=4,
+        help="Number of frames stacked into a pixel observation.",
+    )
+    parser.add_argument(
+        "--alt_env_eval_interval",
+        type=int,
+        default=1,
+        help="Evaluate the policy on the original PLE game every this many training iterations.",
+    )
+    parser.add_argument(
+        "--alt_env_eval_episodes",
+        type=int,
+        default=5,
+        help="Number of PLE episodes per evaluation, played on as many envs in parallel.",
+    )
     parser.add_argument(
         "--num_gpus",
         type=int,
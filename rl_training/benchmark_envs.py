@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import psutil
+from randomize_env import env_creator, get_env_list
+from prepare_ple_env import ple_env_creator
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Measure the throughput of PLE and generated envs")
+    parser.add_argument("games", nargs="+", help="e.g. catcher pong")
+    parser.add_argument(
+        "--version",
+        default=None,
+        help="version of the generated envs (e.g. v8_4), PLE only when omitted",
+    )
+    parser.add_argument("--method", choices=["ours", "baseline"], default="ours")
+    parser.add_argument("--num_steps", type=int, default=2000, help="steps per action trace")
+    parser.add_argument("--max_episode_steps", type=int, default=10000)
+    parser.add_argument("--render", action="store_true", help="draw every frame as in the default training setup")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None, help="results of an earlier run to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="relative drop in steps/sec against the baseline that counts as a regression",
+    )
+    parser.add_argument(
+        "--max_slowdown",
+        type=float,
+        default=50,
+        help="flag generated envs that are this many times slower than the PLE game",
+    )
+    return parser.parse_args()
+
+
+def action_traces(action_space, num_steps, seed=0):
+    # "random" samples the env's own action space, "fixed" is the same trace for every env
+    # of a game so that PLE and generated envs get identical inputs
+    action_space.seed(seed)
+    random_trace = [action_space.sample() for _ in range(num_steps)]
+    fixed_trace = np.random.RandomState(seed).randint(action_space.n, size=num_steps)
+    return {"random": random_trace, "fixed": list(fixed_trace)}
+
+
+def benchmark(env, actions):
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    step_times = []
+    reset_times = []
+
+    start = time.perf_counter()
+    env.reset()
+    reset_times.append(time.perf_counter() - start)
+    for action in actions:
+        start = time.perf_counter()
+        _, _, terminated, truncated, _ = env.step(action)
+        step_times.append(time.perf_counter() - start)
+        if terminated or truncated:
+            start = time.perf_counter()
+            env.reset()
+            reset_times.append(time.perf_counter() - start)
+
+    rss = process.memory_info().rss
+    step_times = np.array(step_times)
+    return {
+        "num_steps": len(step_times),
+        "num_resets": len(reset_times),
+        "steps_per_sec": len(step_times) / step_times.sum(),
+        "resets_per_sec": len(reset_times) / sum(reset_times),
+        "p50_step_ms": float(np.percentile(step_times, 50) * 1000),
+        "p99_step_ms": float(np.percentile(step_times, 99) * 1000),
+        "rss_mb": rss / 2**20,
+        "rss_delta_mb": (rss - rss_before) / 2**20,
+    }
+
+
+def benchmark_game(game, args):
+    """Returns {"<source>/<game>/<env id>/<trace>": metrics} for the PLE game and its generated envs."""
+    results = {}
+    ple_env = ple_env_creator({"name": game})
+    traces = action_traces(ple_env.action_space, args.num_steps)
+    for trace, actions in traces.items():
+        results[f"ple/{game}/ple/{trace}"] = benchmark(ple_env, actions)
+    ple_env.close()
+
+    if args.version is None:
+        return results
+
+    env_config = {
+        "name": game,
+        "method": args.method,
+        "version": args.version,
+        "max_episode_steps": args.max_episode_steps,
+        "render": args.render,
+    }
+    for env_id, game_class in get_env_list(dict(env_config)):
+        env = env_creator(dict(env_config, env_id=env_id, game_class=game_class))
+        for trace, actions in action_traces(env.action_space, args.num_steps).items():
+            metrics = benchmark(env, actions)
+            ple_metrics = results[f"ple/{game}/ple/{trace}"]
+            metrics["slowdown_vs_ple"] = ple_metrics["steps_per_sec"] / metrics["steps_per_sec"]
+            results[f"{args.method}/{game}/{env_id}/{trace}"] = metrics
+        env.close()
+    return results
+
+
+def compare(results, baseline, args):
+    """Returns a list of human readable problems, empty if everything is within bounds."""
+    problems = []
+    for key, metrics in sorted(results.items()):
+        if metrics.get("slowdown_vs_ple", 0) > args.max_slowdown:
+            problems.append(
+                f"{key}: {metrics['slowdown_vs_ple']:.1f}x slower than the PLE game"
+            )
+        if key in baseline:
+            old = baseline[key]["steps_per_sec"]
+            if metrics["steps_per_sec"] < old * (1 - args.tolerance):
+                problems.append(
+                    f"{key}: {metrics['steps_per_sec']:.0f} steps/sec, baseline {old:.0f}"
+                )
+    return problems
+
+
+if __name__ == "__main__":
+    # python benchmark_envs.py catcher pong --version v8_4 --baseline benchmark_baseline.json
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    args = get_args()
+
+    results = {}
+    for game in args.games:
+        results.update(benchmark_game(game, args))
+
+    print(f"{'env':60s} {'steps/s':>10s} {'resets/s':>10s} {'p50 ms':>8s} {'p99 ms':>8s} {'rss MB':>8s}")
+    for key, metrics in sorted(results.items()):
+        print(
+            f"{key:60s} {metrics['steps_per_sec']:10.0f} {metrics['resets_per_sec']:10.1f} "
+            f"{metrics['p50_step_ms']:8.3f} {metrics['p99_step_ms']:8.3f} {metrics['rss_mb']:8.1f}"
+        )
+
+    with open(args.output, "w") as f:
+        json.dump({"config": vars(args), "results": results}, f, indent=4)
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["results"]
+    problems = compare(results, baseline, args)
+    for problem in problems:
+        print(f"WARNING {problem}")
+    if problems:
+        sys.exit(1)
@@ -34,6 +34,7 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 from arguments import get_cli_args
 from randomize_env import env_creator
 from prepare_ple_env import ple_env_creator
+from alt_env_eval import AltEnvEvalCallback
 
 
 class CustomWandbLoggerCallback(WandbLoggerCallback):
@@ -43,51 +44,6 @@ class CustomWandbLoggerCallback(WandbLoggerCallback):
         super().on_episode_end(worker=worker, base_env=base_env, policies=policies,
                                episode=episode, env_index=env_index, **kwargs)
 
-class MyCustomCallback(DefaultCallbacks):
-    def __init__(self):
-        super().__init__()
-
-    def on_episode_end(
-        self,
-        *,
-        episode: Union[EpisodeType, Episode, EpisodeV2],
-        worker: Optional["EnvRunner"] = None,
-        env_runner: Optional["EnvRunner"] = None,
-        base_env: Optional[BaseEnv] = None,
-        env: Optional[gym.Env] = None,
-        policies: Optional[Dict[PolicyID, Policy]] = None,
-        rl_module: Optional[RLModule] = None,
-        env_index: int,
-        **kwargs,
-    ) -> None:
-        # Optionally, you can decide the frequency of evaluations
-        self.alt_env = ple_env_creator({"name": args.env_name})
-        assert len(policies) == 1
-        policy = policies["default_policy"]
-        total_reward = 0.0
-        num_episodes = 5
-
-        # Evaluate the policy on the alternative environment
-        for _ in range(num_episodes):
-            obs, _ = self.alt_env.reset()
-            state = policy.get_initial_state()
-            use_lstm = len(state.keys()) > 0
-            action = 0
-            done = False
-            episode_reward = 0.0
-            while not done:
-                if use_lstm:
-                    action, state, _ = policy.compute_single_action(obs, state, prev_action=action)
-                else:
-                    action, _, _ = policy.compute_single_action(obs)
-                obs, reward, done, _, _ = self.alt_env.step(action)
-                episode_reward += reward
-            total_reward += episode_reward
-
-        avg_reward = total_reward / num_episodes
-        # Add the average reward from the alternative environment to the result dict
-        episode.custom_metrics["alt_env_avg_reward"] = avg_reward
-
 
 if __name__ == "__main__":
     global args
@@ -129,14 +85,14 @@ if __name__ == "__main__":
     if args.algo == "ppo":
         trainer = "PPO"
         from ray.rllib.algorithms import ppo
-        default_config = ppo.PPOConfig().callbacks(MyCustomCallback)
+        default_config = ppo.PPOConfig().callbacks(AltEnvEvalCallback)
         configs, exp_config, tune_config = get_experiment_config(args, default_config, wandb_run_name=wandb_run_name)
 
     elif args.algo == 'dqn':
         trainer = "DQN"
         from ray.rllib.algorithms import dqn
         default_config = dqn.DQNConfig()
-        default_config["callbacks"] = MyCustomCallback
+        default_config["callbacks"] = AltEnvEvalCallback
         configs, exp_config, tune_config = get_experiment_config(args, default_config, wandb_run_name=wandb_run_name)
 
 
@@ -144,7 +100,7 @@ if __name__ == "__main__":
         trainer = "IMPALA"
         from ray.rllib.algorithms import impala
         default_config = impala.ImpalaConfig()
-        default_config["callbacks"] = MyCustomCallback
+        default_config["callbacks"] = AltEnvEvalCallback
         configs, exp_config, tune_config = get_experiment_config(args, default_config, wandb_run_name=wandb_run_name)
 
     elif args.algo == "icm":
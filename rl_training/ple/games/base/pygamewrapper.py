@@ -104,8 +104,8 @@ class PyGameWrapper(object):
 
         """
 
-        return pygame.surfarray.array3d(
-            pygame.display.get_surface()).astype(np.uint8)
+        # array3d already returns a uint8 copy
+        return pygame.surfarray.array3d(pygame.display.get_surface())
 
     def tick(self, fps):
         """
@@ -2,6 +2,9 @@ import sys
 import gymnasium as gym
 import numpy as np
 from ple import PLE
+from env_design.wrapped_envs.game_specs import get_game_spec
+from env_design.wrapped_envs.shared_obs import observation_dtype, make_observation_buffer
+from env_design.wrapped_envs.pixel_obs import make_pixel_observation
 
 
 class PLEPygameEnv(gym.Env):
@@ -12,125 +15,44 @@ class PLEPygameEnv(gym.Env):
         # Define action and observation space
         # They must be gym.spaces object
         self.env_name = config["name"]
-        self.max_episode_steps = 10000
-        if self.env_name == "flappy_bird":
-            from ple.games.flappybird import FlappyBird
-            self.game = FlappyBird()
-        elif self.env_name == "catcher":
-            from ple.games.catcher import Catcher
-            self.game = Catcher()
-        elif self.env_name == "pixelcopter":
-            from ple.games.pixelcopter import Pixelcopter
-            self.game = Pixelcopter()
-        elif self.env_name == "puckworld":
-            from ple.games.puckworld import PuckWorld
-            self.game = PuckWorld()
-        elif self.env_name == "snake":
-            from ple.games.snake import Snake
-            self.game = Snake()
-        elif self.env_name == "waterworld":
-            from ple.games.waterworld import WaterWorld
-            self.game = WaterWorld()
-            self.max_episode_steps = 100
-        elif self.env_name == "pong":
-            from ple.games.pong import Pong
-            self.game = Pong(MAX_SCORE=1)
-        elif self.env_name == "monster_kong":
-            from ple.games.monsterkong import MonsterKong
-            self.game = MonsterKong()
-
-        else:
-            assert False
+        # the PLE game and how to read its observation, resolved once
+        spec = get_game_spec(self.env_name)
+        self.write_observation = spec.ple_observation
+        self.max_episode_steps = spec.ple_max_episode_steps
+        self.game = spec.make_ple_game()
 
         self.game.rng = np.random.RandomState(np.random.randint(0, 50))
-        self.p = PLE(self.game, display_screen=True)
+        # frame_skip matches the action repeat of the generated envs
+        frame_skip = config.get("frame_skip", 1)
+        self.p = PLE(self.game, display_screen=True, frame_skip=frame_skip)
         self.p.init()
         self.all_possible_actions = self.p.getActionSet()
         self.action_space = gym.spaces.Discrete(n=len(self.all_possible_actions))  
-        if self.env_name == "monster_kong":
-            self.observation_space = gym.spaces.Box(-np.inf, np.inf, shape=(0,), dtype=np.float64)
+        # stacked downsampled frames instead of the state vector when obs_type is "pixels"
+        self.pixels = make_pixel_observation(config)
+        if self.pixels is not None:
+            self.observation_space = self.pixels.observation_space()
         else:
-            self.observation_space = gym.spaces.Box(-np.inf, np.inf, shape=self.get_state().shape, dtype=np.float64)
+            self.observation_space = gym.spaces.Box(
+                -np.inf, np.inf, shape=(spec.observation_size,), dtype=observation_dtype(config)
+            )
+        # observations go into a shared-memory ring when env_config has shared_obs
+        self.obs_buffer = make_observation_buffer(config, self.observation_space)
     
 
-    def get_state(self):
-        if self.env_name == "monster_kong":
+    def get_state(self, out=None, new_episode=False):
+        # writes into `out` when given, games without a state observation return None
+        if self.pixels is None and self.write_observation is None:
             return None
-        observation_dict = self.p.getGameState()
-        if self.env_name == "flappy_bird":
-            observation = np.array([
-                float(observation_dict["player_y"])/self.game.height, 
-                float(observation_dict["player_vel"]), #/self.game.height,
-                float(observation_dict["next_pipe_dist_to_player"])/self.game.width,
-                #float(observation_dict["next_pipe_top_y"])/self.game.height,
-                float(observation_dict["next_pipe_bottom_y"])/self.game.height
-            ])
-        
-        elif self.env_name == "catcher":
-            observation = np.array([
-                float(observation_dict["player_x"])/self.game.width,
-                float(observation_dict["fruit_x"])/self.game.width,
-                float(observation_dict["fruit_y"])/self.game.height,
-            ])
-        
-        elif self.env_name == "puckworld":
-            observation = np.array([
-                float(observation_dict["player_x"])/self.game.width,
-                float(observation_dict["player_y"])/self.game.height,
-                #float(observation_dict["player_velocity_x"])/self.game.width,
-                #float(observation_dict["player_velocity_y"])/self.game.height,
-                float(observation_dict["good_creep_x"])/self.game.width,
-                float(observation_dict["good_creep_y"])/self.game.height,
-                float(observation_dict["bad_creep_x"])/self.game.width,
-                float(observation_dict["bad_creep_y"])/self.game.height,
-            ])
-
-        elif self.env_name == "pong":
-            observation = np.array([
-                # float(observation_dict["player_x"])/self.game.width,
-                float(observation_dict["player_y"])/self.game.height,
-                # float(observation_dict["player_velocity"])*100/self.game.height,
-                #float(observation_dict["cpu_y"])/self.game.height,
-                #(float(observation_dict["ball_x"]) - float(observation_dict["player_x"]))/self.game.width,
-                float(observation_dict["ball_y"])/self.game.height,
-            ])
-
-        elif self.env_name == "pixelcopter":
-            observation = np.array([
-                float(observation_dict["player_y"])/self.game.height,
-                float(observation_dict["player_vel"]), #/self.game.height,
-                float(observation_dict["player_dist_to_ceil"])/self.game.height,
-                float(observation_dict["player_dist_to_floor"])/self.game.height,
-            ])
-            
-        elif self.env_name == "waterworld":
-            good_creep_pos = bad_creep_pos = [0.]*6
-            _good_creep_pos = observation_dict["creep_pos"]["GOOD"]
-            _bad_creep_pos = observation_dict["creep_pos"]["BAD"]
-            for idx, pos in enumerate(_good_creep_pos):
-                good_creep_pos[idx*2] = float(pos[0])/self.game.width
-                good_creep_pos[idx*2+1] = float(pos[1])/self.game.height
-            for idx, pos in enumerate(_bad_creep_pos):
-                bad_creep_pos[idx*2] = float(pos[0])/self.game.width
-                bad_creep_pos[idx*2+1] = float(pos[1])/self.game.height
-            observation = np.array([
-                    float(observation_dict["player_x"])/self.game.width,
-                    float(observation_dict["player_y"])/self.game.height,
-                ] + good_creep_pos + bad_creep_pos
-            )
-            assert observation.shape[0] == 2 + len(good_creep_pos) + len(bad_creep_pos)
-
-        elif self.env_name == "snake":
-            observation = np.array([
-                float(observation_dict["snake_head_x"])/self.game.width,
-                float(observation_dict["snake_head_y"])/self.game.height,
-                float(observation_dict["food_x"])/self.game.height,
-                float(observation_dict["food_y"])/self.game.height,
-            ])
-        elif self.env_name == "":
-            assert False
-
-        return observation
+        if out is None and self.obs_buffer is not None:
+            out = self.obs_buffer.next_slot()
+        elif out is None:
+            out = np.empty(self.observation_space.shape, dtype=self.observation_space.dtype)
+        if self.pixels is not None:
+            self.pixels.write(self.game.screen, out, reset=new_episode)
+        else:
+            self.write_observation(self.p.getGameState(), self.game, out)
+        return out
 
     def step(self, action):
         self.current_step += 1
@@ -147,7 +69,12 @@ class PLEPygameEnv(gym.Env):
         self.current_step = 0
         self.p.reset_game()
         info = {}  # Additional info for debugging
-        return self.get_state(), info
+        return self.get_state(new_episode=True), info
+
+    def close(self):
+        if self.obs_buffer is not None:
+            self.obs_buffer.close()
+            self.obs_buffer = None
 
 
 def ple_env_creator(config):
@@ -1,116 +1,136 @@
+import hashlib
 import importlib.util
+import marshal
 import os
 import pygame
 import numpy as np
 import signal
 import sys
+import threading
+import types
 from glob import glob
 from tqdm import tqdm
 from env_design.wrapped_envs.pomdp_gym import PygameEnv
 from env_design.wrapped_envs.oop_gym import PygameOOPEnv
+from env_design.wrapped_envs.vector_env import PygameVectorEnv, to_rllib_vector_env
 
 
-def env_creator(env_config):
+# generated games loaded in this process, keyed by (path, mtime, size)
+_game_modules = {}
+_game_modules_lock = threading.Lock()
+# compiled generated games shared by all processes, keyed by the hash of their source
+BYTECODE_CACHE_DIR = os.environ.get(
+    "FACTORSIM_BYTECODE_CACHE", os.path.expanduser("~/.cache/factorsim/bytecode")
+)
+
+
+def with_filename(code, file_path):
+    # a cached code object names the file that was compiled first, point it and every
+    # nested function's code at this one so that tracebacks and profiles are right
+    if code.co_filename == file_path:
+        return code
+    consts = tuple(
+        with_filename(const, file_path) if isinstance(const, types.CodeType) else const
+        for const in code.co_consts
+    )
+    return code.replace(co_filename=file_path, co_consts=consts)
+
+
+def compile_game(file_path):
+    with open(file_path, "rb") as f:
+        source = f.read()
+    cache_path = os.path.join(
+        BYTECODE_CACHE_DIR, hashlib.sha256(source).hexdigest() + ".pyc"
+    )
+    try:
+        with open(cache_path, "rb") as f:
+            data = f.read()
+        if data.startswith(importlib.util.MAGIC_NUMBER):
+            return with_filename(
+                marshal.loads(data[len(importlib.util.MAGIC_NUMBER):]), file_path
+            )
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    code = compile(source, file_path, "exec")
+    try:
+        os.makedirs(BYTECODE_CACHE_DIR, exist_ok=True)
+        # write to a temporary file first, other workers may be reading the same entry
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(importlib.util.MAGIC_NUMBER + marshal.dumps(code))
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return code
+
+
+def load_game_module(module_name, file_path):
+    """
+    Loads a generated game once per process. The module is reused until the file
+    changes, and its bytecode comes from the on-disk cache when another process (e.g. a
+    rollout worker) has already compiled the same source.
+    """
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_mtime_ns, stat.st_size)
+    with _game_modules_lock:
+        if key not in _game_modules:
+            module = types.ModuleType(module_name)
+            module.__file__ = file_path
+            exec(compile_game(file_path), module.__dict__)
+            _game_modules[key] = module
+        return _game_modules[key]
+
+
+def get_env_list(env_config):
     env_list = []
     env_name = env_config["name"]
 
     if env_config["method"] == "ours":
         version, numbered_directory = env_config['version'].split('_')
         directory_path = f"env_design/generated_envs/{env_name}_eval/{version}/"
-        for filename in os.listdir(directory_path):
-            # Load the module from the file
-            if filename.startswith('pomdp'):
-                # Construct a full file path
-                file_path = directory_path + '/' + filename + f'/{numbered_directory}/' + 'final.py'
-                # Define module name based on file name and load the Game module from the file
-                module_name = filename
-                try:
-                    spec = importlib.util.spec_from_file_location(module_name, file_path)
-                    module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(module)
-                    env_list.append((module_name, getattr(module, f"Game")))
-                except Exception as e:
-                    print(f"Fail to load {module_name}")
-
-        env_config["env_list"] = sorted(env_list)
-        env = PygameEnv(env_config)
-        return env
-
+        # Construct a full file path for every generated game
+        game_files = [
+            (filename, directory_path + '/' + filename + f'/{numbered_directory}/' + 'final.py')
+            for filename in os.listdir(directory_path) if filename.startswith('pomdp')
+        ]
     elif env_config["method"] == "baseline":
         version  = env_config['version']
         directory_path = f"env_design/generated_envs/{env_name}_baseline_eval/{version}"
-        for filename in os.listdir(directory_path):
-            # Load the module from the file
-            if filename.endswith(".py"):
-                # Construct a full file path
-                file_path = directory_path + '/' + filename
-                # Define module name based on file name and load the Game module from the file
-                module_name = filename
-                try:
-                    spec = importlib.util.spec_from_file_location(module_name, file_path)
-                    module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(module)
-                    env_list.append((module_name, getattr(module, f"Game")))
-                except Exception as e:
-                    print(f"Fail to load {module_name}")
-
-        env_config["env_list"] = sorted(env_list)
-        env = PygameOOPEnv(env_config)
-        return env
-            
+        game_files = [
+            (filename, directory_path + '/' + filename)
+            for filename in os.listdir(directory_path) if filename.endswith(".py")
+        ]
     else:
         assert False
 
-def get_env_list(env_config):
-    env_list = []
-    env_name = env_config["name"]
+    for module_name, file_path in game_files:
+        # Load the Game class from the file
+        try:
+            module = load_game_module(module_name, file_path)
+            env_list.append((module_name, getattr(module, f"Game")))
+        except Exception as e:
+            print(f"Fail to load {module_name}")
+
+    env_config["env_list"] = sorted(env_list)
+    return env_config["env_list"]
+
+
+def env_creator(env_config):
+    get_env_list(env_config)
 
     if env_config["method"] == "ours":
-        version, numbered_directory = env_config['version'].split('_')
-        directory_path = f"env_design/generated_envs/{env_name}_eval/{version}/"
-        for filename in os.listdir(directory_path):
-            # Load the module from the file
-            if filename.startswith('pomdp'):
-                # Construct a full file path
-                file_path = directory_path + '/' + filename + f'/{numbered_directory}/' + 'final.py'
-                # Define module name based on file name and load the Game module from the file
-                module_name = filename
-                try:
-                    spec = importlib.util.spec_from_file_location(module_name, file_path)
-                    module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(module)
-                    env_list.append((module_name, getattr(module, f"Game")))
-                except Exception as e:
-                    print(f"Fail to load {module_name}")
-
-        env_config["env_list"] = sorted(env_list)
-        return env_config["env_list"]
-        #env = PygameEnv(env_config)
-        #return env
+        if env_config.get("num_envs", 1) > 1:
+            # step num_envs games in this process, handed to RLlib as a vectorized env
+            return to_rllib_vector_env(PygameVectorEnv(env_config))
+        env = PygameEnv(env_config)
+        return env
 
     elif env_config["method"] == "baseline":
-        version  = env_config['version']
-        directory_path = f"env_design/generated_envs/{env_name}_baseline_eval/{version}"
-        for filename in os.listdir(directory_path):
-            # Load the module from the file
-            if filename.endswith(".py"):
-                # Construct a full file path
-                file_path = directory_path + '/' + filename
-                # Define module name based on file name and load the Game module from the file
-                module_name = filename
-                try:
-                    spec = importlib.util.spec_from_file_location(module_name, file_path)
-                    module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(module)
-                    env_list.append((module_name, getattr(module, f"Game")))
-                except Exception as e:
-                    print(f"Fail to load {module_name}")
-
-        env_config["env_list"] = sorted(env_list)
-        return env_config["env_list"]
-        #env = PygameOOPEnv(env_config)
-        #return env
-            
+        env = PygameOOPEnv(env_config)
+        return env
+
     else:
         assert False
 
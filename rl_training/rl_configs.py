@@ -1,6 +1,8 @@
+import math
 import os
 from ray import tune
 from ray.rllib.policy import policy
+from env_design.wrapped_envs.shared_obs import observation_ring_size
 
 
 # def custom_metrics_fn(info):
@@ -14,6 +16,14 @@ def custom_metrics_fn(info):
     return episode.custom_metrics
 
 
+def tiled_fragment_length(train_batch_size, num_workers, num_envs_per_worker, max_length):
+    # the longest fragment up to max_length whose fragments from all samplers add up to
+    # train_batch_size, RLlib rejects fragment lengths that overshoot it by more than 10%
+    num_samplers = max(num_workers, 1) * num_envs_per_worker
+    num_fragments = math.ceil(train_batch_size / (num_samplers * max_length))
+    return math.ceil(train_batch_size / (num_samplers * num_fragments))
+
+
 def get_experiment_config(args, default_config, wandb_run_name=None):
     params_dict = {
         # resources
@@ -25,7 +35,16 @@ def get_experiment_config(args, default_config, wandb_run_name=None):
         "env_config": {"name": args.env_name,
                        "method": args.method,
                        "version": args.version,
-                       "max_episode_steps": args.max_episode_steps},
+                       "max_episode_steps": args.max_episode_steps,
+                       "num_envs": args.num_envs,
+                       "render": not args.no_render,
+                       "frame_skip": args.frame_skip,
+                       "obs_dtype": args.obs_dtype,
+                       "shared_obs": args.shared_obs,
+                       "obs_type": args.obs_type,
+                       "frame_stack": args.frame_stack,
+                       "alt_env_eval_interval": args.alt_env_eval_interval,
+                       "alt_env_eval_episodes": args.alt_env_eval_episodes},
 
         # training
         # parameter explanation https://github.com/ray-project/ray/blob/c3a9756bf0c7691679edb679f666ae39614ba7e8/rllib/algorithms/algorithm_config.py#L1509        
@@ -92,6 +111,12 @@ def get_experiment_config(args, default_config, wandb_run_name=None):
     # Training
     if args.algo != 'dqn' and args.algo != 'dreamerv3':
         run_configs.train_batch_size = params_dict['train_batch_size']
+        run_configs.rollout_fragment_length = tiled_fragment_length(
+            params_dict['train_batch_size'],
+            params_dict['num_rollout_workers'],
+            run_configs.num_envs_per_worker,
+            params_dict['rollout_fragment_length'],
+        )
     run_configs.sgd_minibatch_size = params_dict['sgd_minibatch_size']
     run_configs.preprocessor_pref = None
     run_configs._disable_preprocessor_api = params_dict['disable_observation_precprocessing']
@@ -104,6 +129,11 @@ def get_experiment_config(args, default_config, wandb_run_name=None):
     # Environment
     run_configs.env = params_dict['env_name']
     run_configs.env_config = params_dict['env_config']
+    # RLlib keeps the observations of a fragment until it is complete, the shared_obs ring
+    # must not wrap before that (DQN and DreamerV3 sample shorter fragments of their own)
+    run_configs.env_config["obs_buffer_size"] = observation_ring_size(
+        params_dict['rollout_fragment_length'], run_configs.num_envs_per_worker
+    )
     # Episode env name for meta rl
     run_configs.custom_metric_fn = custom_metrics_fn
     #run_configs.env = env_creator
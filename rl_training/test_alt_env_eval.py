@@ -0,0 +1,54 @@
+import os
+import unittest
+from ray.rllib.algorithms.ppo import PPOConfig
+from ray.tune import registry
+from prepare_ple_env import ple_env_creator
+from alt_env_eval import AltEnvEvaluator
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+ENV_CONFIG = {"name": "catcher", "max_episode_steps": 50}
+
+
+def build_policy(use_lstm):
+    # a small untrained policy, configured like rl_configs.py does with --use_lstm
+    registry.register_env("ple_test_env", lambda config: ple_env_creator(config))
+    config = (
+        PPOConfig()
+        .environment("ple_test_env", env_config=ENV_CONFIG)
+        .framework("torch")
+        .rollouts(num_rollout_workers=0)
+        .training(
+            model={
+                "fcnet_hiddens": [8],
+                "use_lstm": use_lstm,
+                "lstm_use_prev_action": use_lstm,
+                "lstm_cell_size": 8,
+            }
+        )
+    )
+    algorithm = config.build()
+    policy = algorithm.get_policy()
+    return algorithm, policy
+
+
+class TestAltEnvEvaluator(unittest.TestCase):
+    def evaluate(self, use_lstm, num_envs, num_episodes):
+        algorithm, policy = build_policy(use_lstm)
+        try:
+            evaluator = AltEnvEvaluator(ENV_CONFIG, policy.get_state(), num_envs)
+            self.assertEqual(len(evaluator.initial_state(num_envs)) > 0, use_lstm)
+            return evaluator.evaluate(policy.get_weights(), num_episodes)
+        finally:
+            algorithm.stop()
+
+    def test_feedforward(self):
+        self.assertIsInstance(self.evaluate(False, num_envs=3, num_episodes=5), float)
+
+    def test_recurrent(self):
+        # more episodes than envs, so finished envs restart with a fresh state
+        self.assertIsInstance(self.evaluate(True, num_envs=3, num_episodes=5), float)
+
+
+if __name__ == "__main__":
+    # python test_alt_env_eval.py  (from rl_training/, needs ray[rllib] and torch)
+    unittest.main()
@@ -1,16 +1,46 @@
-from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
 from prepare_ple_env import ple_env_creator
+import argparse
 import imageio
 import numpy as np
 import os
 import pygame
-import sys
 
 
-def save_frame(env, save_path):
-    rgb_array = env.game.getScreenRGB()
-    image = Image.fromarray(np.transpose(rgb_array, (1, 0, 2)))
-    image.save(save_path)
+def get_args():
+    parser = argparse.ArgumentParser(description="Export videos and trajectories of a policy on a PLE game")
+    parser.add_argument("env_name", help="e.g. pong")
+    parser.add_argument("--num_trials", type=int, default=100)
+    parser.add_argument("--max_episode_steps", type=int, default=10000)
+    parser.add_argument("--policy_type", choices=["rule_based", "random"], default="rule_based")
+    parser.add_argument("--save_dir", default="saved_videos/")
+    parser.add_argument("--format", choices=["gif", "mp4"], default="gif", help="mp4 needs imageio-ffmpeg")
+    parser.add_argument("--num_workers", type=int, default=os.cpu_count(), help="episodes played in parallel")
+    parser.add_argument(
+        "--save_trajectory",
+        action="store_true",
+        help="also write observations, actions, rewards and frames to <trial>.npz",
+    )
+    parser.add_argument("--replay", default=None, help="write the video of a saved .npz trajectory and exit")
+    return parser.parse_args()
+
+
+def read_frame(env, out=None):
+    # copies the display straight into `out` (height, width, 3) through a pixels3d view,
+    # the view locks the display and is released right away
+    surface = pygame.display.get_surface()
+    pixels = pygame.surfarray.pixels3d(surface)
+    if out is None:
+        out = np.empty((pixels.shape[1], pixels.shape[0], 3), dtype=np.uint8)
+    np.copyto(out, pixels.transpose(1, 0, 2))
+    del pixels
+    return out
+
+
+def get_writer(video_path):
+    if video_path.endswith(".gif"):
+        return imageio.get_writer(video_path, mode='I', duration=0.5)
+    return imageio.get_writer(video_path, mode='I', fps=30)
 
 
 def rule_based_policy(env_name, observation):
@@ -38,68 +68,114 @@ def rule_based_policy(env_name, observation):
         raise ValueError(f"env_name {env_name} rule based policy not supported")
 
 
-if __name__ == "__main__":
-    #for env_name in ["snake", "pong", "waterworld", "snake"]:
-    env_name = sys.argv[1]
-    root_save_dir = "saved_videos/"
-    NUM_TRIALS = 100
-    max_episode_steps = 10000
-    policy_type = "rule_based" # could be "rule_based" or "ppo"
-
-    pygame.init()
-
-    env_config = {"name": env_name}
-    env = ple_env_creator(env_config) 
-    # PLEPygameEnv(config=env_config) # return an env instance
-    print(f"{env_name} passed")
-    print(env.p.getActionSet())
-
-    episode_rewards = []
-    episode_lengths = []
-
-    for trial_idx in range(NUM_TRIALS):
-        frame_paths = []
-        save_dir = os.path.join(root_save_dir, env_name, str(trial_idx))
-        os.makedirs(save_dir, exist_ok=True)
-        step_i = 0
-        total_reward = 0
-        done = False
-        observation, _ = env.reset()
+# one env per worker process, every process has its own pygame display
+worker_env = None
+
+
+def export_trial(args, trial_idx):
+    """Plays one episode, streams its frames to the video and optionally saves the trajectory."""
+    global worker_env
+    if worker_env is None:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        pygame.init()
+        worker_env = ple_env_creator({"name": args.env_name})
+    env = worker_env
+    # trials are reproducible no matter which worker plays them
+    np.random.seed(trial_idx)
+    env.game.rng = np.random.RandomState(trial_idx)
+
+    video_dir = os.path.join(args.save_dir, args.env_name)
+    os.makedirs(video_dir, exist_ok=True)
+    video_path = os.path.join(video_dir, f"{trial_idx}.{args.format}")
+    observations, actions, rewards = [], [], []
+    frame = None
+    # frames of the trajectory go straight into a file-backed array with room for the
+    # longest episode, so memory use does not grow with the episode
+    frames_path = os.path.join(video_dir, f"{trial_idx}.frames.npy")
+    frames = None
+    num_frames = 0
+
+    step_i = 0
+    total_reward = 0
+    done = False
+    observation, _ = env.reset()
+    with get_writer(video_path) as writer:
         while not done:
-            if policy_type == "random":
+            if args.policy_type == "random":
                 action = env.action_space.sample()
-            elif policy_type == "rule_based":
-                action = rule_based_policy(env_name, observation)
+            elif args.policy_type == "rule_based":
+                action = rule_based_policy(args.env_name, observation)
             else:
-                raise ValueError(f"policy_type {policy_type} not supported")
-            
+                raise ValueError(f"policy_type {args.policy_type} not supported")
 
+            if args.save_trajectory:
+                observations.append(observation)
+                actions.append(action)
             observation, reward, done, truncated, info = env.step(action)
             total_reward += reward
 
-            ### 
-            
-            image_path = os.path.join(save_dir, f"{step_i}.png")
-            save_frame(env, image_path)
-            frame_paths.append(image_path)
+            if args.save_trajectory:
+                if frames is None:
+                    frame = read_frame(env)
+                    frames = np.lib.format.open_memmap(
+                        frames_path,
+                        mode="w+",
+                        dtype=frame.dtype,
+                        shape=(args.max_episode_steps + 1,) + frame.shape,
+                    )
+                frame = read_frame(env, frames[num_frames])
+                num_frames += 1
+                rewards.append(reward)
+            else:
+                frame = read_frame(env, frame)
+            writer.append_data(frame)
 
             step_i += 1
             if done:
                 env.reset()
-            if step_i > max_episode_steps:
+            if step_i > args.max_episode_steps:
                 break
 
-        video_path = os.path.join(root_save_dir, env_name, f"{trial_idx}.gif")
-        with imageio.get_writer(video_path, mode='I', duration=0.5) as writer:
-            for frame_path in frame_paths:
-                image = imageio.imread(frame_path)
-                writer.append_data(image)
+    if args.save_trajectory:
+        # savez writes the frames in chunks from the file, then the file is dropped
+        np.savez_compressed(
+            os.path.join(video_dir, f"{trial_idx}.npz"),
+            observations=np.array(observations),
+            actions=np.array(actions),
+            rewards=np.array(rewards),
+            frames=frames[:num_frames],
+        )
+        del frames
+        os.remove(frames_path)
+    return step_i, total_reward
+
+
+def replay_trajectory(trajectory_path, video_path):
+    """Writes the video of a trajectory saved with --save_trajectory without re-simulating it."""
+    trajectory = np.load(trajectory_path)
+    with get_writer(video_path) as writer:
+        for frame in trajectory["frames"]:
+            writer.append_data(frame)
+    return trajectory
 
-        episode_lengths.append(step_i)
-        episode_rewards.append(total_reward)
-        print(f"episdoe_length: {step_i}, total_reward: {total_reward}")
 
-    print(episode_lengths)
-    print(episode_rewards)
-    print('mean episode_rewards over {NUM_TRIALS}', np.mean(episode_rewards))
-    env.close()
\ No newline at end of file
+if __name__ == "__main__":
+    args = get_args()
+
+    if args.replay is not None:
+        video_path = os.path.splitext(args.replay)[0] + f"_replay.{args.format}"
+        trajectory = replay_trajectory(args.replay, video_path)
+        print(f"{video_path}: {len(trajectory['frames'])} frames, total_reward: {trajectory['rewards'].sum()}")
+    else:
+        with ProcessPoolExecutor(max_workers=args.num_workers) as executor:
+            results = list(
+                executor.map(export_trial, [args] * args.num_trials, range(args.num_trials))
+            )
+        episode_lengths = [length for length, _ in results]
+        episode_rewards = [reward for _, reward in results]
+        for length, reward in results:
+            print(f"episdoe_length: {length}, total_reward: {reward}")
+
+        print(episode_lengths)
+        print(episode_rewards)
+        print(f'mean episode_rewards over {args.num_trials}', np.mean(episode_rewards))
@@ -0,0 +1,408 @@
+import pygame
+
+
+class GameSpec:
+    """
+    Everything the gym wrappers need to know about one game, resolved once when an env is
+    built instead of on every step.
+
+    actions: one (event type, attributes) pair per discrete action, turned into pygame
+    events once by `action_events`.
+    observation_size: length of the observation vector.
+    pomdp_observation(state_manager, out), oop_observation(game, out) and
+    ple_observation(state, game, out) write the observation of a generated game, an
+    object-oriented baseline game and a PLE game into the float buffer `out`.
+    survival_reward and reward_scale: reward shaping of the generated and baseline games
+    while the episode is running.
+    make_ple_game: builds the reference PLE game.
+    """
+
+    def __init__(
+        self,
+        actions,
+        observation_size,
+        pomdp_observation=None,
+        oop_observation=None,
+        ple_observation=None,
+        survival_reward=0.0,
+        reward_scale=1.0,
+        make_ple_game=None,
+        ple_max_episode_steps=10000,
+    ):
+        self.actions = actions
+        self.num_actions = len(actions)
+        self.observation_size = observation_size
+        self.pomdp_observation = pomdp_observation
+        self.oop_observation = oop_observation
+        self.ple_observation = ple_observation
+        self.survival_reward = survival_reward
+        self.reward_scale = reward_scale
+        self.make_ple_game = make_ple_game
+        self.ple_max_episode_steps = ple_max_episode_steps
+
+    def action_events(self):
+        return [pygame.event.Event(event_type, attributes) for event_type, attributes in self.actions]
+
+
+def get_game_spec(env_name):
+    if env_name not in GAME_SPECS:
+        raise ValueError(f"no game spec for {env_name}, add one to GAME_SPECS")
+    return GAME_SPECS[env_name]
+
+
+NOOP = (pygame.NOEVENT, {})
+UP = (pygame.KEYDOWN, {"key": pygame.K_UP})
+DOWN = (pygame.KEYDOWN, {"key": pygame.K_DOWN})
+LEFT = (pygame.KEYDOWN, {"key": pygame.K_LEFT})
+RIGHT = (pygame.KEYDOWN, {"key": pygame.K_RIGHT})
+CLICK = (pygame.MOUSEBUTTONDOWN, {})
+
+
+def write_creeps(out, first_creeps, second_creeps, width, height):
+    # the two creep blocks of the observation were built from one shared list, so the
+    # second group overwrites the first and the block appears twice; kept as is so that
+    # observations stay comparable with the policies trained on them
+    creep_pos = out[2:8]
+    creep_pos[:] = 0.
+    for idx, (x, y) in enumerate(first_creeps):
+        creep_pos[idx*2] = float(x) / width
+        creep_pos[idx*2+1] = float(y) / height
+    for idx, (x, y) in enumerate(second_creeps):
+        creep_pos[idx*2] = float(x) / width
+        creep_pos[idx*2+1] = float(y) / height
+    out[8:14] = creep_pos
+
+
+### flappy_bird
+
+def flappy_bird_pomdp(state_manager, out):
+    if len(state_manager.next_pipe_position) == 0:
+        state_manager.next_pipe_position = [{"x": 0, "bottom_pipe_length": 0}]
+    next_pipe = state_manager.next_pipe_position[0]
+    out[0] = (state_manager.bird_position_y + state_manager.bird_height/2) / state_manager.SCREEN_HEIGHT
+    out[1] = state_manager.bird_velocity_y / state_manager.SCREEN_HEIGHT
+    out[2] = float(next_pipe["x"] - state_manager.bird_position_x)/state_manager.SCREEN_WIDTH
+    out[3] = float(state_manager.SCREEN_HEIGHT - next_pipe["bottom_pipe_length"])/state_manager.SCREEN_HEIGHT
+
+
+def flappy_bird_oop(game, out):
+    SCREEN_WIDTH, SCREEN_HEIGHT = game.screen.get_size()
+    bird = game.bird
+    pipes = game.pipes
+    # select the pipe with the smallest rect.centerx value
+    closest_pipes = []
+    smallest_x = 1e6
+    for pipe in pipes:
+        if pipe.rect.centerx < smallest_x:
+            smallest_x = pipe.rect.centerx
+            closest_pipes = [pipe]
+        elif pipe.rect.centerx == smallest_x:
+            closest_pipes.append(pipe)
+
+    if len(pipes) >= 2:
+        bottom_pipe = closest_pipes[0]
+    elif len(pipes) == 1 and closest_pipes[0].rect.topleft[1] != 0:
+        bottom_pipe = closest_pipes[0]
+    else:
+        bottom_pipe = None
+
+    out[0] = bird.rect.centery / SCREEN_HEIGHT
+    out[1] = bird.vel / SCREEN_HEIGHT
+    out[2] = 0 if len(pipes) < 1 else float(smallest_x - bird.rect.centerx)/SCREEN_WIDTH
+    out[3] = 0 if bottom_pipe is None else float(bottom_pipe.rect.topleft[1]) / SCREEN_HEIGHT
+
+
+def flappy_bird_ple(state, game, out):
+    out[0] = float(state["player_y"])/game.height
+    out[1] = float(state["player_vel"])
+    out[2] = float(state["next_pipe_dist_to_player"])/game.width
+    out[3] = float(state["next_pipe_bottom_y"])/game.height
+
+
+def flappy_bird_ple_game():
+    from ple.games.flappybird import FlappyBird
+    return FlappyBird()
+
+
+### catcher
+
+def catcher_pomdp(state_manager, out):
+    out[0] = float(state_manager.catcher_position_x) / state_manager.SCREEN_WIDTH
+    out[1] = float(state_manager.ball_x) / state_manager.SCREEN_WIDTH
+    out[2] = float(state_manager.ball_y) / state_manager.SCREEN_HEIGHT
+
+
+def catcher_oop(game, out):
+    SCREEN_WIDTH, SCREEN_HEIGHT = game.screen.get_size()
+    out[0] = float(game.catcher.rect.centerx) / SCREEN_WIDTH
+    out[1] = float(game.ball.rect.centerx) / SCREEN_WIDTH
+    out[2] = float(game.ball.rect.centery) / SCREEN_HEIGHT
+
+
+def catcher_ple(state, game, out):
+    out[0] = float(state["player_x"])/game.width
+    out[1] = float(state["fruit_x"])/game.width
+    out[2] = float(state["fruit_y"])/game.height
+
+
+def catcher_ple_game():
+    from ple.games.catcher import Catcher
+    return Catcher()
+
+
+### puckworld
+
+def puckworld_pomdp(state_manager, out):
+    out[0] = float(state_manager.agent_position["x"]) / state_manager.SCREEN_WIDTH
+    out[1] = float(state_manager.agent_position["y"]) / state_manager.SCREEN_HEIGHT
+    out[2] = float(state_manager.green_dot_position["x"]) / state_manager.SCREEN_WIDTH
+    out[3] = float(state_manager.green_dot_position["y"]) / state_manager.SCREEN_HEIGHT
+    out[4] = float(state_manager.red_puck_position["x"]) / state_manager.SCREEN_WIDTH
+    out[5] = float(state_manager.red_puck_position["y"]) / state_manager.SCREEN_HEIGHT
+
+
+def puckworld_oop(game, out):
+    SCREEN_WIDTH, SCREEN_HEIGHT = game.screen.get_size()
+    out[0] = float(game.agent.rect.centerx) / SCREEN_WIDTH
+    out[1] = float(game.agent.rect.centery) / SCREEN_HEIGHT
+    out[2] = float(game.green_dot.rect.centerx) / SCREEN_WIDTH
+    out[3] = float(game.green_dot.rect.centery) / SCREEN_HEIGHT
+    out[4] = float(game.red_puck.rect.centerx) / SCREEN_WIDTH
+    out[5] = float(game.red_puck.rect.centery) / SCREEN_HEIGHT
+
+
+def puckworld_ple(state, game, out):
+    out[0] = float(state["player_x"])/game.width
+    out[1] = float(state["player_y"])/game.height
+    out[2] = float(state["good_creep_x"])/game.width
+    out[3] = float(state["good_creep_y"])/game.height
+    out[4] = float(state["bad_creep_x"])/game.width
+    out[5] = float(state["bad_creep_y"])/game.height
+
+
+def puckworld_ple_game():
+    from ple.games.puckworld import PuckWorld
+    return PuckWorld()
+
+
+### pong
+
+def pong_pomdp(state_manager, out):
+    out[0] = float(state_manager.player_paddle_y + state_manager.player_paddle_height/2)/state_manager.SCREEN_HEIGHT
+    out[1] = float(state_manager.ball["y"])/state_manager.SCREEN_HEIGHT
+
+
+def pong_oop(game, out):
+    SCREEN_WIDTH, SCREEN_HEIGHT = game.screen.get_size()
+    out[0] = float(game.paddle_human.rect.centery) / SCREEN_HEIGHT
+    out[1] = float(game.ball.rect.centery) / SCREEN_HEIGHT
+
+
+def pong_ple(state, game, out):
+    out[0] = float(state["player_y"])/game.height
+    out[1] = float(state["ball_y"])/game.height
+
+
+def pong_ple_game():
+    from ple.games.pong import Pong
+    return Pong(MAX_SCORE=1)
+
+
+### pixelcopter
+
+def pixelcopter_pomdp(state_manager, out):
+    min_dist = 999
+    min_block = None
+    for b in state_manager.cavern_obstacle_positions:  # Groups do not return in order
+        dist_to = b["x"] - state_manager.copter_position_x
+        if dist_to >= 0 and dist_to < min_dist:
+            min_block = b
+            min_dist = dist_to
+
+    if min_block is None:
+        min_block = {"ceiling_obstacle_length": 0, "floor_obstacle_length": 0}
+
+    out[0] = float(state_manager.copter_position_y) / state_manager.SCREEN_HEIGHT
+    out[1] = float(state_manager.copter_velocity_y)
+    out[2] = abs(state_manager.copter_position_y - min_block["ceiling_obstacle_length"]) / state_manager.SCREEN_HEIGHT
+    out[3] = abs(state_manager.SCREEN_HEIGHT - min_block["floor_obstacle_length"] - state_manager.copter_position_y) / state_manager.SCREEN_HEIGHT
+
+
+def pixelcopter_oop(game, out):
+    SCREEN_WIDTH, SCREEN_HEIGHT = game.screen.get_size()
+    copter = game.player
+
+    closest_top_y = copter.rect.centery
+    closest_bottom_y = SCREEN_HEIGHT - copter.rect.centery
+
+    smallest_x = 1e6
+    for obstacle in game.obstacles:
+        if obstacle.rect_top.centerx >= copter.rect.centerx:
+            dist = obstacle.rect_top.centerx - copter.rect.centerx
+            if dist < smallest_x:
+                smallest_x = dist
+
+                closest_top_y = abs(copter.rect.centery - obstacle.rect_top.rect.bottomleft[1])
+                closest_bottom_y = abs(obstacle.rect_bottom.topleft[1] - copter.rect.centery)
+
+    out[0] = float(copter.rect.centery) / SCREEN_HEIGHT
+    out[1] = float(copter.momentum) / SCREEN_HEIGHT
+    out[2] = closest_top_y / SCREEN_HEIGHT
+    out[3] = closest_bottom_y / SCREEN_HEIGHT
+
+
+def pixelcopter_ple(state, game, out):
+    out[0] = float(state["player_y"])/game.height
+    out[1] = float(state["player_vel"])
+    out[2] = float(state["player_dist_to_ceil"])/game.height
+    out[3] = float(state["player_dist_to_floor"])/game.height
+
+
+def pixelcopter_ple_game():
+    from ple.games.pixelcopter import Pixelcopter
+    return Pixelcopter()
+
+
+### snake
+
+def snake_pomdp(state_manager, out):
+    out[0] = float(state_manager.snake_head_x)/state_manager.SCREEN_WIDTH
+    out[1] = float(state_manager.snake_head_y)/state_manager.SCREEN_HEIGHT
+    out[2] = float(state_manager.food_position_x)/state_manager.SCREEN_WIDTH
+    out[3] = float(state_manager.food_position_y)/state_manager.SCREEN_HEIGHT
+
+
+def snake_oop(game, out):
+    SCREEN_WIDTH, SCREEN_HEIGHT = game.screen.get_size()
+    out[0] = float(game.snake.head[0])/SCREEN_WIDTH
+    out[1] = float(game.snake.head[1])/SCREEN_HEIGHT
+    out[2] = float(game.food.rect.topleft[0])/SCREEN_WIDTH
+    out[3] = float(game.food.rect.topleft[1])/SCREEN_HEIGHT
+
+
+def snake_ple(state, game, out):
+    out[0] = float(state["snake_head_x"])/game.width
+    out[1] = float(state["snake_head_y"])/game.height
+    out[2] = float(state["food_x"])/game.height
+    out[3] = float(state["food_y"])/game.height
+
+
+def snake_ple_game():
+    from ple.games.snake import Snake
+    return Snake()
+
+
+### waterworld
+
+def waterworld_pomdp(state_manager, out):
+    assert len(state_manager.green_circles) <= 3
+    assert len(state_manager.red_circles) <= 3
+    out[0] = float(state_manager.player_position_x)/state_manager.SCREEN_WIDTH
+    out[1] = float(state_manager.player_position_y)/state_manager.SCREEN_HEIGHT
+    write_creeps(
+        out,
+        [(pos["x"], pos["y"]) for pos in state_manager.green_circles],
+        [(pos["x"], pos["y"]) for pos in state_manager.red_circles],
+        state_manager.SCREEN_WIDTH,
+        state_manager.SCREEN_HEIGHT,
+    )
+
+
+def waterworld_oop(game, out):
+    SCREEN_WIDTH, SCREEN_HEIGHT = game.screen.get_size()
+    out[0] = float(game.agent.rect.centerx)/SCREEN_WIDTH
+    out[1] = float(game.agent.rect.centery)/SCREEN_HEIGHT
+    write_creeps(
+        out,
+        [sprite.rect.center for sprite in game.red_circles],
+        [sprite.rect.center for sprite in game.green_circles],
+        SCREEN_WIDTH,
+        SCREEN_HEIGHT,
+    )
+
+
+def waterworld_ple(state, game, out):
+    out[0] = float(state["player_x"])/game.width
+    out[1] = float(state["player_y"])/game.height
+    write_creeps(out, state["creep_pos"]["GOOD"], state["creep_pos"]["BAD"], game.width, game.height)
+
+
+def waterworld_ple_game():
+    from ple.games.waterworld import WaterWorld
+    return WaterWorld()
+
+
+### monster_kong (PLE only, no state observation)
+
+def monster_kong_ple_game():
+    from ple.games.monsterkong import MonsterKong
+    return MonsterKong()
+
+
+GAME_SPECS = {
+    "flappy_bird": GameSpec(
+        actions=[CLICK, NOOP],
+        observation_size=4,
+        pomdp_observation=flappy_bird_pomdp,
+        oop_observation=flappy_bird_oop,
+        ple_observation=flappy_bird_ple,
+        survival_reward=0.01,
+        make_ple_game=flappy_bird_ple_game,
+    ),
+    "catcher": GameSpec(
+        actions=[LEFT, RIGHT, NOOP],
+        observation_size=3,
+        pomdp_observation=catcher_pomdp,
+        oop_observation=catcher_oop,
+        ple_observation=catcher_ple,
+        make_ple_game=catcher_ple_game,
+    ),
+    "puckworld": GameSpec(
+        actions=[UP, LEFT, RIGHT, DOWN, NOOP],
+        observation_size=6,
+        pomdp_observation=puckworld_pomdp,
+        oop_observation=puckworld_oop,
+        ple_observation=puckworld_ple,
+        reward_scale=0.01,
+        make_ple_game=puckworld_ple_game,
+    ),
+    "pong": GameSpec(
+        actions=[UP, DOWN, NOOP],
+        observation_size=2,
+        pomdp_observation=pong_pomdp,
+        oop_observation=pong_oop,
+        ple_observation=pong_ple,
+        survival_reward=0.01,
+        make_ple_game=pong_ple_game,
+    ),
+    "pixelcopter": GameSpec(
+        actions=[CLICK, NOOP],
+        observation_size=4,
+        pomdp_observation=pixelcopter_pomdp,
+        oop_observation=pixelcopter_oop,
+        ple_observation=pixelcopter_ple,
+        make_ple_game=pixelcopter_ple_game,
+    ),
+    "snake": GameSpec(
+        actions=[UP, LEFT, RIGHT, DOWN, NOOP],
+        observation_size=4,
+        pomdp_observation=snake_pomdp,
+        oop_observation=snake_oop,
+        ple_observation=snake_ple,
+        make_ple_game=snake_ple_game,
+    ),
+    "waterworld": GameSpec(
+        actions=[UP, LEFT, RIGHT, DOWN, NOOP],
+        observation_size=14,
+        pomdp_observation=waterworld_pomdp,
+        oop_observation=waterworld_oop,
+        ple_observation=waterworld_ple,
+        make_ple_game=waterworld_ple_game,
+        ple_max_episode_steps=100,
+    ),
+    "monster_kong": GameSpec(
+        actions=[],
+        observation_size=0,
+        make_ple_game=monster_kong_ple_game,
+    ),
+}
@@ -2,6 +2,9 @@ import random
 import gymnasium as gym
 import numpy as np
 import pygame
+from env_design.wrapped_envs.game_specs import get_game_spec
+from env_design.wrapped_envs.shared_obs import observation_dtype, make_observation_buffer
+from env_design.wrapped_envs.pixel_obs import make_pixel_observation
 
 
 class PygameOOPEnv(gym.Env):
@@ -17,215 +20,81 @@ class PygameOOPEnv(gym.Env):
 
         self.env_id = None if "env_id" not in config.keys() else config["env_id"]
         self.game_class = None if "game_class" not in config.keys() else config["game_class"]
-
-        if self.env_name == "puckworld" or self.env_name == "waterworld":
-            self.action_space = gym.spaces.Discrete(n=5)
-        elif self.env_name == "flappy_bird" or self.env_name == "pixelcopter":
-            self.action_space = gym.spaces.Discrete(n=2)
-        elif self.env_name == "catcher" or self.env_name == "pong":
-            self.action_space = gym.spaces.Discrete(n=3)
-        elif self.env_name == "snake":
-            self.action_space = gym.spaces.Discrete(n=5)
+        # with render=False the display is not flipped after every step
+        self.render_game = True if "render" not in config.keys() else config["render"]
+        # every action is repeated for frame_skip frames, as PLE's frame_skip
+        self.frame_skip = 1 if "frame_skip" not in config.keys() else config["frame_skip"]
+        # stacked downsampled frames instead of the state vector when obs_type is "pixels",
+        # frames are then drawn even without render
+        self.pixels = make_pixel_observation(config)
+        self.draw_frames = self.render_game or self.pixels is not None
+
+        # actions and observations of this game, resolved once instead of on every step
+        spec = get_game_spec(self.env_name)
+        self.action_events = spec.action_events()
+        self.write_observation = spec.oop_observation
+        self.survival_reward = spec.survival_reward
+        self.reward_scale = spec.reward_scale
+        self.action_space = gym.spaces.Discrete(n=spec.num_actions)
         
 
         pygame.init()
-
+        self.game = None
         self.my_reset()
         # Define action and observation space, They must be gym.spaces objects
-        self.observation_space = gym.spaces.Box(-np.inf, np.inf, shape=(self.get_state().shape[-1],), dtype=np.float64)
+        if self.pixels is not None:
+            self.observation_space = self.pixels.observation_space()
+        else:
+            self.observation_space = gym.spaces.Box(
+                -np.inf, np.inf, shape=(spec.observation_size,), dtype=observation_dtype(config)
+            )
+        # observations go into a shared-memory ring when env_config has shared_obs
+        self.obs_buffer = make_observation_buffer(config, self.observation_space)
 
     def my_reset(self):
-        # Initialize your game class
-        pygame.quit()
-        pygame.init()
+        # Initialize your game class, pygame stays alive between episodes unless someone quit it
+        if not pygame.get_init():
+            pygame.init()
         if self.game_class is None:
             self.env_id, self.game_class = random.choice(self.env_list)
             
         # print(self.config["idx"], self.env_id)
-        self.game = self.game_class()
-        self.previous_score = 0
+        if isinstance(self.game, self.game_class) and callable(getattr(self.game, "reset", None)):
+            # a game that can restart itself keeps its screen, as in PygameEnv
+            self.game.reset()
+        else:
+            self.game = self.game_class()
+        if hasattr(self.game, "render_frame"):
+            self.game.render = self.render_game
+        # rewards count from the score the episode starts with, a game's own reset may
+        # not clear it
+        self.previous_score = self.current_score()
         self.current_step = 0
+        self.new_episode = True
 
-    def get_state(self):
-        SCREEN_WIDTH, SCREEN_HEIGHT= self.game.screen.get_size()
-
-        if self.env_name == "catcher":
-            catcher = self.game.catcher
-            ball = self.game.ball
-            observation = np.array(
-                [
-                    float(catcher.rect.centerx) / SCREEN_WIDTH,
-                    float(ball.rect.centerx) / SCREEN_WIDTH,
-                    float(ball.rect.centery) / SCREEN_HEIGHT,
-                ]
-            )
-
-        elif self.env_name == "flappy_bird":
-            bird = self.game.bird
-            pipes = self.game.pipes
-            # select the pipe with the smallest rect.centerx value
-            closest_pipes = []
-            smallest_x = 1e6
-            for pipe in pipes:
-                if pipe.rect.centerx < smallest_x:
-                    smallest_x = pipe.rect.centerx
-                    closest_pipes = [pipe]
-                elif pipe.rect.centerx == smallest_x:
-                    closest_pipes.append(pipe)
-            
-            if len(pipes) >= 2:
-                top_pipe = closest_pipes[0]# if closest_pipes[0].rect.centery < closest_pipes[1].rect.centery else closest_pipes[1]
-                bottom_pipe = closest_pipes[0]# if closest_pipes[0].rect.centery > closest_pipes[1].rect.centery else closest_pipes[1]
-            elif len(pipes) == 1:
-                if closest_pipes[0].rect.topleft[1] == 0:
-                    top_pipe = closest_pipes[0]
-                    bottom_pipe = None
-                else:
-                    bottom_pipe = closest_pipes[0]
-                    top_pipe = None
-            else: 
-                top_pipe = bottom_pipe = None
-
-            observation = np.array(
-                [
-                    bird.rect.centery / SCREEN_HEIGHT,
-                    bird.vel / SCREEN_HEIGHT,
-                    0 if len(pipes) < 1 else float(smallest_x - bird.rect.centerx)/SCREEN_WIDTH,
-                    0 if bottom_pipe is None else float(bottom_pipe.rect.topleft[1]) / SCREEN_HEIGHT,
-                ]
-            )
-
-
-        elif self.env_name == "puckworld":
-            agent = self.game.agent
-            green_dot = self.game.green_dot
-            red_puck = self.game.red_puck
-            observation = np.array(
-                [
-                    float(agent.rect.centerx) / SCREEN_WIDTH,
-                    float(agent.rect.centery) / SCREEN_HEIGHT,
-                    float(green_dot.rect.centerx) / SCREEN_WIDTH,
-                    float(green_dot.rect.centery) / SCREEN_HEIGHT,
-                    float(red_puck.rect.centerx) / SCREEN_WIDTH,
-                    float(red_puck.rect.centery) / SCREEN_HEIGHT,
-                ]
-            )
-
-        elif self.env_name == "pong":
-            paddle_human = self.game.paddle_human
-            ball = self.game.ball
-            observation = np.array(
-                [
-                    float(paddle_human.rect.centery) / SCREEN_HEIGHT,
-                    float(ball.rect.centery) / SCREEN_HEIGHT,
-                ]
-            )
-        elif self.env_name == "pixelcopter":
-            copter = self.game.player
-            obstacles = self.game.obstacles
-
-            closest_top_y = copter.rect.centery
-            closest_bottom_y = SCREEN_HEIGHT - copter.rect.centery
-
-            smallest_x = 1e6
-            for obstacle in obstacles:
-                if obstacle.rect_top.centerx >= copter.rect.centerx:
-                    dist = obstacle.rect_top.centerx - copter.rect.centerx
-                    if dist < smallest_x:
-                        smallest_x = dist
-
-                        closest_top_y = abs(copter.rect.centery - obstacle.rect_top.rect.bottomleft[1])
-                        closest_bottom_y = abs(obstacle.rect_bottom.topleft[1] - copter.rect.centery)
-            
-            observation = np.array(
-                [
-                    float(copter.rect.centery) / SCREEN_HEIGHT,
-                    float(copter.momentum) / SCREEN_HEIGHT,
-                    closest_top_y / SCREEN_HEIGHT,
-                    closest_bottom_y / SCREEN_HEIGHT,
-                ]
-            )
-
-        elif self.env_name == "snake":
-            snake = self.game.snake
-            food = self.game.food
-
-            observation = np.array(
-                [
-                    float(snake.head[0])/SCREEN_WIDTH,
-                    float(snake.head[1])/SCREEN_HEIGHT,
-                    float(food.rect.topleft[0])/SCREEN_WIDTH,
-                    float(food.rect.topleft[1])/SCREEN_HEIGHT,
-                ]
-            )
-        
-        elif self.env_name == "waterworld":
-            agent = self.game.agent
-            green_circles = self.game.green_circles
-            red_circles = self.game.red_circles
-            good_creep_pos = bad_creep_pos = [0.]*6
-            #assert len(green_circles) <= 3
-            #assert len(red_circles) <= 3
-            for idx, spirte in enumerate(red_circles):
-                good_creep_pos[idx*2] = float(spirte.rect.centerx)   / SCREEN_WIDTH
-                good_creep_pos[idx*2+1] = float(spirte.rect.centery) / SCREEN_HEIGHT
-                if idx > 5:
-                    break
-            for idx, spirte in enumerate(green_circles):
-                bad_creep_pos[idx*2] = float(spirte.rect.centerx)    /SCREEN_WIDTH
-                bad_creep_pos[idx*2+1] = float(spirte.rect.centery)  /SCREEN_HEIGHT
-                if idx > 5:
-                    break
-
-            observation = np.array([
-                    float(agent.rect.centerx)/SCREEN_WIDTH,
-                    float(agent.rect.centery)/SCREEN_HEIGHT,
-                ] + good_creep_pos + bad_creep_pos
-            )
-            assert observation.shape[0] == 2 + len(good_creep_pos) + len(bad_creep_pos)
-
+    def current_score(self):
+        if hasattr(self.game, "state_manager"):
+            return self.game.state_manager.score
+        return self.game.score
+
+    def get_state(self, out=None):
+        # writes into `out` when given (e.g. a row of a batched observation array)
+        if out is None and self.obs_buffer is not None:
+            out = self.obs_buffer.next_slot()
+        elif out is None:
+            out = np.empty(self.observation_space.shape, dtype=self.observation_space.dtype)
+        if self.pixels is None:
+            self.write_observation(self.game, out)
         else:
-            assert False
-            
-        return observation
+            if self.new_episode and hasattr(self.game, "render_frame"):
+                # nothing has been drawn in this episode yet
+                self.game.render_frame()
+            self.pixels.write(self.game.screen, out, reset=self.new_episode)
+        self.new_episode = False
+        return out
 
     def perform_action(self, action):
-        if self.env_name == "puckworld" or self.env_name == "waterworld" or self.env_name == "snake":
-            # actions = ["up", "left", "right", "down", do nothing]
-            if action == 0:
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_UP})
-            elif action == 1:  
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_LEFT})
-            elif action == 2:
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_RIGHT})
-            elif action == 3:
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_DOWN})
-            else:  # Do nothing
-                return pygame.event.Event(pygame.NOEVENT)
-        
-        if self.env_name == "pong":
-            # actions = ["up", "down", do nothing]
-            if action == 0:
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_UP})
-            elif action == 1:
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_DOWN})
-            else:  # Do nothing
-                return pygame.event.Event(pygame.NOEVENT)
-        
-        if self.env_name == "catcher":
-            if action == 0:  # Left
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_LEFT})
-            elif action == 1:  # Right
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_RIGHT})
-            else:  # Do nothing
-                return pygame.event.Event(pygame.NOEVENT)
-        
-        if self.env_name == "flappy_bird" or self.env_name == "pixelcopter":
-            # Implement action handling here
-            if action == 0:
-                return pygame.event.Event(pygame.MOUSEBUTTONDOWN)
-            else:
-                return pygame.event.Event(pygame.NOEVENT)
+        return self.action_events[action]
 
 
     def step(self, action):
@@ -234,34 +103,34 @@ class PygameOOPEnv(gym.Env):
 
         #old_lives = self.game.state_manager.lives
         event = self.perform_action(action)
-        try:
-            running = self.game.run(event)
-        except Exception as e:
-            print(e)
-            info["has_exception"] = True
-            running = False
+        reward = 0
+        for frame in range(self.frame_skip):
+            # only the last repeated frame needs to be drawn
+            if hasattr(self.game, "render_frame"):
+                self.game.render = self.draw_frames and frame == self.frame_skip - 1
+            try:
+                running = self.game.run(event)
+            except Exception as e:
+                print(e)
+                info["has_exception"] = True
+                running = False
+
+            score = self.current_score()
+            frame_reward = score - self.previous_score
+            self.previous_score = score
+            if running:
+                frame_reward = frame_reward * self.reward_scale + self.survival_reward
+            reward += frame_reward
+            if not running:
+                break
 
         observation = self.get_state()
 
-        if hasattr(self.game, "state_manager"):
-            reward = self.game.state_manager.score - self.previous_score
-            self.previous_score = self.game.state_manager.score
-        else:
-            reward = self.game.score - self.previous_score
-            self.previous_score = self.game.score
-
-        if running:
-            if self.env_name == "flappy_bird":
-                reward += 0.01
-            elif self.env_name == "pong":
-                reward += 0.01
-            elif self.env_name == "puckworld":
-                reward = float(reward) / 100
-
         terminated = self.current_step > self.max_episode_steps or not running
         truncated = False
 
-        pygame.display.flip()
+        if self.render_game:
+            pygame.display.flip()
         return observation, reward, terminated, truncated, info
 
 
@@ -270,3 +139,13 @@ class PygameOOPEnv(gym.Env):
         observation = self.get_state()
         info = {}
         return observation, info
+
+    def render(self):
+        if not self.render_game and hasattr(self.game, "render_frame"):
+            self.game.render_frame()
+        return pygame.surfarray.array3d(self.game.screen).swapaxes(0, 1)
+
+    def close(self):
+        if self.obs_buffer is not None:
+            self.obs_buffer.close()
+            self.obs_buffer = None
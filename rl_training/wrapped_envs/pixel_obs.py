@@ -0,0 +1,76 @@
+import gymnasium as gym
+import numpy as np
+import pygame
+
+# PLE's relative luminance (0.21, 0.72, 0.07) in 1/256 steps, so that grayscale is
+# integer math on uint16 buffers
+LUMINANCE = (54, 184, 18)
+
+
+class PixelObservation:
+    """
+    Image observations of a pygame surface: the frame is downsampled to `width` x `height`
+    by pygame's nearest-neighbour scale into a private surface, read through a pixels3d
+    view of it, converted to grayscale in integer math and pushed onto a stack of the
+    last `frame_stack` frames (channels last, oldest first).
+
+    All buffers are allocated once, only the observation array passed to `write` is
+    filled per step.
+    """
+
+    def __init__(self, width=84, height=84, frame_stack=4, grayscale=True):
+        self.size = (width, height)
+        self.frame_stack = frame_stack
+        self.grayscale = grayscale
+        self.channels = 1 if grayscale else 3
+        self.stack = np.zeros((height, width, self.channels * frame_stack), dtype=np.uint8)
+        self.luminance = np.zeros((width, height), dtype=np.uint16)
+        self.channel = np.zeros((width, height), dtype=np.uint16)
+        self.small = None
+        self.pixels = None
+
+    def observation_space(self):
+        return gym.spaces.Box(0, 255, shape=self.stack.shape, dtype=np.uint8)
+
+    def read_frame(self, surface):
+        # the private surface has the format of the game screen, so that scale can
+        # write into it directly; its pixels3d view (width, height, 3) is kept around
+        if self.small is None or self.small.get_bitsize() != surface.get_bitsize():
+            self.pixels = None
+            self.small = pygame.Surface(self.size, 0, surface)
+            self.pixels = pygame.surfarray.pixels3d(self.small)
+        pygame.transform.scale(surface, self.size, self.small)
+        if not self.grayscale:
+            return self.pixels.transpose(1, 0, 2)
+
+        np.multiply(self.pixels[..., 0], LUMINANCE[0], out=self.luminance, dtype=np.uint16)
+        for index in (1, 2):
+            np.multiply(self.pixels[..., index], LUMINANCE[index], out=self.channel, dtype=np.uint16)
+            self.luminance += self.channel
+        self.luminance >>= 8
+        return self.luminance.T[:, :, None]
+
+    def write(self, surface, out, reset=False):
+        """Pushes the current frame of `surface` and writes the stack into `out`."""
+        frame = self.read_frame(surface)
+        c = self.channels
+        for index in range(self.frame_stack - 1):
+            # frame by frame, shifting the whole overlapping block would need a temporary;
+            # a new episode starts with the first frame repeated
+            source = frame if reset else self.stack[..., (index + 1) * c:(index + 2) * c]
+            self.stack[..., index * c:(index + 1) * c] = source
+        self.stack[..., -c:] = frame
+        out[...] = self.stack
+        return out
+
+
+def make_pixel_observation(config):
+    """A PixelObservation if env_config has obs_type "pixels", None for state vectors."""
+    if config.get("obs_type", "state") != "pixels":
+        return None
+    return PixelObservation(
+        width=config.get("pixel_width", 84),
+        height=config.get("pixel_height", 84),
+        frame_stack=config.get("frame_stack", 4),
+        grayscale=config.get("grayscale", True),
+    )
@@ -1,7 +1,11 @@
+import inspect
 import random
 import gymnasium as gym
 import numpy as np
 import pygame
+from env_design.wrapped_envs.game_specs import get_game_spec
+from env_design.wrapped_envs.shared_obs import observation_dtype, make_observation_buffer
+from env_design.wrapped_envs.pixel_obs import make_pixel_observation
 
 
 class PygameEnv(gym.Env):
@@ -17,205 +21,119 @@ class PygameEnv(gym.Env):
 
         self.env_id = None if "env_id" not in config.keys() else config["env_id"]
         self.game_class = None if "game_class" not in config.keys() else config["game_class"]
-
-        if self.env_name == "puckworld" or self.env_name == "waterworld":
-            self.action_space = gym.spaces.Discrete(n=5)
-        elif self.env_name == "flappy_bird" or self.env_name == "pixelcopter":
-            self.action_space = gym.spaces.Discrete(n=2)
-        elif self.env_name == "catcher" or self.env_name == "pong":
-            self.action_space = gym.spaces.Discrete(n=3)
-        elif self.env_name == "snake":
-            self.action_space = gym.spaces.Discrete(n=5)
+        # with render=False the games skip drawing and the display flip; frames are only
+        # drawn when render() is called
+        self.render_game = True if "render" not in config.keys() else config["render"]
+        # every action is repeated for frame_skip frames, as PLE's frame_skip
+        self.frame_skip = 1 if "frame_skip" not in config.keys() else config["frame_skip"]
+        # stacked downsampled frames instead of the state vector when obs_type is "pixels",
+        # frames are then drawn even without render
+        self.pixels = make_pixel_observation(config)
+        self.draw_frames = self.render_game or self.pixels is not None
+        # games that support it draw onto their own surface instead of the display
+        self.offscreen = False if "offscreen" not in config.keys() else config["offscreen"]
+
+        # actions and observations of this game, resolved once instead of on every step
+        spec = get_game_spec(self.env_name)
+        self.action_events = spec.action_events()
+        self.write_observation = spec.pomdp_observation
+        self.survival_reward = spec.survival_reward
+        self.reward_scale = spec.reward_scale
+        self.action_space = gym.spaces.Discrete(n=spec.num_actions)
         
         pygame.init()
+        self.game = None
         self.my_reset()
         # Define action and observation space, They must be gym.spaces objects
-        self.observation_space = gym.spaces.Box(-np.inf, np.inf, shape=(self.get_state().shape[-1],), dtype=np.float64)
+        if self.pixels is not None:
+            self.observation_space = self.pixels.observation_space()
+        else:
+            self.observation_space = gym.spaces.Box(
+                -np.inf, np.inf, shape=(spec.observation_size,), dtype=observation_dtype(config)
+            )
+        # observations go into a shared-memory ring when env_config has shared_obs
+        self.obs_buffer = make_observation_buffer(config, self.observation_space)
 
     def my_reset(self):
-        # Initialize your game class
-        pygame.quit()
-        pygame.init()
+        # pygame and the display stay alive between episodes, unless someone quit them
+        if not pygame.get_init():
+            pygame.init()
+        self.new_game()
+
+    def new_game(self):
         if self.game_class is None:
             self.env_id, self.game_class = random.choice(self.env_list)
             
-        self.game = self.game_class()
+        if isinstance(self.game, self.game_class) and hasattr(self.game, "reset"):
+            # only re-create the states, the game keeps its screen
+            self.game.reset()
+        elif self.offscreen and "offscreen" in inspect.signature(self.game_class).parameters:
+            self.game = self.game_class(offscreen=True)
+        else:
+            self.game = self.game_class()
+        # games exported before render_frame existed simply ignore this flag
+        self.game.render = self.render_game
         self.state_manager = self.game.state_manager
         self.previous_score = 0
         self.current_step = 0
-
-    def get_state(self):
-        state_manager = self.state_manager
-        if self.env_name == "flappy_bird":
-            if len(state_manager.next_pipe_position) == 0:
-                state_manager.next_pipe_position = [{"x": 0, "bottom_pipe_length": 0}]
-            
-            pipes = []
-            for p in state_manager.next_pipe_position:
-                if p["x"] > state_manager.bird_position_x:
-                    pipes.append((p, p.x + p.width/2 - self.player.pos_x ))
-
-            pipes.sort(key=lambda p: p[1])
-            if len(pipes) == 0:
-                pipes = [{"x": 0, "bottom_pipe_length": 0}]
-
-            observation = np.array(
-                [
-                    (state_manager.bird_position_y + state_manager.bird_height/2) / state_manager.SCREEN_HEIGHT,
-                    state_manager.bird_velocity_y / state_manager.SCREEN_HEIGHT,
-                    float(state_manager.next_pipe_position[0]["x"] - state_manager.bird_position_x)/state_manager.SCREEN_WIDTH,
-                    float(state_manager.SCREEN_HEIGHT - state_manager.next_pipe_position[0]["bottom_pipe_length"])/state_manager.SCREEN_HEIGHT,
-                ]
-            )
-
-        elif self.env_name == "catcher":
-            observation = np.array(
-                [
-                    float(state_manager.catcher_position_x) / state_manager.SCREEN_WIDTH,
-                    float(state_manager.ball_x) / state_manager.SCREEN_WIDTH,
-                    float(state_manager.ball_y) / state_manager.SCREEN_HEIGHT,
-                ]
-            )
-
-        elif self.env_name == "puckworld":
-            observation = np.array(
-                [
-                    float(state_manager.agent_position["x"]    ) / state_manager.SCREEN_WIDTH,
-                    float(state_manager.agent_position["y"]    ) / state_manager.SCREEN_HEIGHT,
-                    float(state_manager.green_dot_position["x"]) / state_manager.SCREEN_WIDTH,
-                    float(state_manager.green_dot_position["y"]) / state_manager.SCREEN_HEIGHT,
-                    float(state_manager.red_puck_position["x"])  / state_manager.SCREEN_WIDTH,
-                    float(state_manager.red_puck_position["y"])  / state_manager.SCREEN_HEIGHT,
-                ]
-            )
-
-        elif self.env_name == "pong":
-            observation = np.array(
-                [
-                    float(state_manager.player_paddle_y + state_manager.player_paddle_height/2)/state_manager.SCREEN_HEIGHT,
-                    float(state_manager.ball["y"])/state_manager.SCREEN_HEIGHT,
-                ]
-            )
-        elif self.env_name == "pixelcopter":
-            min_dist = 999
-            min_block = None
-            for b in state_manager.cavern_obstacle_positions:  # Groups do not return in order
-                dist_to = b["x"] - state_manager.copter_position_x
-                if dist_to >= 0 and dist_to < min_dist:
-                    min_block = b
-                    min_dist = dist_to
-
-            if min_block is None:
-                min_block = {"ceiling_obstacle_length": 0, "floor_obstacle_length": 0}
-
-            observation = np.array(
-                [
-                    float(state_manager.copter_position_y) / state_manager.SCREEN_HEIGHT,
-                    float(state_manager.copter_velocity_y),
-                    abs(state_manager.copter_position_y - min_block["ceiling_obstacle_length"]) / state_manager.SCREEN_HEIGHT,
-                    abs(state_manager.SCREEN_HEIGHT - min_block["floor_obstacle_length"] - state_manager.copter_position_y) / state_manager.SCREEN_HEIGHT,
-                ]
-            )
-
-        elif self.env_name == "snake":
-            observation = np.array(
-                [
-                    float(state_manager.snake_head_x)/state_manager.SCREEN_WIDTH,
-                    float(state_manager.snake_head_y)/state_manager.SCREEN_HEIGHT,
-                    float(state_manager.food_position_x)/state_manager.SCREEN_WIDTH,
-                    float(state_manager.food_position_y)/state_manager.SCREEN_HEIGHT,
-                ]
-            )
-        
-        elif self.env_name == "waterworld":
-            good_creep_pos = bad_creep_pos = [0.]*6
-            assert len(state_manager.green_circles) <= 3
-            assert len(state_manager.red_circles) <= 3
-            for idx, pos in enumerate(state_manager.green_circles):
-                good_creep_pos[idx*2] = float(pos["x"])/state_manager.SCREEN_WIDTH
-                good_creep_pos[idx*2+1] = float(pos["y"])/state_manager.SCREEN_HEIGHT
-            for idx, pos in enumerate(state_manager.red_circles):
-                bad_creep_pos[idx*2] = float(pos["x"])/state_manager.SCREEN_WIDTH
-                bad_creep_pos[idx*2+1] = float(pos["y"])/state_manager.SCREEN_HEIGHT
-            observation = np.array([
-                    float(state_manager.player_position_x)/state_manager.SCREEN_WIDTH,
-                    float(state_manager.player_position_y)/state_manager.SCREEN_HEIGHT,
-                ] + good_creep_pos + bad_creep_pos
-            )
-            assert observation.shape[0] == 2 + len(good_creep_pos) + len(bad_creep_pos)
-
+        self.new_episode = True
+
+    def get_state(self, out=None):
+        # writes into `out` when given (e.g. a row of a batched observation array)
+        if out is None and self.obs_buffer is not None:
+            out = self.obs_buffer.next_slot()
+        elif out is None:
+            out = np.empty(self.observation_space.shape, dtype=self.observation_space.dtype)
+        if self.pixels is None:
+            self.write_observation(self.state_manager, out)
         else:
-            assert False
-            
-        return observation
+            if self.new_episode and hasattr(self.game, "render_frame"):
+                # nothing has been drawn in this episode yet
+                self.game.render_frame()
+            self.pixels.write(self.state_manager.screen, out, reset=self.new_episode)
+        self.new_episode = False
+        return out
 
     def perform_action(self, action):
-        if self.env_name == "puckworld" or self.env_name == "waterworld" or self.env_name == "snake":
-            # actions = ["up", "left", "right", "down", do nothing]
-            if action == 0:
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_UP})
-            elif action == 1:  
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_LEFT})
-            elif action == 2:
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_RIGHT})
-            elif action == 3:
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_DOWN})
-            else:  # Do nothing
-                return pygame.event.Event(pygame.NOEVENT)
-        
-        if self.env_name == "pong":
-            # actions = ["up", "down", do nothing]
-            if action == 0:
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_UP})
-            elif action == 1:
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_DOWN})
-            else:  # Do nothing
-                return pygame.event.Event(pygame.NOEVENT)
-        
-        if self.env_name == "catcher":
-            if action == 0:  # Left
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_LEFT})
-            elif action == 1:  # Right
-                return pygame.event.Event(pygame.KEYDOWN, {"key": pygame.K_RIGHT})
-            else:  # Do nothing
-                return pygame.event.Event(pygame.NOEVENT)
-        
-        if self.env_name == "flappy_bird" or self.env_name == "pixelcopter":
-            # Implement action handling here
-            if action == 0:
-                return pygame.event.Event(pygame.MOUSEBUTTONDOWN)
-            else:
-                return pygame.event.Event(pygame.NOEVENT)
+        return self.action_events[action]
 
 
     def step(self, action):
+        observation, reward, terminated, truncated, info = self.step_game(action)
+        if self.render_game:
+            pygame.display.flip()
+        return observation, reward, terminated, truncated, info
+
+    def step_game(self, action, out=None):
+        # one transition of the game without touching the display, see get_state for `out`
         self.current_step += 1
         info = {"has_exception": False}
 
         #old_lives = self.game.state_manager.lives
         event = self.perform_action(action)
-        try:
-            running = self.game.run(event)
-        except Exception as e:
-            print(e)
-            info["has_exception"] = True
-            running = False
-
-        observation = self.get_state()
-        reward = self.game.state_manager.score - self.previous_score
-        self.previous_score = self.game.state_manager.score
-        if running:
-            if self.env_name == "flappy_bird":
-                reward += 0.01
-            elif self.env_name == "pong":
-                reward += 0.01
-            elif self.env_name == "puckworld":
-                reward = float(reward) / 100
+        reward = 0
+        for frame in range(self.frame_skip):
+            # only the last repeated frame needs to be drawn
+            self.game.render = self.draw_frames and frame == self.frame_skip - 1
+            try:
+                running = self.game.run(event)
+            except Exception as e:
+                print(e)
+                info["has_exception"] = True
+                running = False
+
+            frame_reward = self.game.state_manager.score - self.previous_score
+            self.previous_score = self.game.state_manager.score
+            if running:
+                frame_reward = frame_reward * self.reward_scale + self.survival_reward
+            reward += frame_reward
+            if not running:
+                break
+
+        observation = self.get_state(out)
 
         terminated = self.current_step > self.max_episode_steps or not running
         truncated = False
-
-        pygame.display.flip()
         return observation, reward, terminated, truncated, info
 
 
@@ -225,6 +143,17 @@ class PygameEnv(gym.Env):
         info = {}
         return observation, info
 
+    def render(self):
+        # draw the current state on request when the game does not render every step
+        if not self.render_game and hasattr(self.game, "render_frame"):
+            self.game.render_frame()
+        return pygame.surfarray.array3d(self.state_manager.screen).swapaxes(0, 1)
+
+    def close(self):
+        if self.obs_buffer is not None:
+            self.obs_buffer.close()
+            self.obs_buffer = None
+
 
 if __name__ == "__main__":
     env = PygameEnv()
@@ -0,0 +1,107 @@
+import weakref
+from multiprocessing import shared_memory
+import numpy as np
+
+# bytes in front of the slots, holds the number of observations written so far
+HEADER_SIZE = 8
+# slots on top of the observations of a rollout fragment, for the observation RLlib carries
+# over into the next fragment and the ones written by resets
+RING_MARGIN = 64
+
+
+def release_shared_memory(shm, owner):
+    # the creating process removes the segment, views handed out may still pin the mapping,
+    # which then goes away with the process
+    if owner:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+    try:
+        shm.close()
+    except BufferError:
+        pass
+
+
+class SharedObservationBuffer:
+    """
+    A ring of `capacity` preallocated observation slots in shared memory.
+
+    The env writes every observation into the next slot and hands out a view of it, so
+    stepping allocates nothing; RLlib copies the views into its sample batch when a
+    rollout fragment is complete. A slot is overwritten `capacity` observations later, so
+    the capacity has to cover everything RLlib holds on to, see observation_ring_size.
+    Another process can map the buffer with `attach` (see `spec`), e.g. to inspect a
+    running env. The segment is unlinked on close() or when the owning process exits.
+    """
+
+    def __init__(self, shape, dtype, capacity, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self.owner = name is None
+        size = HEADER_SIZE + capacity * int(np.prod(self.shape)) * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.count = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.slots = np.ndarray(
+            (capacity,) + self.shape, dtype=self.dtype, buffer=self.shm.buf, offset=HEADER_SIZE
+        )
+        if self.owner:
+            self.count[0] = 0
+        self.finalizer = weakref.finalize(self, release_shared_memory, self.shm, self.owner)
+        # one view per slot, built once so that handing out a slot is a list lookup
+        self.slot_views = list(self.slots)
+        self.num_written = int(self.count[0])
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(spec["shape"], spec["dtype"], spec["capacity"], name=spec["name"])
+
+    def spec(self):
+        return {
+            "name": self.shm.name,
+            "shape": self.shape,
+            "dtype": self.dtype.str,
+            "capacity": self.capacity,
+        }
+
+    def next_slot(self):
+        # the slot the next observation goes into, counted as written right away
+        slot = self.slot_views[self.num_written % self.capacity]
+        self.num_written += 1
+        self.count[0] = self.num_written
+        return slot
+
+    def latest(self, num=1):
+        # views of the last `num` observations, oldest first
+        count = int(self.count[0])
+        num = min(num, count, self.capacity)
+        return [self.slots[index % self.capacity] for index in range(count - num, count)]
+
+    def close(self):
+        # drop our views before releasing the mapping
+        self.count = None
+        self.slots = None
+        self.slot_views = None
+        self.finalizer()
+
+
+def observation_ring_size(rollout_fragment_length, num_envs_per_worker=1):
+    # every env of a worker has its own ring, counted for all of them to stay on the safe side
+    return rollout_fragment_length * num_envs_per_worker + RING_MARGIN
+
+
+def observation_dtype(config):
+    # float64 unless env_config asks for e.g. "float32"
+    return np.dtype(config.get("obs_dtype", "float64"))
+
+
+def make_observation_buffer(config, observation_space):
+    """A SharedObservationBuffer for `observation_space` if env_config enables shared_obs."""
+    if not config.get("shared_obs", False):
+        return None
+    return SharedObservationBuffer(
+        observation_space.shape,
+        observation_space.dtype,
+        config.get("obs_buffer_size", 1024),
+    )
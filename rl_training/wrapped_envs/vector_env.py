@@ -0,0 +1,168 @@
+import random
+import gymnasium as gym
+import numpy as np
+import pygame
+from gymnasium.vector.utils import batch_space
+from env_design.wrapped_envs.pomdp_gym import PygameEnv
+
+
+class PygameVectorEnv(gym.vector.VectorEnv):
+    """
+    Steps `num_envs` generated games in a single process.
+
+    Every sub-environment is a PygameEnv whose game draws onto its own off-screen surface,
+    so the display is never opened, resized or flipped (all games would otherwise share
+    the one display surface). Frames are only drawn when pixel observations need them or
+    render() is called. Observations, rewards and done flags are returned as stacked arrays.
+    With `autoreset` (the default) finished sub-environments are reset within the same
+    step, their last observation and info go to info["final_observation"] and
+    info["final_info"].
+    """
+
+    def __init__(self, config=None, autoreset=True):
+        self.config = config
+        self.num_envs = config.get("num_envs", 8)
+        self.autoreset = autoreset
+
+        pygame.init()
+        # each sub-environment picks its own game from env_list
+        self.envs = []
+        self.surfaces = []
+        for index in range(self.num_envs):
+            # observations are written into self.observations, the sub-environments
+            # do not need rings of their own; nothing is shown, so nothing is drawn
+            # unless pixel observations need the frames
+            self.envs.append(
+                PygameEnv(dict(config, shared_obs=False, offscreen=True, render=False))
+            )
+            self.surfaces.append(None)
+            self.detach_display(index)
+        self.env_name = self.envs[0].env_name
+
+        self.single_observation_space = self.envs[0].observation_space
+        self.single_action_space = self.envs[0].action_space
+        self.observation_space = batch_space(self.single_observation_space, self.num_envs)
+        self.action_space = batch_space(self.single_action_space, self.num_envs)
+        self.closed = False
+
+        self.observations = np.zeros(
+            (self.num_envs,) + self.single_observation_space.shape,
+            dtype=self.single_observation_space.dtype,
+        )
+        self.rewards = np.zeros(self.num_envs, dtype=np.float64)
+        self.terminations = np.zeros(self.num_envs, dtype=np.bool_)
+        self.truncations = np.zeros(self.num_envs, dtype=np.bool_)
+
+    def detach_display(self, index):
+        # games exported before Game(offscreen=True) existed create or resize the display
+        # themselves; they draw onto a private surface of the same size instead, reused
+        # across episodes as long as the size does not change
+        if getattr(self.envs[index].game, "offscreen", False):
+            return
+        state_manager = self.envs[index].game.state_manager
+        size = state_manager.screen.get_size()
+        if self.surfaces[index] is None or self.surfaces[index].get_size() != size:
+            self.surfaces[index] = pygame.Surface(size)
+        state_manager.screen = self.surfaces[index]
+
+    def reset_at(self, index):
+        env = self.envs[index]
+        env.new_game()
+        self.detach_display(index)
+        return env.get_state(self.observations[index]), {}
+
+    def reset(self, *, seed=None, options=None):
+        if seed is not None:
+            # the generated games draw from the global generators
+            random.seed(seed)
+            np.random.seed(seed)
+        for index in range(self.num_envs):
+            self.reset_at(index)
+        return self.observations.copy(), {}
+
+    def step(self, actions):
+        infos = {}
+        for index, (env, action) in enumerate(zip(self.envs, actions)):
+            # observations are written straight into the batched array
+            observation, reward, terminated, truncated, info = env.step_game(
+                action, self.observations[index]
+            )
+            infos = self.add_info(infos, info, index)
+            if self.autoreset and (terminated or truncated):
+                infos = self.add_info(
+                    infos, {"final_observation": observation.copy(), "final_info": info}, index
+                )
+                self.reset_at(index)
+            self.rewards[index] = reward
+            self.terminations[index] = terminated
+            self.truncations[index] = truncated
+
+        return (
+            self.observations.copy(),
+            self.rewards.copy(),
+            self.terminations.copy(),
+            self.truncations.copy(),
+            infos,
+        )
+
+    def add_info(self, infos, info, index):
+        # gymnasium's vector info layout: one array per key plus a "_key" mask
+        for key, value in info.items():
+            if key not in infos:
+                dtype = type(value) if isinstance(value, (bool, int, float)) else object
+                infos[key] = np.zeros(self.num_envs, dtype=dtype)
+                infos[f"_{key}"] = np.zeros(self.num_envs, dtype=np.bool_)
+            infos[key][index] = value
+            infos[f"_{key}"][index] = True
+        return infos
+
+    def close_extras(self, **kwargs):
+        pygame.quit()
+
+    def close(self, **kwargs):
+        if not self.closed:
+            self.close_extras(**kwargs)
+            self.closed = True
+
+
+def to_rllib_vector_env(vector_env):
+    """
+    Adapts a PygameVectorEnv to RLlib's VectorEnv interface. RLlib resets finished
+    sub-environments itself, so the wrapped env must not autoreset.
+    """
+    from ray.rllib.env.vector_env import VectorEnv as RLlibVectorEnv
+
+    vector_env.autoreset = False
+
+    class RLlibPygameVectorEnv(RLlibVectorEnv):
+        def __init__(self):
+            super().__init__(
+                observation_space=vector_env.single_observation_space,
+                action_space=vector_env.single_action_space,
+                num_envs=vector_env.num_envs,
+            )
+
+        def vector_reset(self, *, seeds=None, options=None):
+            observations, _ = vector_env.reset()
+            return list(observations), [{} for _ in range(vector_env.num_envs)]
+
+        def reset_at(self, index=None, *, seed=None, options=None):
+            # reset_at returns a view into the batched observations
+            observation, info = vector_env.reset_at(index or 0)
+            return observation.copy(), info
+
+        def vector_step(self, actions):
+            observations, rewards, terminations, truncations, infos = vector_env.step(actions)
+            has_exception = infos.get("has_exception", np.zeros(vector_env.num_envs))
+            return (
+                list(observations),
+                list(rewards),
+                list(terminations),
+                list(truncations),
+                [{"has_exception": bool(flag)} for flag in has_exception],
+            )
+
+        def get_sub_environments(self):
+            return vector_env.envs
+
+    return RLlibPygameVectorEnv()